@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from .models import Comment, Group, Post
+from . import search
+from .models import Comment, Group, Post, Task
 
 
 @admin.register(Post)
@@ -15,6 +16,9 @@ class PostAdmin(admin.ModelAdmin):
     readonly_fields = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        return search.filter_indexed(queryset, search_term, 'post'), False
+
 
 @admin.register(Group)
 class GroupAdmin(admin.ModelAdmin):
@@ -30,8 +34,19 @@ class CommentAdmin(admin.ModelAdmin):
     list_display = ('pk', 'text', 'created', 'post', 'author')
     list_display_links = ('pk', 'text',)
     list_editable = ('post',)
-    search_fields = ('title',)
+    search_fields = ('text',)
     list_filter = ('created',)
     date_hierarchy = 'created'
     fields = ('text', 'created', 'post', 'author',)
     readonly_fields = ('created',)
+
+    def get_search_results(self, request, queryset, search_term):
+        return search.filter_indexed(queryset, search_term, 'comment'), False
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'name', 'payload', 'run_at', 'attempts', 'failed')
+    list_display_links = ('pk', 'name',)
+    list_filter = ('failed', 'name')
+    readonly_fields = ('name', 'payload', 'attempts', 'locked_by', 'error')
@@ -0,0 +1,189 @@
+"""ASGI-приложение поверх WSGI-обработчика Django.
+
+Тело запроса принимается, а ответ отдаётся в цикле событий, поэтому
+медленные клиенты не занимают потоки: в ограниченном пуле из
+ASGI_THREADS потоков выполняется только сам Django. Тело длиннее
+max_body_size() отклоняется ответом 413 по заголовку Content-Length
+или как только столько принято, не дочитывая его.
+"""
+
+import asyncio
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+
+
+class BodyTooLarge(Exception):
+    """Тело запроса длиннее max_body_size()."""
+
+
+def max_body_size():
+    """Наибольшее тело запроса: файл изображения и остальные поля
+    формы."""
+
+    return settings.IMAGE_UPLOAD_MAX_BYTES + (
+        settings.DATA_UPLOAD_MAX_MEMORY_SIZE or 0)
+
+
+class ASGIHandler:
+    """Приложение ASGI 3, которое выполняет ``application`` (WSGI)
+    в пуле ``executor``."""
+
+    def __init__(self, application=None, executor=None):
+        self.application = application or WSGIHandler()
+        self.executor = executor or ThreadPoolExecutor(
+            max_workers=settings.ASGI_THREADS, thread_name_prefix='asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            await self.http(scope, receive, send)
+        elif scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        else:
+            raise ValueError(
+                f'Соединения типа {scope["type"]} не поддерживаются.')
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def http(self, scope, receive, send):
+        try:
+            received = await self.read_body(scope, receive)
+        except BodyTooLarge:
+            await send({'type': 'http.response.start', 'status': 413,
+                        'headers': [(b'content-type',
+                                     b'text/plain; charset=utf-8')]})
+            await send({'type': 'http.response.body',
+                        'body': 'Тело запроса слишком большое.'.encode()})
+            return
+        if received is None:
+            return
+        body, size = received
+        loop = asyncio.get_event_loop()
+        try:
+            status, headers, chunks, response = await loop.run_in_executor(
+                self.executor, self.run, self.environ(scope, body, size))
+        finally:
+            body.close()
+
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': headers})
+        if response is None:
+            await send({'type': 'http.response.body',
+                        'body': b''.join(chunks)})
+            return
+        # Потоковый ответ (например, FileResponse) читается в пуле
+        # по частям, а отправляется в цикле событий.
+        try:
+            while True:
+                chunk = await loop.run_in_executor(
+                    self.executor, next, chunks, None)
+                if chunk is None:
+                    break
+                await send({'type': 'http.response.body', 'body': chunk,
+                            'more_body': True})
+            await send({'type': 'http.response.body'})
+        finally:
+            await loop.run_in_executor(self.executor, response.close)
+
+    @staticmethod
+    async def read_body(scope, receive):
+        """Принимает тело запроса целиком; большие тела, как и загрузки
+        в Django, сбрасываются во временный файл. Возвращает ``None``,
+        если клиент отключился, и выбрасывает BodyTooLarge, если тело
+        длиннее max_body_size()."""
+
+        limit = max_body_size()
+        for name, value in scope.get('headers', []):
+            if name.lower() == b'content-length' and (
+                    value.isdigit() and int(value) > limit):
+                raise BodyTooLarge
+        body = tempfile.SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE, mode='w+b')
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                return None
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > limit:
+                body.close()
+                raise BodyTooLarge
+            body.write(chunk)
+            if not message.get('more_body', False):
+                break
+        body.seek(0)
+        return body, size
+
+    @staticmethod
+    def environ(scope, body, size):
+        root_path = scope.get('root_path', '')
+        path = scope['path']
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': root_path.encode().decode('latin-1'),
+            'PATH_INFO': path.encode().decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'REMOTE_ADDR': client[0],
+            'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                name = f'HTTP_{name}'
+            if name in environ:
+                separator = '; ' if name == 'HTTP_COOKIE' else ','
+                value = f'{environ[name]}{separator}{value}'
+            environ[name] = value
+        # Тело с Transfer-Encoding: chunked приходит без длины.
+        environ.setdefault('CONTENT_LENGTH', str(size))
+        return environ
+
+    def run(self, environ):
+        """Выполняет WSGI-приложение; обычный ответ читается сразу,
+        потоковый возвращается вместе с итератором по частям."""
+
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [
+                (name.lower().encode('latin-1'), value.encode('latin-1'))
+                for name, value in headers]
+
+        response = self.application(environ, start_response)
+        if getattr(response, 'streaming', False):
+            return (started['status'], started['headers'], iter(response),
+                    response)
+        try:
+            chunks = list(response)
+        finally:
+            if hasattr(response, 'close'):
+                response.close()
+        return started['status'], started['headers'], chunks, None
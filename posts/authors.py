@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from . import caching
+from .models import Follow, UserStats
+
+STATS = ('posts_count', 'followers_count', 'following_count')
+
+
+def _key(user_id):
+    return f'author_stats:{user_id}'
+
+
+def stats(user_id):
+    """Публичные счётчики автора из кэша; сбрасываются сигналами
+    при изменении записей и подписок."""
+
+    key = _key(user_id)
+    found = cache.get(key)
+    if found is None:
+        found = UserStats.objects.filter(user_id=user_id).values(
+            *STATS).first() or dict.fromkeys(STATS, 0)
+        cache.set(key, found, settings.AUTHOR_CARD_CACHE_TIMEOUT)
+    return found
+
+
+def invalidate(*user_ids):
+    cache.delete_many([_key(user_id) for user_id in user_ids])
+    caching.bump(*(f'author_card:{user_id}' for user_id in user_ids))
+
+
+def card(request, author):
+    """Карточка автора для боковой панели: сам пользователь, его
+    счётчики и подписан ли на него зритель."""
+
+    viewer = request.user
+    subscribed = viewer.is_authenticated and viewer.pk != author.pk and (
+        Follow.objects.filter(user=viewer, author=author).exists())
+    return {'user': author, 'stats': stats(author.pk),
+            'subscribed': subscribed}
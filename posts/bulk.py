@@ -0,0 +1,60 @@
+import time
+from contextlib import contextmanager
+from itertools import islice
+
+from .models import Comment, Post
+
+
+def batches(objects, batch_size):
+    objects = iter(objects)
+    return iter(lambda: list(islice(objects, batch_size)), [])
+
+
+@contextmanager
+def historical_dates():
+    """Отключает auto_now/auto_now_add у дат записей и комментариев,
+    чтобы массовая вставка сохранила переданные даты."""
+
+    fields = [Post._meta.get_field('pub_date'),
+              Post._meta.get_field('updated'),
+              Comment._meta.get_field('created')]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Progress:
+    """Печатает число обработанных строк и скорость не чаще, чем раз
+    в ``interval`` секунд."""
+
+    def __init__(self, stream, interval=5, start=0):
+        self.stream = stream
+        self.interval = interval
+        self.rows = start
+        self.started = self.reported = time.monotonic()
+        self.start = start
+
+    def step(self, count=1):
+        self.update(self.rows + count)
+
+    def update(self, rows):
+        self.rows = rows
+        now = time.monotonic()
+        if now - self.reported >= self.interval:
+            self.reported = now
+            self.stream.write(f'{self.rows} строк, {self.rate():.0f} строк/с')
+
+    def rate(self):
+        elapsed = time.monotonic() - self.started
+        return (self.rows - self.start) / elapsed if elapsed else 0
+
+    def done(self, title):
+        self.stream.write(
+            f'{title} строк: {self.rows - self.start} за '
+            f'{time.monotonic() - self.started:.1f} с '
+            f'({self.rate():.0f} строк/с)')
@@ -0,0 +1,187 @@
+"""Двухуровневый кэш: небольшой LRU в памяти процесса перед общим
+для всех процессов бэкендом."""
+
+import time
+from collections import Counter, OrderedDict
+from threading import Lock
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# Django создаёт бэкенд кэша в каждом потоке, поэтому локальный уровень
+# и счётчики хранятся на уровне модуля по имени (LOCATION), как
+# в LocMemCache.
+_entries = {}
+_stats = {}
+_locks = {}
+
+KINDS = ('local_hits', 'shared_hits', 'misses')
+
+
+def key_prefix(key):
+    """Группа ключа для счётчиков: имя фрагмента шаблона или часть
+    ключа до первого двоеточия."""
+
+    if key.startswith('template.cache.'):
+        return key.rsplit('.', 1)[0]
+    return key.split(':', 1)[0]
+
+
+class TieredCache(BaseCache):
+    """Читает сначала из LRU процесса, затем из кэша ``SHARED``.
+
+    В локальный уровень попадают только ключи с ``LOCAL_KEY_PREFIXES``:
+    в такие ключи входят версии (генерации областей, время изменения
+    записи), поэтому значение по ключу не меняется, а устаревшие
+    записи просто перестают запрашиваться и вытесняются. Остальные
+    ключи, например сами генерации, всегда читаются из общего кэша,
+    так что сброс в одном процессе сразу виден в остальных.
+    """
+
+    def __init__(self, name, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared_alias = options.get('SHARED', 'shared')
+        self._local_max_entries = options.get('LOCAL_MAX_ENTRIES', 1000)
+        self._local_timeout = options.get('LOCAL_TIMEOUT', 300)
+        self._local_prefixes = tuple(options.get('LOCAL_KEY_PREFIXES', ()))
+        self._entries = _entries.setdefault(name, OrderedDict())
+        self._stats = _stats.setdefault(name, {})
+        self._lock = _locks.setdefault(name, Lock())
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    def stats(self):
+        """Попадания в локальный и общий уровни и промахи по группам
+        ключей с момента запуска процесса."""
+
+        with self._lock:
+            return {prefix: dict(counter)
+                    for prefix, counter in sorted(self._stats.items())}
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats.clear()
+
+    def _count(self, key, kind):
+        with self._lock:
+            counter = self._stats.setdefault(
+                key_prefix(key), Counter(dict.fromkeys(KINDS, 0)))
+            counter[kind] += 1
+
+    def _is_local(self, key):
+        return key.startswith(self._local_prefixes)
+
+    def _local_get(self, key, version):
+        local_key = self.make_key(key, version)
+        with self._lock:
+            entry = self._entries.get(local_key)
+            if entry is None:
+                return False, None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[local_key]
+                return False, None
+            self._entries.move_to_end(local_key)
+            return True, value
+
+    def _local_set(self, key, value, timeout, version):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is not None and timeout <= 0:
+            self._local_delete(key, version)
+            return
+        lifetime = (self._local_timeout if timeout is None
+                    else min(timeout, self._local_timeout))
+        local_key = self.make_key(key, version)
+        with self._lock:
+            self._entries[local_key] = (time.monotonic() + lifetime, value)
+            self._entries.move_to_end(local_key)
+            while len(self._entries) > self._local_max_entries:
+                self._entries.popitem(last=False)
+
+    def _local_delete(self, key, version):
+        with self._lock:
+            self._entries.pop(self.make_key(key, version), None)
+
+    def get(self, key, default=None, version=None):
+        if self._is_local(key):
+            found, value = self._local_get(key, version)
+            if found:
+                self._count(key, 'local_hits')
+                return value
+        value = self.shared.get(key, self, version=version)
+        if value is self:
+            self._count(key, 'misses')
+            return default
+        self._count(key, 'shared_hits')
+        if self._is_local(key):
+            self._local_set(key, value, DEFAULT_TIMEOUT, version)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        remote = []
+        for key in keys:
+            hit, value = (self._local_get(key, version)
+                          if self._is_local(key) else (False, None))
+            if hit:
+                self._count(key, 'local_hits')
+                found[key] = value
+            else:
+                remote.append(key)
+        if remote:
+            shared = self.shared.get_many(remote, version=version)
+            for key in remote:
+                if key in shared:
+                    self._count(key, 'shared_hits')
+                    if self._is_local(key):
+                        self._local_set(key, shared[key], DEFAULT_TIMEOUT,
+                                        version)
+                else:
+                    self._count(key, 'misses')
+            found.update(shared)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        if self._is_local(key):
+            self._local_set(key, value, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version=version)
+        for key, value in data.items():
+            if self._is_local(key) and key not in failed:
+                self._local_set(key, value, timeout, version)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.add(key, value, timeout, version=version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self._local_delete(key, version)
+        self.shared.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self._local_delete(key, version)
+        self.shared.delete_many(keys, version=version)
+
+    def has_key(self, key, version=None):
+        if self._is_local(key) and self._local_get(key, version)[0]:
+            return True
+        return self.shared.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self._local_delete(key, version)
+        return self.shared.incr(key, delta, version=version)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        self.shared.clear()
@@ -0,0 +1,153 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from . import routers
+
+
+def _generation_key(scope):
+    return f'generation:{scope}'
+
+
+def _new_generation():
+    # Генерация из текущего времени, а не с единицы: если ключ вытеснен
+    # из кэша, старые фрагменты не станут снова актуальными.
+    return time.time_ns()
+
+
+def generations(*scopes):
+    """Текущие версии областей кэша. Версия — время последнего
+    изменения области в наносекундах."""
+
+    keys = [_generation_key(scope) for scope in scopes]
+    values = cache.get_many(keys)
+    for key in keys:
+        if key not in values:
+            value = _new_generation()
+            cache.add(key, value, None)
+            values[key] = cache.get(key, value)
+    return [values[key] for key in keys]
+
+
+def generation(*scopes):
+    """Возвращает текущие версии областей кэша одной строкой."""
+
+    return '.'.join(str(value) for value in generations(*scopes))
+
+
+def bump(*scopes):
+    """Делает недействительными все фрагменты, зависящие от областей."""
+
+    keys = [_generation_key(scope) for scope in scopes]
+    current = cache.get_many(keys)
+    now = _new_generation()
+    # Новая версия больше прежней, даже если часы дали то же время.
+    cache.set_many({key: max(now, current.get(key, 0) + 1) for key in keys},
+                   None)
+
+
+def post_scopes(author_id, *group_ids):
+    scopes = ['posts', f'author:{author_id}']
+    scopes.extend(f'group:{group_id}' for group_id in set(group_ids)
+                  if group_id is not None)
+    return scopes
+
+
+def viewer_key(user, posts):
+    if not user.is_authenticated:
+        return 'anonymous'
+    if any(post.author_id == user.pk for post in posts):
+        return f'author:{user.pk}'
+    return 'authenticated'
+
+
+def page_key(page):
+    """Номер или курсор страницы и отпечаток её записей. Страница,
+    прочитанная с отстающей реплики, не совпадёт по отпечатку со свежей
+    и не подменит её в кэше."""
+
+    rows = ','.join(f'{post.pk}:{post.updated.timestamp()}:'
+                    f'{post.comments_count}' for post in page.object_list)
+    digest = hashlib.md5(rows.encode()).hexdigest()
+    return f'{page.cursor or page.number}:{digest}'
+
+
+def feed_cache(request, page, *scopes):
+    """Параметры {% cache %} для фрагмента ленты: страница, версии
+    областей и то, что зависит от зрителя."""
+
+    return {
+        'timeout': settings.FEED_CACHE_TIMEOUT,
+        'version': generation(*scopes),
+        'page': page_key(page),
+        'viewer': viewer_key(request.user, page.object_list),
+    }
+
+
+def _plain(response):
+    """Копия ответа без шаблона и контекста, пригодная для кэша."""
+
+    plain = HttpResponse(response.content, status=response.status_code)
+    for header, value in response.items():
+        plain[header] = value
+    return plain
+
+
+def anonymous_page(scopes):
+    """Кэширует страницу целиком для анонимных посетителей.
+
+    ``scopes(**kwargs)`` возвращает области кэша, от которых зависит
+    страница, или None, если страницы нет. Ключ кэша и ETag строятся
+    из полного пути (с курсором) и версий областей, Last-Modified — из
+    времени последнего изменения областей, так что повторный запрос
+    с If-None-Match или If-Modified-Since получает 304 без отрисовки.
+
+    Реплика может отставать от версий областей, поэтому промах кэша
+    отрисовывается по основной базе: только такую страницу можно
+    сохранить под текущими версиями. Чтение с реплики остаётся для
+    посетителей, вошедших на сайт.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if (request.method not in ('GET', 'HEAD')
+                    or request.user.is_authenticated):
+                return view(request, *args, **kwargs)
+            page_scopes = scopes(**kwargs)
+            if page_scopes is None:
+                return view(request, *args, **kwargs)
+
+            versions = generations(*page_scopes)
+            path = request.get_full_path()
+            digest = hashlib.md5(
+                f'{path}:{".".join(map(str, versions))}'.encode()).hexdigest()
+            etag = quote_etag(digest)
+            last_modified = max(versions) // 10 ** 9
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified)
+            if response is None:
+                key = f'page:{digest}'
+                response = cache.get(key)
+                if response is None:
+                    routers.use_primary()
+                    response = view(request, *args, **kwargs)
+                    if callable(getattr(response, 'render', None)):
+                        response.render()
+                    if (response.status_code == 200
+                            and not response.cookies):
+                        cache.set(key, _plain(response),
+                                  settings.PAGE_CACHE_TIMEOUT)
+            if response.status_code in (200, 304):
+                response['ETag'] = etag
+                response['Last-Modified'] = http_date(last_modified)
+            patch_vary_headers(response, ('Cookie',))
+            return response
+        return wrapper
+    return decorator
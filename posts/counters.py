@@ -0,0 +1,135 @@
+from collections import Counter
+
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .bulk import batches
+from .models import Comment, Follow, Post, StoredImage, User, UserStats
+
+
+def _shift(field, delta):
+    return Greatest(F(field) + delta, 0)
+
+
+def change_comments_count(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comments_count=_shift('comments_count', delta))
+
+
+def change_user_stats(user_id, **deltas):
+    change_users_stats([user_id], **deltas)
+
+
+def change_users_stats(user_ids, **deltas):
+    UserStats.objects.filter(user_id__in=user_ids).update(
+        **{field: _shift(field, delta) for field, delta in deltas.items()})
+
+
+def change_image_references(name, delta):
+    if not name:
+        return
+    if delta > 0:
+        StoredImage.objects.bulk_create([StoredImage(name=name)],
+                                        ignore_conflicts=True)
+    StoredImage.objects.filter(name=name).update(
+        references=_shift('references', delta))
+
+
+def _count(queryset, field):
+    subquery = queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+        field).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(subquery, output_field=IntegerField()), 0)
+
+
+def _pk_batches(model, batch_size):
+    last = model.objects.order_by('-pk').values_list('pk', flat=True).first()
+    for start in range(0, (last or 0) + 1, batch_size):
+        yield model.objects.filter(pk__gte=start, pk__lt=start + batch_size)
+
+
+def _batches(model, batch_size, pks=None):
+    """Пачки всей таблицы или, если ``pks`` задан, только этих строк."""
+
+    if pks is None:
+        return _pk_batches(model, batch_size)
+    return (model.objects.filter(pk__in=batch)
+            for batch in batches(pks, batch_size))
+
+
+def recount_comments(batch_size=1000, post_ids=None):
+    """Пересчитывает Post.comments_count всех записей или только
+    ``post_ids``, возвращает число исправленных записей."""
+
+    fixed = 0
+    actual = _count(Comment.objects, 'post')
+    for posts in _batches(Post, batch_size, post_ids):
+        fixed += posts.annotate(actual=actual).exclude(
+            comments_count=F('actual')).update(comments_count=actual)
+    return fixed
+
+
+def recount_user_stats(batch_size=1000, user_ids=None):
+    """Создаёт недостающие UserStats и пересчитывает счётчики всех
+    пользователей или только ``user_ids``, возвращает число
+    исправленных записей."""
+
+    missing = User.objects.filter(stats__isnull=True)
+    if user_ids is not None:
+        missing = missing.filter(pk__in=user_ids)
+    missing = missing.values_list('pk', flat=True)
+    while True:
+        created = list(missing[:batch_size])
+        if not created:
+            break
+        UserStats.objects.bulk_create(
+            (UserStats(user_id=user_id) for user_id in created),
+            ignore_conflicts=True)
+
+    fixed = 0
+    actual = {
+        'posts_count': _count(Post.objects, 'author'),
+        'followers_count': _count(Follow.objects, 'author'),
+        'following_count': _count(Follow.objects, 'user'),
+    }
+    drifted = Q()
+    for field in actual:
+        drifted |= ~Q(**{field: F(f'actual_{field}')})
+    for stats in _batches(UserStats, batch_size, user_ids):
+        fixed += stats.annotate(**{
+            f'actual_{field}': value for field, value in actual.items()
+        }).filter(drifted).update(**actual)
+    return fixed
+
+
+def recount_image_references(batch_size=1000):
+    """Пересчитывает StoredImage.references по записям, просматривая их
+    пачками, возвращает число исправленных изображений."""
+
+    actual = Counter()
+    for posts in _pk_batches(Post, batch_size):
+        actual.update(posts.exclude(image='').exclude(
+            image__isnull=True).values_list('image', flat=True))
+
+    fixed = 0
+    stored = StoredImage.objects.order_by('name').values_list(
+        'name', 'references')
+    last = ''
+    while True:
+        batch = list(stored.filter(name__gt=last)[:batch_size])
+        if not batch:
+            break
+        last = batch[-1][0]
+        by_count = {}
+        for name, references in batch:
+            count = actual.pop(name, 0)
+            if count != references:
+                by_count.setdefault(count, []).append(name)
+        for count, names in by_count.items():
+            fixed += StoredImage.objects.filter(name__in=names).update(
+                references=count)
+    for names in batches(actual, batch_size):
+        StoredImage.objects.bulk_create(
+            (StoredImage(name=name, references=actual[name])
+             for name in names), ignore_conflicts=True)
+        fixed += len(names)
+    return fixed
@@ -0,0 +1,160 @@
+"""Отдача статики и медиафайлов самим приложением.
+
+Файлы с хэшем в имени кэшируются браузером навсегда, статика отдаётся
+сжатой заранее копией, если клиент её принимает, медиафайлы — также
+по диапазонам (Range). Файл передаётся через FileResponse, поэтому
+WSGI-сервер с wsgi.file_wrapper отправляет его без копирования
+(sendfile).
+"""
+
+import mimetypes
+import os
+import posixpath
+import re
+import stat
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+# Хэш ManifestStaticFilesStorage или SHA-256 изображения записи
+# (в том числе в имени его вариантов).
+HASHED = re.compile(r'\.[0-9a-f]{12}\.[^/]+$|(^|/)[0-9a-f]{64}[._][^/]+$')
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeFile:
+    """Часть открытого файла длиной ``length`` с позиции ``start``."""
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.file.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def _accepts(request, coding):
+    accepted = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    return any(part.split(';')[0].strip() == coding
+               for part in accepted.split(','))
+
+
+def _byte_range(request, size, etag, modified):
+    """Запрошенный диапазон ``(start, end)`` включительно, ``None``,
+    если отдаётся весь файл, или ``False`` для недопустимого."""
+
+    match = RANGE.match(request.META.get('HTTP_RANGE', '').strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range != etag and (
+            parse_http_date_safe(if_range) != int(modified)):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        start, end = max(size - int(last), 0), size - 1
+    if start > end:
+        return False
+    return start, end
+
+
+def serve(request, root, path, max_age):
+    """Ответ с файлом ``path`` из каталога ``root`` или ``None``, если
+    такого файла нет."""
+
+    try:
+        full_path = safe_join(root, posixpath.normpath(path).lstrip('/'))
+        file_stat = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError, ValueError):
+        return None
+    if not stat.S_ISREG(file_stat.st_mode):
+        return None
+
+    content_type, _ = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+    headers = {
+        'Cache-Control': (
+            f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+            if HASHED.search(path) else f'public, max-age={max_age}'),
+        'Accept-Ranges': 'bytes',
+    }
+    ranged = 'HTTP_RANGE' in request.META
+    coding = None
+    for candidate, suffix in ENCODINGS:
+        try:
+            variant_stat = os.stat(full_path + suffix)
+        except OSError:
+            continue
+        headers['Vary'] = 'Accept-Encoding'
+        # Диапазоны считаются по несжатому файлу.
+        if not coding and not ranged and _accepts(request, candidate):
+            coding, full_path, file_stat = (candidate, full_path + suffix,
+                                            variant_stat)
+
+    size = file_stat.st_size
+    etag = f'"{file_stat.st_mtime_ns:x}-{size:x}'
+    etag += f'-{coding}"' if coding else '"'
+    headers['ETag'] = etag
+    headers['Last-Modified'] = http_date(file_stat.st_mtime)
+    if coding:
+        headers['Content-Encoding'] = coding
+
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(file_stat.st_mtime))
+    if response is None:
+        byte_range = _byte_range(request, size, etag, file_stat.st_mtime)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        start, end = byte_range or (0, size - 1)
+        length = max(end - start + 1, 0)
+        if request.method == 'HEAD':
+            response = HttpResponse(content_type=content_type)
+        elif byte_range:
+            response = FileResponse(
+                RangeFile(open(full_path, 'rb'), start, length),
+                content_type=content_type)
+        else:
+            response = FileResponse(open(full_path, 'rb'),
+                                    content_type=content_type)
+        if byte_range:
+            response.status_code = 206
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = length
+    for name, value in headers.items():
+        response[name] = value
+    return response
+
+
+def serve_request(request):
+    """Отдаёт файл из STATIC_ROOT или MEDIA_ROOT, если запрос к ним."""
+
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    for url, root, max_age in (
+            (settings.STATIC_URL, settings.STATIC_ROOT,
+             settings.STATIC_MAX_AGE),
+            (settings.MEDIA_URL, settings.MEDIA_ROOT,
+             settings.MEDIA_MAX_AGE)):
+        if root and url and request.path_info.startswith(url):
+            return serve(request, root, request.path_info[len(url):],
+                         max_age)
+    return None
@@ -0,0 +1,151 @@
+"""Подписки и отписки одним запросом к базе.
+
+Подписка — вставка с пропуском конфликта по ограничению
+posts_follow_user_author_constraint, отписка — удаление по условию;
+оба запроса возвращают затронутых авторов, и счётчики обновляются
+только для них в той же транзакции.
+"""
+
+from django.db import connection, transaction
+
+from . import authors, caching, counters, tasks, timelines
+from .models import Follow, User
+
+
+def _returning_supported():
+    if connection.vendor == 'postgresql':
+        return True
+    return (connection.vendor == 'sqlite'
+            and connection.Database.sqlite_version_info >= (3, 35))
+
+
+def _names():
+    qn = connection.ops.quote_name
+    return {
+        'follow': qn(Follow._meta.db_table),
+        'user': qn(User._meta.db_table),
+        'user_id': qn(Follow._meta.get_field('user').column),
+        'author_id': qn(Follow._meta.get_field('author').column),
+        'id': qn(User._meta.pk.column),
+        'username': qn('username'),
+    }
+
+
+def _in(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def _changed(sql, params):
+    """Выполняет запрос с RETURNING и возвращает затронутых авторов."""
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'{sql} RETURNING {_names()["author_id"]}', params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _changed_one_by_one(sql, user_id, usernames):
+    """Для баз без RETURNING: запрос по каждому автору, число
+    затронутых строк показывает, изменилась ли подписка."""
+
+    author_ids = User.objects.filter(username__in=usernames).exclude(
+        pk=user_id).values_list('pk', flat=True)
+    changed = []
+    with connection.cursor() as cursor:
+        for author_id in author_ids:
+            cursor.execute(sql, [user_id, author_id])
+            if cursor.rowcount:
+                changed.append(author_id)
+    return changed
+
+
+def _insert(user_id, usernames):
+    ops = connection.ops
+    names = _names()
+    if not _returning_supported():
+        return _changed_one_by_one(
+            '{insert} {follow} ({user_id}, {author_id}) VALUES (%s, %s) '
+            '{suffix}'.format(
+                insert=ops.insert_statement(ignore_conflicts=True),
+                suffix=ops.ignore_conflicts_suffix_sql(ignore_conflicts=True),
+                **names),
+            user_id, usernames)
+    return _changed(
+        '{insert} {follow} ({user_id}, {author_id}) '
+        'SELECT %s, {id} FROM {user} '
+        'WHERE {username} IN ({values}) AND {id} <> %s {suffix}'.format(
+            insert=ops.insert_statement(ignore_conflicts=True),
+            suffix=ops.ignore_conflicts_suffix_sql(ignore_conflicts=True),
+            values=_in(usernames), **names),
+        [user_id, *usernames, user_id])
+
+
+def _delete(user_id, usernames):
+    names = _names()
+    if not _returning_supported():
+        return _changed_one_by_one(
+            'DELETE FROM {follow} WHERE {user_id} = %s '
+            'AND {author_id} = %s'.format(**names),
+            user_id, usernames)
+    return _changed(
+        'DELETE FROM {follow} WHERE {user_id} = %s AND {author_id} IN '
+        '(SELECT {id} FROM {user} WHERE {username} IN ({values}))'.format(
+            values=_in(usernames), **names),
+        [user_id, *usernames])
+
+
+def apply(user_id, author_ids, delta):
+    """Обновляет счётчики после подписки (``delta=1``) или отписки
+    (``delta=-1``) на ``author_ids``. Записи отписанных авторов сразу
+    убираются из ленты подписок; записи новых авторов добавляет в неё
+    фоновая задача, она же отправляет авторам письма."""
+
+    if not author_ids:
+        return
+    counters.change_users_stats(author_ids, followers_count=delta)
+    counters.change_user_stats(user_id,
+                               following_count=delta * len(author_ids))
+    if delta < 0:
+        # Авторы, у которых подписчиков снова не больше порога: записи,
+        # вышедшие, пока их было больше, дописываются в ленты в фоне.
+        for author_id in timelines.returning(author_ids):
+            tasks.materialize.enqueue(author_id)
+    for author_id in author_ids:
+        if delta > 0:
+            tasks.backfill.enqueue([user_id, author_id])
+            tasks.mail_follows.enqueue([user_id, author_id])
+        else:
+            timelines.prune(user_id, author_id)
+
+
+def invalidate(user_id, author_ids):
+    if author_ids:
+        authors.invalidate(user_id, *author_ids)
+        caching.bump(f'follow:{user_id}')
+
+
+def follow(user, usernames):
+    """Подписывает пользователя на авторов; повторная подписка и
+    подписка на себя ничего не меняют. Возвращает новых авторов."""
+
+    usernames = list(usernames)
+    if not usernames:
+        return []
+    with transaction.atomic():
+        author_ids = _insert(user.pk, usernames)
+        apply(user.pk, author_ids, 1)
+    invalidate(user.pk, author_ids)
+    return author_ids
+
+
+def unfollow(user, usernames):
+    """Отписывает пользователя от авторов, возвращает тех, на кого он
+    был подписан."""
+
+    usernames = list(usernames)
+    if not usernames:
+        return []
+    with transaction.atomic():
+        author_ids = _delete(user.pk, usernames)
+        apply(user.pk, author_ids, -1)
+    invalidate(user.pk, author_ids)
+    return author_ids
@@ -1,5 +1,7 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
 
+from . import images
 from .models import Comment, Post
 
 
@@ -7,6 +9,28 @@ class PostForm(forms.ModelForm):
     class Meta:
         model = Post
         fields = ('text', 'group', 'image')
+        # Изображение проверяет images.prepare_upload по заголовку;
+        # forms.ImageField перечитал бы файл целиком.
+        field_classes = {'image': forms.FileField}
+
+    def __init__(self, *args, upload_error=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.upload_error = upload_error
+
+    def clean_image(self):
+        if self.upload_error:
+            raise self.upload_error
+        image = self.cleaned_data.get('image')
+        if isinstance(image, UploadedFile):
+            image = images.prepare_upload(image)
+        return image
+
+    def save(self, commit=True):
+        if 'image' in self.changed_data:
+            # Варианты старого изображения больше не подходят.
+            self.instance.image_widths = ''
+            self.instance.image_webp = False
+        return super().save(commit)
 
 
 class CommentForm(forms.ModelForm):
@@ -0,0 +1,173 @@
+import io
+import os
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image, ImageOps, features
+
+# Пропорции карточки записи: варианты обрезаются по центру до 960x339.
+ASPECT = (960, 339)
+SIZES = '(max-width: 960px) 100vw, 960px'
+
+CONTENT_TYPES = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'GIF': 'image/gif',
+    'WEBP': 'image/webp',
+}
+SAVE_OPTIONS = {
+    'JPEG': {'quality': 90, 'optimize': True, 'progressive': True},
+    'PNG': {'optimize': True},
+    'WEBP': {'quality': 90},
+}
+# Метаданные, ради которых изображение пересохраняется, и то, что
+# из image.info переносится в пересохранённый файл.
+METADATA = ('exif', 'xmp', 'XML:com.adobe.xmp', 'comment')
+KEEP_INFO = ('transparency', 'icc_profile')
+
+
+def too_many_pixels():
+    return ValidationError(
+        'Изображение слишком большое: не больше %(limit)s пикселей.',
+        code='image_too_large', params={'limit': settings.IMAGE_MAX_PIXELS})
+
+
+def _open(file):
+    file.seek(0)
+    try:
+        image = Image.open(file)
+    except (OSError, Image.DecompressionBombError):
+        raise ValidationError('Загрузите корректное изображение.',
+                              code='invalid_image')
+    width, height = image.size
+    if width * height > settings.IMAGE_MAX_PIXELS:
+        raise too_many_pixels()
+    return image
+
+
+def _has_metadata(image):
+    return any(key in image.info for key in METADATA) or bool(
+        image.getexif())
+
+
+def prepare_upload(upload):
+    """Проверяет загруженное изображение, удаляет из него EXIF
+    и уменьшает до IMAGE_MAX_SIZE по большей стороне.
+
+    Файл без метаданных, не превышающий предела, возвращается как есть.
+    """
+
+    image = _open(upload)
+    image_format = image.format
+    if image_format not in CONTENT_TYPES:
+        raise ValidationError('Неподдерживаемый формат изображения.',
+                              code='invalid_image')
+    limit = settings.IMAGE_MAX_SIZE
+    oversized = max(image.size) > limit
+    if getattr(image, 'is_animated', False):
+        # Анимацию не пересобираем: уменьшение потеряло бы кадры.
+        if oversized:
+            raise ValidationError(
+                'Анимация должна быть не больше %(limit)spx по большей '
+                'стороне.', code='image_too_large', params={'limit': limit})
+        return upload
+    if not oversized and not _has_metadata(image):
+        return upload
+
+    if image_format == 'JPEG':
+        # Декодируем JPEG сразу в уменьшенном масштабе.
+        image.draft('RGB', (limit, limit))
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((limit, limit), Image.LANCZOS)
+    image.info = {key: value for key, value in image.info.items()
+                  if key in KEEP_INFO}
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L', 'CMYK'):
+        image = image.convert('RGB')
+
+    buffer = io.BytesIO()
+    options = dict(SAVE_OPTIONS.get(image_format, {}))
+    if 'icc_profile' in image.info and image_format != 'GIF':
+        options['icc_profile'] = image.info['icc_profile']
+    image.save(buffer, format=image_format, **options)
+    return SimpleUploadedFile(upload.name, buffer.getvalue(),
+                              CONTENT_TYPES[image_format])
+
+
+def variant_name(name, width, extension):
+    root, _ = os.path.splitext(name)
+    return f'{root}_{width}w.{extension}'
+
+
+def _save(storage, name, image, image_format, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, **options)
+    # Имя варианта должно остаться предсказуемым, поэтому старый файл
+    # удаляется, а не переименовывается хранилищем.
+    if storage.exists(name):
+        storage.delete(name)
+    storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def make_variants(name, storage=default_storage):
+    """Сохраняет рядом с оригиналом JPEG и (если Pillow умеет) WebP
+    обрезки шириной IMAGE_VARIANT_WIDTHS. Возвращает созданные ширины
+    и признак наличия WebP."""
+
+    all_widths = sorted(settings.IMAGE_VARIANT_WIDTHS)
+    with storage.open(name) as file:
+        image = Image.open(file)
+        widths = [width for width in all_widths
+                  if width <= image.width] or all_widths[:1]
+        largest = (widths[-1], round(widths[-1] * ASPECT[1] / ASPECT[0]))
+        if image.format == 'JPEG':
+            image.draft('RGB', largest)
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        fitted = ImageOps.fit(image, largest, Image.LANCZOS)
+
+    webp = features.check('webp')
+    for width in reversed(widths):
+        size = (width, round(width * ASPECT[1] / ASPECT[0]))
+        variant = fitted if size == fitted.size else fitted.resize(
+            size, Image.LANCZOS)
+        _save(storage, variant_name(name, width, 'jpg'), variant, 'JPEG',
+              quality=85, optimize=True, progressive=True)
+        if webp:
+            _save(storage, variant_name(name, width, 'webp'), variant,
+                  'WEBP', quality=80, method=4)
+    return widths, webp
+
+
+def parse_widths(value):
+    return [int(width) for width in value.split(',') if width]
+
+
+def join_widths(widths):
+    return ','.join(str(width) for width in widths)
+
+
+def variants(post):
+    """Атрибуты <picture> для карточки записи или None, пока варианты
+    изображения не созданы."""
+
+    widths = parse_widths(post.image_widths) if post.image else []
+    if not widths:
+        return None
+    storage = post.image.storage
+
+    def srcset(extension):
+        return ', '.join(
+            f'{storage.url(variant_name(post.image.name, width, extension))}'
+            f' {width}w' for width in widths)
+
+    largest = widths[-1]
+    return {
+        'src': storage.url(variant_name(post.image.name, largest, 'jpg')),
+        'jpeg': srcset('jpg'),
+        'webp': srcset('webp') if post.image_webp else '',
+        'sizes': SIZES,
+        'width': largest,
+        'height': round(largest * ASPECT[1] / ASPECT[0]),
+    }
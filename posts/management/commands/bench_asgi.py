@@ -0,0 +1,229 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.http import HttpRequest
+from django.middleware.csrf import get_token
+from django.urls import reverse
+from django.utils import timezone
+
+from posts.asgi import ASGIHandler
+
+from ._bench import percentile, revision
+
+MODES = ('wsgi', 'asgi')
+
+
+class SlowInput:
+    """Тело запроса, которое клиент присылает частями с паузами."""
+
+    def __init__(self, chunks, delay):
+        self.chunks = list(chunks)
+        self.delay = delay
+        self.buffer = b''
+
+    def read(self, size=-1):
+        while self.chunks and (size < 0 or len(self.buffer) < size):
+            time.sleep(self.delay)
+            self.buffer += self.chunks.pop(0)
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def _scope(method, path, headers=()):
+    return {
+        'type': 'http', 'method': method, 'path': path, 'query_string': b'',
+        'http_version': '1.1', 'scheme': 'http',
+        'server': ('testserver', 80), 'client': ('127.0.0.1', 0),
+        'headers': [(name.encode(), value.encode())
+                    for name, value in headers],
+    }
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает пропускную способность WSGI и ASGI (yatube.asgi) '
+            'при одинаковом числе потоков, пока медленные клиенты по частям '
+            'отправляют формы, и сохраняет результат в JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads', type=int, default=settings.ASGI_THREADS,
+            help='Потоков у WSGI-сервера и в пуле ASGI.')
+        parser.add_argument('--clients', type=int, default=8,
+                            help='Клиентов, читающих главную страницу.')
+        parser.add_argument('--slow-clients', type=int, default=32,
+                            help='Клиентов, медленно отправляющих форму.')
+        parser.add_argument('--chunks', type=int, default=10,
+                            help='Частей тела у медленного клиента.')
+        parser.add_argument('--chunk-delay', type=float, default=0.2,
+                            help='Пауза перед каждой частью в секундах.')
+        parser.add_argument('--duration', type=float, default=10,
+                            help='Длительность замера каждого режима.')
+        parser.add_argument(
+            '--output', '-o', help='Файл для результата в JSON.')
+        parser.add_argument(
+            '--compare', help='JSON прошлого замера для сравнения.')
+
+    def handle(self, *args, **options):
+        self.options = options
+        request = HttpRequest()
+        token = get_token(request)
+        body = urlencode({'csrfmiddlewaretoken': token,
+                          'text': 'x' * 4096}).encode()
+        size = -(-len(body) // options['chunks'])
+        self.slow_chunks = [body[start:start + size]
+                            for start in range(0, len(body), size)]
+        # Форма новой записи: CSRF-защита читает тело до представления.
+        self.slow_scope = _scope('POST', reverse('posts:new_post'), (
+            ('content-type', 'application/x-www-form-urlencoded'),
+            ('content-length', str(len(body))),
+            ('cookie', f'{settings.CSRF_COOKIE_NAME}='
+                       f'{request.META["CSRF_COOKIE"]}'),
+        ))
+        self.fast_scope = _scope('GET', reverse('posts:index'))
+        application = WSGIHandler()
+        # Прогрев: кэш страницы и миниатюры не должны попасть в замер.
+        self.wsgi_request(application, self.fast_scope)
+
+        result = {
+            'meta': {
+                'revision': revision(),
+                'created': timezone.now().isoformat(),
+                **{key: options[key] for key in (
+                    'threads', 'clients', 'slow_clients', 'chunks',
+                    'chunk_delay', 'duration')},
+            },
+            'wsgi': self.bench_wsgi(application),
+            'asgi': asyncio.run(self.bench_asgi(application)),
+        }
+        connections.close_all()
+        self.report(result, options['compare'])
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(result, file, ensure_ascii=False, indent=2)
+
+    def wsgi_request(self, application, scope, chunks=(b'',), delay=0):
+        environ = ASGIHandler.environ(scope, SlowInput(chunks, delay),
+                                      sum(map(len, chunks)))
+        response = application(environ, lambda status, headers: None)
+        try:
+            for _ in response:
+                pass
+        finally:
+            response.close()
+
+    def bench_wsgi(self, application):
+        """Потоковый WSGI-сервер: каждый запрос, включая приём тела,
+        занимает поток из пула."""
+
+        pool = ThreadPoolExecutor(max_workers=self.options['threads'])
+        deadline = time.monotonic() + self.options['duration']
+        fast, slow = [], []
+
+        def client(scope, chunks, delay, timings):
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                pool.submit(self.wsgi_request, application, scope, chunks,
+                            delay).result()
+                timings.append((time.perf_counter() - started) * 1000)
+
+        clients = [
+            threading.Thread(target=client, args=(
+                self.slow_scope, self.slow_chunks,
+                self.options['chunk_delay'], slow))
+            for _ in range(self.options['slow_clients'])
+        ] + [
+            threading.Thread(target=client, args=(
+                self.fast_scope, (b'',), 0, fast))
+            for _ in range(self.options['clients'])
+        ]
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        pool.shutdown()
+        return self.summary(fast, slow)
+
+    async def bench_asgi(self, application):
+        handler = ASGIHandler(application, ThreadPoolExecutor(
+            max_workers=self.options['threads']))
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + self.options['duration']
+        fast, slow = [], []
+
+        async def request(scope, chunks, delay):
+            messages = list(chunks)
+
+            async def receive():
+                if delay:
+                    await asyncio.sleep(delay)
+                return {'type': 'http.request', 'body': messages.pop(0),
+                        'more_body': bool(messages)}
+
+            async def send(message):
+                pass
+
+            await handler(scope, receive, send)
+
+        async def client(scope, chunks, delay, timings):
+            while loop.time() < deadline:
+                started = time.perf_counter()
+                await request(scope, chunks, delay)
+                timings.append((time.perf_counter() - started) * 1000)
+
+        await asyncio.gather(*(
+            client(self.slow_scope, self.slow_chunks,
+                   self.options['chunk_delay'], slow)
+            for _ in range(self.options['slow_clients'])
+        ), *(
+            client(self.fast_scope, (b'',), 0, fast)
+            for _ in range(self.options['clients'])
+        ))
+        handler.executor.shutdown()
+        return self.summary(fast, slow)
+
+    def summary(self, fast, slow):
+        summary = {
+            'requests': len(fast),
+            'per_second': round(len(fast) / self.options['duration'], 1),
+            'slow_requests': len(slow),
+        }
+        if fast:
+            summary.update({
+                'p50_ms': round(percentile(fast, 50), 3),
+                'p95_ms': round(percentile(fast, 95), 3),
+                'p99_ms': round(percentile(fast, 99), 3),
+            })
+        return summary
+
+    def report(self, result, compare):
+        baseline = {}
+        if compare:
+            with open(compare) as file:
+                baseline = json.load(file)
+        self.stdout.write(f'{"":<6}{"стр/с":>9}{"p50":>9}{"p95":>9}'
+                          f'{"p99":>9}{"медл.":>7}')
+        for mode in MODES:
+            summary = result[mode]
+            line = (f'{mode:<6}{summary["per_second"]:>9.1f}'
+                    f'{summary.get("p50_ms", 0):>9.2f}'
+                    f'{summary.get("p95_ms", 0):>9.2f}'
+                    f'{summary.get("p99_ms", 0):>9.2f}'
+                    f'{summary["slow_requests"]:>7}')
+            if mode in baseline:
+                ratio = (summary['per_second']
+                         / (baseline[mode]['per_second'] or 1))
+                line += f'  x{ratio:.2f} к {baseline["meta"]["revision"]}'
+            self.stdout.write(line)
+        ratio = result['asgi']['per_second'] / (
+            result['wsgi']['per_second'] or 1)
+        self.stdout.write(f'asgi/wsgi: x{ratio:.2f}')
@@ -0,0 +1,168 @@
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections, transaction
+from django.utils import timezone
+
+from posts.bulk import batches
+from posts.models import Comment, Post
+
+from ._bench import percentile, revision
+
+
+def _database_profile():
+    profile = {
+        'vendor': connection.vendor,
+        'conn_max_age': connection.settings_dict['CONN_MAX_AGE'],
+    }
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            for name in ('journal_mode', 'synchronous', 'busy_timeout',
+                         'mmap_size'):
+                cursor.execute(f'PRAGMA {name}')
+                profile[name] = cursor.fetchone()[0]
+    else:
+        profile['server_side_cursors'] = not connection.settings_dict[
+            'DISABLE_SERVER_SIDE_CURSORS']
+    return profile
+
+
+class Worker(threading.Thread):
+    """Поток, который до ``deadline`` повторяет операцию и записывает
+    её длительность; у каждого потока своё соединение с базой."""
+
+    def __init__(self, operation, deadline):
+        super().__init__(daemon=True)
+        self.operation = operation
+        self.deadline = deadline
+        self.timings = []
+        self.errors = 0
+
+    def run(self):
+        try:
+            while time.monotonic() < self.deadline:
+                started = time.perf_counter()
+                try:
+                    self.operation()
+                except OperationalError:
+                    # Например, «database is locked» при занятой базе.
+                    self.errors += 1
+                    continue
+                self.timings.append((time.perf_counter() - started) * 1000)
+        finally:
+            connections.close_all()
+
+
+class Command(BaseCommand):
+    help = ('Замеряет пропускную способность базы при параллельном чтении '
+            'лент и записи комментариев для текущего профиля DATABASES '
+            '(DB_ENGINE, SQLITE_PRAGMAS) и сохраняет результат в JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4,
+                            help='Число читающих потоков.')
+        parser.add_argument('--writers', type=int, default=2,
+                            help='Число пишущих потоков.')
+        parser.add_argument('--duration', type=float, default=10,
+                            help='Длительность замера в секундах.')
+        parser.add_argument(
+            '--output', '-o', help='Файл для результата в JSON.')
+        parser.add_argument(
+            '--compare', help='JSON прошлого замера для сравнения.')
+
+    def handle(self, *args, **options):
+        post = Post.objects.order_by('-comments_count', '-pk').first()
+        if post is None:
+            raise CommandError('Нет данных для замера, выполните '
+                               'generate_data.')
+        profile = _database_profile()
+        written = []
+
+        def read():
+            list(Post.objects.select_related('author', 'group').order_by(
+                '-pub_date', '-id')[:10])
+            list(Comment.objects.filter(post_id=post.pk).select_related(
+                'author').order_by('-created', '-id')[:20])
+
+        def write():
+            with transaction.atomic():
+                comment = Comment.objects.create(
+                    post_id=post.pk, author_id=post.author_id,
+                    text='Комментарий для замера')
+            written.append(comment.pk)
+
+        # Соединение главного потока не должно держать блокировку
+        # во время замера.
+        connections.close_all()
+        deadline = time.monotonic() + options['duration']
+        readers = [Worker(read, deadline) for _ in range(options['readers'])]
+        writers = [Worker(write, deadline)
+                   for _ in range(options['writers'])]
+        for worker in readers + writers:
+            worker.start()
+        for worker in readers + writers:
+            worker.join()
+
+        for batch in batches(written, 500):
+            Comment.objects.filter(pk__in=batch).delete()
+
+        result = {
+            'meta': {
+                'revision': revision(),
+                'created': timezone.now().isoformat(),
+                'database': profile,
+                'engine': settings.DB_ENGINE,
+                'readers': options['readers'],
+                'writers': options['writers'],
+                'duration': options['duration'],
+            },
+            'reads': self.summary(readers, options['duration']),
+            'writes': self.summary(writers, options['duration']),
+        }
+        self.report(result, options['compare'])
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(result, file, ensure_ascii=False, indent=2)
+
+    @staticmethod
+    def summary(workers, duration):
+        timings = [timing for worker in workers for timing in worker.timings]
+        summary = {
+            'operations': len(timings),
+            'per_second': round(len(timings) / duration, 1),
+            'errors': sum(worker.errors for worker in workers),
+        }
+        if timings:
+            summary.update({
+                'p50_ms': round(percentile(timings, 50), 3),
+                'p95_ms': round(percentile(timings, 95), 3),
+                'p99_ms': round(percentile(timings, 99), 3),
+            })
+        return summary
+
+    def report(self, result, compare):
+        baseline = {}
+        if compare:
+            with open(compare) as file:
+                baseline = json.load(file)
+            database = baseline['meta']['database']
+            label = '/'.join(filter(None, (
+                baseline['meta']['engine'], database.get('journal_mode'))))
+        self.stdout.write(f'{result["meta"]["database"]}')
+        self.stdout.write(f'{"":<8}{"оп/с":>10}{"p50":>9}{"p95":>9}'
+                          f'{"p99":>9}{"ошибок":>8}')
+        for kind in ('reads', 'writes'):
+            summary = result[kind]
+            line = (f'{kind:<8}{summary["per_second"]:>10.1f}'
+                    f'{summary.get("p50_ms", 0):>9.2f}'
+                    f'{summary.get("p95_ms", 0):>9.2f}'
+                    f'{summary.get("p99_ms", 0):>9.2f}'
+                    f'{summary["errors"]:>8}')
+            if kind in baseline:
+                ratio = (summary['per_second']
+                         / (baseline[kind]['per_second'] or 1))
+                line += f'  x{ratio:.2f} к {label}'
+            self.stdout.write(line)
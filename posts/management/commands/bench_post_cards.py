@@ -0,0 +1,57 @@
+import statistics
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.template import Context, engines
+from django.test import RequestFactory
+from django.urls import resolve
+
+from posts.caching import generation
+from posts.models import Post
+from posts.templatetags.post_cards import card_key
+
+
+class Command(BaseCommand):
+    help = ('Измеряет время отрисовки страницы ленты без кэша карточек '
+            'записей и с ним.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat', type=int, default=200,
+            help='Число отрисовок страницы для каждого замера.')
+        parser.add_argument(
+            '--per-page', type=int, default=10,
+            help='Число записей на странице.')
+
+    def handle(self, *args, **options):
+        posts = list(Post.objects.select_related('author', 'group').order_by(
+            '-pub_date', '-id')[:options['per_page']])
+        if not posts:
+            raise CommandError('Нет записей для замера.')
+
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        request.resolver_match = resolve('/')
+        template = engines['django'].engine.from_string(
+            '{% load post_cards %}{% post_cards posts %}')
+        context = {'posts': posts, 'request': request, 'user': request.user}
+        keys = [card_key(post, generation('groups')) for post in posts]
+
+        def measure(before_render):
+            timings = []
+            for _ in range(options['repeat']):
+                before_render()
+                started = time.perf_counter()
+                template.render(Context(context))
+                timings.append((time.perf_counter() - started) * 1000)
+            return statistics.median(timings), statistics.mean(timings)
+
+        cold = measure(lambda: cache.delete_many(keys))
+        warm = measure(lambda: None)
+
+        self.stdout.write(f'Записей на странице: {len(posts)}')
+        for title, (median, mean) in (('Без кэша', cold), ('С кэшем', warm)):
+            self.stdout.write(
+                f'{title}: медиана {median:.2f} мс, среднее {mean:.2f} мс')
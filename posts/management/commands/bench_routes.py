@@ -0,0 +1,262 @@
+import json
+import platform
+import resource
+import statistics
+import threading
+import time
+import tracemalloc
+import urllib.request
+from urllib.parse import urlencode
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+import django
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from posts.models import Group, Post, User
+from posts.profiling import RequestProfile
+from posts.urls import urlpatterns
+
+from ._bench import percentile, revision
+
+# Маршруты, которые меняют данные: подписка и отписка выполняются
+# парой, удаление записи не замеряется.
+PAIRED = {'profile_follow': 'profile_unfollow'}
+SKIPPED = ('post_delete',)
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class ServerClient:
+    """Отправляет запросы в WSGI-сервер, запущенный в отдельном потоке
+    этого же процесса, и считает запросы к базе в потоке сервера."""
+
+    def __init__(self, username=None):
+        handler = WSGIHandler()
+        self.last_profile = None
+
+        def application(environ, start_response):
+            profile = RequestProfile()
+            with profile.capture():
+                response = handler(environ, start_response)
+            self.last_profile = profile
+            return response
+
+        self.server = make_server('127.0.0.1', 0, application,
+                                  handler_class=_QuietHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+        self.base = f'http://127.0.0.1:{self.server.server_port}'
+        self.opener = urllib.request.build_opener(_NoRedirect())
+        if username:
+            self._login(username)
+
+    def _login(self, username):
+        client = Client()
+        client.force_login(User.objects.get(username=username))
+        session = client.cookies[settings.SESSION_COOKIE_NAME].value
+        self.opener.addheaders = [
+            ('Cookie', f'{settings.SESSION_COOKIE_NAME}={session}')]
+
+    def get(self, url):
+        try:
+            with self.opener.open(self.base + url) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as error:
+            status = error.code
+        return status, self.last_profile.queries
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class TestClient:
+    def __init__(self, username=None):
+        self.client = Client()
+        if username:
+            self.client.force_login(User.objects.get(username=username))
+
+    def get(self, url):
+        profile = RequestProfile(slowest=0)
+        with profile.capture():
+            response = self.client.get(url)
+        return response.status_code, profile.queries
+
+    def close(self):
+        pass
+
+
+class Command(BaseCommand):
+    help = ('Замеряет задержку (p50/p95/p99), число запросов к базе '
+            'и память для всех маршрутов posts.urls и сохраняет '
+            'результат в JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=50,
+            help='Число замеряемых запросов на маршрут.')
+        parser.add_argument(
+            '--warmup', type=int, default=5,
+            help='Число запросов на маршрут перед замером.')
+        parser.add_argument(
+            '--server', action='store_true',
+            help='Ходить через локальный WSGI-сервер, а не тестовый '
+                 'клиент.')
+        parser.add_argument(
+            '--user',
+            help='Имя пользователя, от которого выполняются запросы; '
+                 'по умолчанию автор записей с наибольшим числом '
+                 'подписок.')
+        parser.add_argument(
+            '--route', action='append', dest='routes',
+            help='Замерять только эти маршруты (можно повторять).')
+        parser.add_argument(
+            '--trace-memory', action='store_true',
+            help='Замерять пик выделенной памяти на запрос (tracemalloc, '
+                 'заметно замедляет запросы).')
+        parser.add_argument(
+            '--output', '-o', help='Файл для результата в JSON.')
+        parser.add_argument(
+            '--compare', help='JSON прошлого замера для сравнения.')
+
+    def handle(self, *args, **options):
+        username = options['user'] or User.objects.filter(
+            posts__isnull=False).order_by(
+            '-stats__following_count', 'pk').values_list(
+            'username', flat=True).first()
+        # Запись самого пользователя, чтобы post_edit не перенаправлял.
+        post = Post.objects.filter(author__username=username).order_by(
+            '-pub_date', '-id').select_related('author').first()
+        group = Group.objects.annotate(total=Count('posts')).order_by(
+            '-total').first()
+        if post is None or group is None:
+            raise CommandError('Нет данных для замера, выполните '
+                               'generate_data.')
+        author = User.objects.exclude(username=username).order_by(
+            '-stats__followers_count', 'pk').first()
+        kwargs = {'username': post.author.username, 'post_id': post.pk,
+                  'slug': group.slug}
+        follow_kwargs = {'username': author.username}
+
+        if settings.DEBUG:
+            self.stderr.write(self.style.WARNING(
+                'DEBUG включён: debug_toolbar и отладочные проверки '
+                'искажают замеры.'))
+        client = (ServerClient if options['server'] else TestClient)(
+            username)
+        routes = {}
+        try:
+            for pattern in urlpatterns:
+                name = pattern.name
+                if name in SKIPPED or name in PAIRED.values() or (
+                        options['routes'] and name not in options['routes']):
+                    continue
+                names = [name] + ([PAIRED[name]] if name in PAIRED else [])
+                urls = [
+                    reverse(f'posts:{route}', kwargs={
+                        key: (follow_kwargs if route in PAIRED or
+                              route in PAIRED.values() else kwargs)[key]
+                        for key in pattern.pattern.converters})
+                    for route in names
+                ]
+                if name == 'search':
+                    urls = [f'{url}?{urlencode({"q": "кот"})}' for url in urls]
+                routes.update(self.measure(client, names, urls, options))
+        finally:
+            client.close()
+
+        result = {
+            'meta': {
+                'revision': revision(),
+                'created': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'client': 'server' if options['server'] else 'test',
+                'user': username,
+                'requests': options['requests'],
+                'posts': Post.objects.count(),
+                'users': User.objects.count(),
+            },
+            'routes': routes,
+        }
+        self.report(result, options['compare'])
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(result, file, ensure_ascii=False, indent=2)
+
+    @staticmethod
+    def measure(client, names, urls, options):
+        timings = {name: [] for name in names}
+        queries = {name: [] for name in names}
+        memory = {name: [] for name in names}
+        statuses = {}
+        for iteration in range(options['warmup'] + options['requests']):
+            measured = iteration >= options['warmup']
+            for name, url in zip(names, urls):
+                if measured and options['trace_memory']:
+                    tracemalloc.start()
+                started = time.perf_counter()
+                status, count = client.get(url)
+                elapsed = (time.perf_counter() - started) * 1000
+                if measured and options['trace_memory']:
+                    memory[name].append(tracemalloc.get_traced_memory()[1])
+                    tracemalloc.stop()
+                if measured:
+                    timings[name].append(elapsed)
+                    queries[name].append(count)
+                    statuses[name] = status
+
+        routes = {}
+        for name, url in zip(names, urls):
+            routes[name] = {
+                'url': url,
+                'status': statuses[name],
+                'p50_ms': round(percentile(timings[name], 50), 3),
+                'p95_ms': round(percentile(timings[name], 95), 3),
+                'p99_ms': round(percentile(timings[name], 99), 3),
+                'mean_ms': round(statistics.mean(timings[name]), 3),
+                'queries_mean': round(statistics.mean(queries[name]), 2),
+                'queries_max': max(queries[name]),
+                'max_rss_kb': resource.getrusage(
+                    resource.RUSAGE_SELF).ru_maxrss,
+            }
+            if memory[name]:
+                routes[name]['alloc_peak_kb'] = round(
+                    statistics.mean(memory[name]) / 1024, 1)
+        return routes
+
+    def report(self, result, compare):
+        baseline = {}
+        if compare:
+            with open(compare) as file:
+                baseline = json.load(file)['routes']
+        self.stdout.write(f'{"route":<20}{"status":>7}{"p50":>9}{"p95":>9}'
+                          f'{"p99":>9}{"queries":>9}')
+        for name, route in result['routes'].items():
+            line = (f'{name:<20}{route["status"]:>7}{route["p50_ms"]:>9.2f}'
+                    f'{route["p95_ms"]:>9.2f}{route["p99_ms"]:>9.2f}'
+                    f'{route["queries_mean"]:>9.1f}')
+            if name in baseline:
+                p95 = route['p95_ms'] - baseline[name]['p95_ms']
+                queries = (route['queries_mean']
+                           - baseline[name]['queries_mean'])
+                line += f'  p95 {p95:+.2f} мс, запросов {queries:+.1f}'
+            self.stdout.write(line)
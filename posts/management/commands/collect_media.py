@@ -0,0 +1,121 @@
+import os
+import posixpath
+import re
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from sorl.thumbnail import default as thumbnail_default
+from sorl.thumbnail.conf import settings as thumbnail_settings
+
+from posts import counters
+from posts.bulk import batches
+from posts.models import Post, StoredImage
+
+VARIANT = re.compile(r'^(?P<root>.+)_\d+w\.(jpg|webp)$')
+
+
+def _tree_size(storage, path):
+    if not storage.exists(path):
+        return 0
+    directories, files = storage.listdir(path)
+    return sum(storage.size(posixpath.join(path, name)) for name in files
+               ) + sum(_tree_size(storage, posixpath.join(path, name))
+                       for name in directories)
+
+
+def _megabytes(size):
+    return f'{size / 1024 / 1024:.1f} МБ'
+
+
+class Command(BaseCommand):
+    help = ('Удаляет изображения записей, на которые не ссылается ни одна '
+            'запись, их варианты и миниатюры sorl и сообщает, сколько места '
+            'освобождено. Ссылки пересчитываются по записям пачками.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Число строк и файлов, проверяемых одним запросом.')
+        parser.add_argument(
+            '--grace', type=int, default=settings.MEDIA_GC_GRACE_SECONDS,
+            help='Не удалять файлы моложе стольких секунд.')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, сколько места освободится.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        fixed = counters.recount_image_references(batch_size)
+        self.stdout.write(f'Исправлено счётчиков ссылок: {fixed}')
+
+        field = Post._meta.get_field('image')
+        storage = field.storage
+        directory = field.upload_to.rstrip('/')
+        if not storage.exists(directory):
+            return
+        _, files = storage.listdir(directory)
+        names = [posixpath.join(directory, name) for name in files]
+
+        live = set()
+        for batch in batches(names, batch_size):
+            live.update(StoredImage.objects.filter(
+                name__in=batch, references__gt=0).values_list(
+                'name', flat=True))
+        live_roots = {os.path.splitext(name)[0] for name in live}
+
+        cutoff = timezone.now() - timedelta(seconds=options['grace'])
+        counts, sizes = Counter(), Counter()
+        deleted = []
+        for name in names:
+            if name in live:
+                continue
+            match = VARIANT.match(posixpath.basename(name))
+            if match and posixpath.join(directory,
+                                        match['root']) in live_roots:
+                continue
+            if storage.get_modified_time(name) > cutoff:
+                continue
+            kind = ('variants' if match else
+                    'uploads' if name.endswith('.upload') else 'originals')
+            counts[kind] += 1
+            sizes[kind] += storage.size(name)
+            if not options['dry_run']:
+                storage.delete(name)
+                if kind == 'originals':
+                    deleted.append(name)
+
+        for batch in batches(deleted, batch_size):
+            StoredImage.objects.filter(name__in=batch,
+                                       references=0).delete()
+
+        if not options['dry_run']:
+            # Миниатюры sorl удаляются вместе с записями хранилища ключей,
+            # источники которых больше не существуют.
+            thumbnails = thumbnail_settings.THUMBNAIL_PREFIX.rstrip('/')
+            before = _tree_size(default_storage, thumbnails)
+            thumbnail_default.kvstore.cleanup()
+            sizes['thumbnails'] = before - _tree_size(default_storage,
+                                                      thumbnails)
+
+        titles = {
+            'originals': 'Оригиналов',
+            'variants': 'Вариантов',
+            'uploads': 'Незавершённых загрузок',
+        }
+        for kind, title in titles.items():
+            self.stdout.write(
+                f'{title}: {counts[kind]}, {_megabytes(sizes[kind])}')
+        if options['dry_run']:
+            self.stdout.write('Миниатюры sorl проверяются только при '
+                              'удалении.')
+        else:
+            self.stdout.write(
+                f'Миниатюр sorl: {_megabytes(sizes["thumbnails"])}')
+        total = sum(sizes.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Можно освободить" if options["dry_run"] else "Освобождено"}:'
+            f' {total} байт ({_megabytes(total)})'))
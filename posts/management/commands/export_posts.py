@@ -0,0 +1,44 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from posts import transfer
+from posts.bulk import Progress
+
+
+class Command(BaseCommand):
+    help = ('Выгружает сообщества, записи, комментарии и подписки '
+            'в NDJSON или CSV, не загружая их в память целиком.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', '-o',
+            help='Файл для выгрузки, по умолчанию стандартный вывод.')
+        parser.add_argument(
+            '--format', choices=transfer.WRITERS,
+            help='Формат; по умолчанию по расширению файла, иначе NDJSON.')
+        parser.add_argument(
+            '--type', action='append', dest='types',
+            choices=transfer.TYPES,
+            help='Выгружать только эти типы строк (можно повторять).')
+        parser.add_argument(
+            '--chunk-size', type=int, default=2000,
+            help='Число строк, читаемых из базы за один раз.')
+
+    def handle(self, *args, **options):
+        path = options['output']
+        # Прогресс уходит в stderr, чтобы не смешиваться с выгрузкой.
+        progress = Progress(self.stderr)
+        writer = transfer.WRITERS[transfer.detect_format(
+            path, options['format'])]
+        rows = transfer.export_rows(options['types'] or transfer.TYPES,
+                                    options['chunk_size'])
+        file = (open(path, 'w', newline='', encoding='utf-8')
+                if path else sys.stdout)
+        try:
+            for _ in writer(rows, file):
+                progress.step()
+        finally:
+            if path:
+                file.close()
+        progress.done('Выгружено')
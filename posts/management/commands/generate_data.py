@@ -0,0 +1,215 @@
+import io
+import random
+import time
+from datetime import timedelta
+from itertools import accumulate
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from PIL import Image
+
+from posts import counters, images, search, timelines
+from posts.bulk import batches, historical_dates
+from posts.models import Comment, Follow, Group, Post, User
+
+WORDS = (
+    'кот собака утро вечер город море лес река горы дорога книга музыка '
+    'фильм история работа отпуск проект код тест релиз ошибка идея друг '
+    'семья погода дождь солнце зима лето весна осень кофе чай завтрак '
+    'ужин праздник новость спорт футбол бег велосипед поход фото картина '
+    'python django sqlite cache feed timeline search benchmark'
+).split()
+
+
+def _zipf_weights(count, exponent):
+    """Накопленные веса закона Ципфа: первые объекты встречаются
+    намного чаще остальных."""
+
+    return list(accumulate(1 / (rank ** exponent)
+                           for rank in range(1, count + 1)))
+
+
+def _text(rng, words):
+    return ' '.join(rng.choices(WORDS, k=words)).capitalize() + '.'
+
+
+class Command(BaseCommand):
+    help = ('Наполняет базу синтетическими данными для нагрузочного '
+            'тестирования: пользователи, сообщества, записи с картинками, '
+            'неравномерные подписки и всплески комментариев.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=20000)
+        parser.add_argument('--comments', type=int, default=50000)
+        parser.add_argument(
+            '--follows', type=int, default=30,
+            help='Среднее число подписок одного пользователя.')
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Показатель закона Ципфа для популярности авторов '
+                 'и записей.')
+        parser.add_argument(
+            '--image-ratio', type=float, default=0.2,
+            help='Доля записей с изображением.')
+        parser.add_argument(
+            '--image-pool', type=int, default=20,
+            help='Число разных файлов изображений, которые делят записи.')
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько дней распределить даты записей.')
+        parser.add_argument('--prefix', default='bench_',
+                            help='Префикс имён пользователей и сообществ.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--no-index', action='store_true',
+            help='Не перестраивать поисковый индекс.')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.options = options
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+
+        steps = (
+            ('Пользователи', self.create_users),
+            ('Сообщества', self.create_groups),
+            ('Изображения', self.create_images),
+            ('Записи', self.create_posts),
+            ('Подписки', self.create_follows),
+            ('Комментарии', self.create_comments),
+            ('Счётчики', self.recount),
+            ('Ленты подписок', timelines.rebuild),
+        )
+        if not options['no_index']:
+            steps += (('Поисковый индекс', search.rebuild),)
+
+        with historical_dates():
+            for title, step in steps:
+                started = time.monotonic()
+                step()
+                self.stdout.write(
+                    f'{title}: {time.monotonic() - started:.1f} с')
+        # Фрагменты лент и карточки в кэше построены по старым данным.
+        cache.clear()
+        self.stdout.write(self.style.SUCCESS('Данные созданы'))
+
+    def _insert(self, model, objects, **kwargs):
+        for batch in batches(objects, self.batch_size):
+            model.objects.bulk_create(batch, **kwargs)
+
+    def create_users(self):
+        prefix = self.options['prefix']
+        self._insert(User, (
+            User(username=f'{prefix}{index}', password='!')
+            for index in range(self.options['users'])
+        ), ignore_conflicts=True)
+        self.user_ids = list(User.objects.filter(
+            username__startswith=prefix).order_by('pk').values_list(
+            'pk', flat=True))
+
+    def create_groups(self):
+        prefix = self.options['prefix']
+        self._insert(Group, (
+            Group(title=f'{prefix}group {index}',
+                  slug=f'{prefix}group-{index}'.replace('_', '-'),
+                  description=_text(self.rng, 20))
+            for index in range(self.options['groups'])
+        ), ignore_conflicts=True)
+        self.group_ids = list(Group.objects.filter(
+            title__startswith=prefix).values_list('pk', flat=True))
+
+    def create_images(self):
+        self.image_variants = {}
+        for index in range(self.options['image_pool']):
+            size = self.rng.choice(((1600, 1200), (1200, 800), (800, 800),
+                                    (2400, 1600)))
+            color = tuple(self.rng.randrange(256) for _ in range(3))
+            buffer = io.BytesIO()
+            Image.new('RGB', size, color).save(buffer, 'JPEG', quality=85)
+            name = Post._meta.get_field('image').storage.save(
+                f'posts/{self.options["prefix"]}{index}.jpg',
+                ContentFile(buffer.getvalue()))
+            widths, webp = images.make_variants(name)
+            self.image_variants[name] = (images.join_widths(widths), webp)
+        self.image_names = list(self.image_variants)
+
+    def create_posts(self):
+        rng, options = self.rng, self.options
+        authors = self.user_ids
+        weights = _zipf_weights(len(authors), options['skew'])
+        period = timedelta(days=options['days']).total_seconds()
+        started = Post.objects.order_by('-pk').values_list(
+            'pk', flat=True).first() or 0
+
+        def posts():
+            for _ in range(options['posts']):
+                pub_date = self.now - timedelta(
+                    seconds=rng.random() * period)
+                image = (rng.choice(self.image_names)
+                         if self.image_names
+                         and rng.random() < options['image_ratio'] else '')
+                widths, webp = self.image_variants.get(image, ('', False))
+                yield Post(
+                    text=_text(rng, rng.randint(5, 60)),
+                    author_id=rng.choices(authors, cum_weights=weights)[0],
+                    group_id=(rng.choice(self.group_ids)
+                              if self.group_ids and rng.random() < 0.4
+                              else None),
+                    image=image,
+                    image_widths=widths,
+                    image_webp=webp,
+                    pub_date=pub_date,
+                    updated=pub_date,
+                )
+
+        self._insert(Post, posts())
+        self.posts = list(Post.objects.filter(pk__gt=started).order_by(
+            '-pub_date').values_list('pk', 'pub_date'))
+
+    def create_follows(self):
+        rng, options = self.rng, self.options
+        authors = self.user_ids
+        weights = _zipf_weights(len(authors), options['skew'])
+
+        def follows():
+            for user_id in self.user_ids:
+                count = min(int(rng.expovariate(1 / options['follows'])),
+                            len(authors) - 1)
+                followed = set(rng.choices(authors, cum_weights=weights,
+                                           k=count))
+                followed.discard(user_id)
+                for author_id in followed:
+                    yield Follow(user_id=user_id, author_id=author_id)
+
+        self._insert(Follow, follows(), ignore_conflicts=True)
+
+    def create_comments(self):
+        rng, options = self.rng, self.options
+        if not self.posts:
+            return
+        # Свежие записи обсуждают чаще: вес по порядку от новых к старым.
+        weights = _zipf_weights(len(self.posts), options['skew'])
+
+        def comments():
+            for _ in range(options['comments']):
+                post_id, pub_date = rng.choices(self.posts,
+                                                cum_weights=weights)[0]
+                # Всплеск: большая часть комментариев — в первые часы.
+                created = min(pub_date + timedelta(
+                    hours=rng.expovariate(1 / 3)), self.now)
+                yield Comment(text=_text(rng, rng.randint(3, 30)),
+                              post_id=post_id,
+                              author_id=rng.choice(self.user_ids),
+                              created=created)
+
+        self._insert(Comment, comments())
+
+    def recount(self):
+        counters.recount_comments(self.batch_size)
+        counters.recount_user_stats(self.batch_size)
+        counters.recount_image_references(self.batch_size)
@@ -0,0 +1,59 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import thumbnails
+from posts.models import Post
+
+
+def _generate(post_ids):
+    done = 0
+    for post_id in post_ids:
+        try:
+            thumbnails.generate(post_id)
+        except Exception:
+            thumbnails.logger.exception(
+                'Не удалось создать варианты изображения записи %s', post_id)
+        else:
+            done += 1
+    return done
+
+
+class Command(BaseCommand):
+    help = ('Создаёт варианты изображений публикаций, у которых их ещё '
+            'нет, в нескольких процессах.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Число процессов, по умолчанию по числу ядер.')
+        parser.add_argument(
+            '--batch-size', type=int, default=50,
+            help='Число изображений в одном задании процесса.')
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересоздать варианты и для уже обработанных изображений.')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        posts = Post.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['all']:
+            posts = posts.filter(image_widths='')
+        post_ids = iter(list(posts.order_by().values_list('pk', flat=True)))
+        batch_size = options['batch_size']
+
+        # Открытые соединения с базой нельзя делить с дочерними процессами.
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=options['workers'],
+                                 initializer=django.setup) as executor:
+            batches = iter(lambda: list(islice(post_ids, batch_size)), [])
+            done = sum(executor.map(_generate, batches))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {done} '
+            f'за {time.monotonic() - started:.1f} с'))
@@ -0,0 +1,112 @@
+import json
+import os
+import sys
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import counters, search, timelines, transfer
+from posts.bulk import Progress, historical_dates
+
+
+class Command(BaseCommand):
+    help = ('Загружает сообщества, записи, комментарии и подписки '
+            'из NDJSON или CSV пачками через bulk_create. Прерванный '
+            'импорт продолжается с последней сохранённой пачки.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', help='Файл для загрузки, «-» — стандартный ввод.')
+        parser.add_argument(
+            '--format', choices=transfer.READERS,
+            help='Формат; по умолчанию по расширению файла, иначе NDJSON.')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Число строк в одной пачке (и транзакции).')
+        parser.add_argument(
+            '--state',
+            help='Файл с номером последней загруженной строки, '
+                 'по умолчанию <path>.progress.')
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Начать заново, не учитывая сохранённый прогресс.')
+        parser.add_argument(
+            '--no-index', action='store_true',
+            help='Не добавлять загруженное в поисковый индекс.')
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Вместо обновления по каждой пачке после загрузки '
+                 'пересчитать счётчики, перестроить ленты подписок '
+                 'и поисковый индекс всего сайта и очистить кэш.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        stdin = path == '-'
+        state = None if stdin else options['state'] or f'{path}.progress'
+        done = 0
+        if state and os.path.exists(state) and not options['restart']:
+            with open(state) as file:
+                done = json.load(file)['rows']
+            self.stderr.write(f'Продолжение с {done + 1}-й строки')
+
+        reader = transfer.READERS[transfer.detect_format(
+            path, options['format'])]
+        importer = transfer.Importer(options['batch_size'],
+                                     update=not options['rebuild'],
+                                     index=not options['no_index'])
+        progress = Progress(self.stderr, start=done)
+        file = sys.stdin if stdin else open(path, newline='',
+                                            encoding='utf-8')
+        position = 0
+        try:
+            with historical_dates():
+                rows = reader(file)
+                for position, row in enumerate(rows, 1):
+                    if position <= done:
+                        continue
+                    if row is not None:
+                        try:
+                            importer.add(row)
+                        except transfer.InvalidRow as error:
+                            raise CommandError(f'Строка {position}: {error}')
+                    if len(importer) >= options['batch_size']:
+                        self.checkpoint(importer, state, position)
+                        progress.update(position)
+                self.checkpoint(importer, state, position)
+                progress.update(position)
+        except transfer.IdConflict as error:
+            # Пачка откатилась целиком, прогресс остался на предыдущей.
+            raise CommandError(f'Пачка до строки {position}: {error}')
+        except transfer.InvalidRow as error:
+            # Строку не удалось прочитать: счётчик ещё на предыдущей.
+            raise CommandError(f'Строка {position + 1}: {error}')
+        finally:
+            if not stdin:
+                file.close()
+
+        progress.done('Загружено')
+        importer.finish()
+        if options['rebuild']:
+            counters.recount_comments()
+            counters.recount_user_stats()
+            timelines.rebuild()
+            if not options['no_index']:
+                search.rebuild()
+            # Фрагменты лент и карточки в кэше построены по старым данным.
+            cache.clear()
+        if state and os.path.exists(state):
+            os.remove(state)
+
+        self.stdout.write(self.style.SUCCESS(
+            ', '.join(f'{kind}: {count}'
+                      for kind, count in importer.imported.items())
+            + f', уже в базе: {importer.present}'
+            + f', пропущено: {importer.skipped}'))
+
+    @staticmethod
+    def checkpoint(importer, state, position):
+        importer.flush()
+        if state:
+            # Пачка уже в базе; повтор её строк после сбоя безвреден.
+            with open(state, 'w') as file:
+                json.dump({'rows': position}, file)
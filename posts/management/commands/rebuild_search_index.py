@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = 'Заново строит поисковый индекс по записям и комментариям.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Число записей индекса, вставляемых одним запросом.')
+
+    def handle(self, *args, **options):
+        search.rebuild(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS('Поисковый индекс пересобран'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from posts import timelines
+
+
+class Command(BaseCommand):
+    help = 'Заново наполняет ленты подписок по текущим подпискам.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Число записей ленты, вставляемых одним запросом.')
+
+    def handle(self, *args, **options):
+        timelines.rebuild(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS('Ленты подписок пересобраны'))
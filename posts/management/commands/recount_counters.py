@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает денормализованные счётчики комментариев, '
+            'записей и подписок.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Число строк, обновляемых одним запросом.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        fixed_posts = counters.recount_comments(batch_size)
+        fixed_users = counters.recount_user_stats(batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено публикаций: {fixed_posts}, '
+            f'пользователей: {fixed_users}'))
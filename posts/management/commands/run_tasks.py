@@ -0,0 +1,63 @@
+import multiprocessing
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import queue
+
+
+def _work(batch_size, once, stop):
+    # Дочерний процесс не должен завершаться посреди пачки по Ctrl+C,
+    # его останавливает событие stop.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    queue.work(batch_size, once, stop.is_set)
+
+
+class Command(BaseCommand):
+    help = ('Выполняет фоновые задачи из очереди в нескольких процессах. '
+            'По SIGINT или SIGTERM процессы завершают текущую пачку '
+            'и останавливаются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.TASK_WORKERS or 1,
+            help='Число процессов-обработчиков.')
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.TASK_BATCH_SIZE,
+            help='Сколько задач одного вида выполнять за раз.')
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выйти, когда готовых задач не останется.')
+
+    def handle(self, *args, **options):
+        batch_size, once = options['batch_size'], options['once']
+        if options['workers'] <= 1:
+            done = queue.work(batch_size, once)
+            self.stdout.write(self.style.SUCCESS(
+                f'Выполнено задач: {done}'))
+            return
+
+        # Соединения с базой не должны достаться дочерним процессам.
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        stop = context.Event()
+        workers = [
+            context.Process(target=_work, args=(batch_size, once, stop),
+                            name=f'tasks-{number}', daemon=True)
+            for number in range(options['workers'])]
+        for worker in workers:
+            worker.start()
+        previous = {
+            number: signal.signal(number, lambda *args: stop.set())
+            for number in (signal.SIGINT, signal.SIGTERM)}
+        try:
+            for worker in workers:
+                worker.join()
+        finally:
+            for number, handler in previous.items():
+                signal.signal(number, handler)
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработчики остановлены: {len(workers)}'))
@@ -0,0 +1,41 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+
+class Command(BaseCommand):
+    help = ('Копирует основную базу SQLite в файлы реплик из DB_REPLICAS, '
+            'чтобы проверить чтение с реплик локально. Реплики PostgreSQL '
+            'обновляет сам сервер.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--every', type=float,
+            help='Повторять копирование каждые столько секунд, имитируя '
+                 'отставание реплик.')
+
+    def handle(self, *args, **options):
+        if not settings.REPLICA_DATABASES:
+            raise CommandError('Реплики не заданы: укажите DB_REPLICAS.')
+        if connection.vendor != 'sqlite':
+            raise CommandError('Копировать можно только базы SQLite.')
+        while True:
+            self.sync()
+            if not options['every']:
+                break
+            time.sleep(options['every'])
+
+    def sync(self):
+        connection.ensure_connection()
+        for alias in settings.REPLICA_DATABASES:
+            name = connections[alias].settings_dict['NAME']
+            connections[alias].close()
+            replica = sqlite3.connect(name)
+            try:
+                connection.connection.backup(replica)
+            finally:
+                replica.close()
+            self.stdout.write(f'{alias}: {name}')
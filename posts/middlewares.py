@@ -1,3 +1,10 @@
+import random
+
+from django.conf import settings
+
+from . import files, profiling, routers
+
+
 class AddContextAttrMiddleware(object):
     def __init__(self, get_response):
         self.get_response = get_response
@@ -9,3 +16,72 @@ class AddContextAttrMiddleware(object):
     def process_template_response(self, request, response):
         response.context = response.context_data
         return response
+
+
+class FileServingMiddleware(object):
+    """Отдаёт статику и медиафайлы до остальной обработки запроса
+    (см. posts.files), чтобы небольшим узлам не нужен был отдельный
+    файловый сервер. Запросы к отсутствующим файлам идут дальше."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = files.serve_request(request)
+        if response is None:
+            response = self.get_response(request)
+        return response
+
+
+class QueryProfilingMiddleware(object):
+    """Профилирует долю QUERY_PROFILING_SAMPLE_RATE запросов: число
+    запросов к базе, время SQL и шаблонов, самые медленные запросы.
+    Результат пишется в лог по имени представления и сверяется
+    с QUERY_BUDGETS."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        profiling.install()
+
+    def __call__(self, request):
+        if random.random() >= settings.QUERY_PROFILING_SAMPLE_RATE:
+            return self.get_response(request)
+        profile = profiling.RequestProfile()
+        with profile.capture():
+            response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else request.path
+        profiling.report(view_name, profile)
+        profiling.check_budget(view_name, profile)
+        return response
+
+
+class ReplicaRoutingMiddleware(object):
+    """Отправляет чтение GET-запросов к REPLICA_VIEWS на реплику.
+
+    После запроса с записью в основную базу ставит cookie
+    REPLICA_PIN_COOKIE: пока она жива, пользователь читает из основной
+    базы и видит свои изменения, даже если реплика отстаёт.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        routers.begin_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = routers.end_request()
+        if wrote and settings.REPLICA_DATABASES:
+            response.set_cookie(settings.REPLICA_PIN_COOKIE, '1',
+                                max_age=settings.REPLICA_PIN_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
+
+    # noinspection PyUnusedLocal
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (request.method in ('GET', 'HEAD')
+                and request.resolver_match.view_name in settings.REPLICA_VIEWS
+                and settings.REPLICA_PIN_COOKIE not in request.COOKIES):
+            routers.use_replica()
@@ -0,0 +1,66 @@
+# Generated by Django 2.2.6 on 2026-10-17 04:23
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_timelines(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    UserStats = apps.get_model('posts', 'UserStats')
+
+    authors = UserStats.objects.filter(
+        followers_count__gt=0,
+        followers_count__lte=settings.TIMELINE_FANOUT_LIMIT,
+    ).values_list('user_id', flat=True)
+    for author_id in authors.iterator():
+        posts = list(Post.objects.filter(author_id=author_id).order_by(
+            '-pub_date', '-id').values_list(
+            'id', 'pub_date')[:settings.TIMELINE_BACKFILL])
+        followers = Follow.objects.filter(author_id=author_id).values_list(
+            'user_id', flat=True)
+        TimelineEntry.objects.bulk_create(
+            (TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+             for user_id in followers.iterator()
+             for post_id, pub_date in posts),
+            batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0002_counters'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='userstats',
+            name='followers_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, verbose_name='Подписчиков'),
+        ),
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='posts.Post', verbose_name='Публикация')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL, verbose_name='Читатель')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты подписок',
+                'verbose_name_plural': 'Ленты подписок',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', '-pub_date', '-post'], name='posts_timeline_feed_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(fields=('user', 'post'), name='posts_timelineentry_user_post_constraint'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.6 on 2026-10-17 04:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0004_post_updated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_webp',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Есть варианты WebP'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_widths',
+            field=models.CharField(blank=True, editable=False, max_length=50, verbose_name='Ширины вариантов изображения'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 2.2.6 on 2026-10-17 04:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Миграция только создаёт таблицу: индекс по уже сохранённым записям
+# строит команда rebuild_search_index. Разбор текста меняется вместе
+# с кодом поиска, а результат миграции меняться не должен.
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0005_post_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64, verbose_name='Основа слова')),
+                ('weight', models.PositiveIntegerField(default=1, verbose_name='Вес')),
+                ('comment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='posts.Comment', verbose_name='Комментарий')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='posts.Post', verbose_name='Публикация')),
+            ],
+            options={
+                'verbose_name': 'Запись поискового индекса',
+                'verbose_name_plural': 'Поисковый индекс',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='searchterm',
+            index=models.Index(fields=['term', 'post'], name='posts_search_term_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 2.2.6 on 2026-10-17 05:15
+
+from django.db import migrations, models
+from django.db.models import Count
+import posts.storage
+
+
+def fill_references(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    StoredImage = apps.get_model('posts', 'StoredImage')
+
+    images = Post.objects.exclude(image='').exclude(
+        image__isnull=True).order_by().values('image').annotate(
+        total=Count('pk'))
+    StoredImage.objects.bulk_create(
+        (StoredImage(name=image['image'], references=image['total'])
+         for image in images.iterator()), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredImage',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False, verbose_name='Файл')),
+                ('references', models.PositiveIntegerField(default=0, verbose_name='Ссылок')),
+            ],
+            options={
+                'verbose_name': 'Сохранённое изображение',
+                'verbose_name_plural': 'Сохранённые изображения',
+            },
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, help_text='Загрузите изображение', null=True, storage=posts.storage.ContentAddressedStorage(), upload_to='posts/', verbose_name='Изображение'),
+        ),
+        migrations.RunPython(fill_references, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.2.6 on 2026-10-17 05:33
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_popular(apps, schema_editor):
+    # Записи авторов сверх порога никогда не рассылались по лентам.
+    UserStats = apps.get_model('posts', 'UserStats')
+    UserStats.objects.filter(
+        followers_count__gt=settings.TIMELINE_FANOUT_LIMIT).update(
+        timelines_materialized=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_tasks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstats',
+            name='timelines_materialized',
+            field=models.BooleanField(default=True, verbose_name='Записи разосланы по лентам'),
+        ),
+        migrations.RunPython(mark_popular, migrations.RunPython.noop),
+    ]
@@ -2,6 +2,9 @@ from django.contrib.auth import get_user_model
 from django.core.validators import MinLengthValidator
 from django.db import models
 from django.urls import reverse
+from django.utils import timezone
+
+from .storage import content_storage
 
 User = get_user_model()
 
@@ -16,30 +19,65 @@ class Post(models.Model):
         verbose_name='Дата',
         db_index=True,
     )
+    updated = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения',
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
+        db_index=False,
         verbose_name='Автор',
     )
     group = models.ForeignKey(
         'Group',
         on_delete=models.SET_NULL,
         blank=True, null=True,
+        db_index=False,
         verbose_name='Сообщество',
         help_text='Выберете сообщество',
     )
     image = models.ImageField(
         upload_to='posts/',
+        storage=content_storage,
         blank=True, null=True,
         verbose_name='Изображение',
         help_text='Загрузите изображение',
     )
+    image_widths = models.CharField(
+        max_length=50,
+        blank=True,
+        editable=False,
+        verbose_name='Ширины вариантов изображения',
+    )
+    image_webp = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name='Есть варианты WebP',
+    )
+    comments_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Комментариев',
+    )
 
     class Meta:
         verbose_name_plural = 'Публикации'
         verbose_name = 'Публикация'
         ordering = ['-pub_date']
         default_related_name = 'posts'
+        # Ленты автора и сообщества читаются по убыванию (pub_date, id);
+        # индексы по ним заменяют одиночные индексы внешних ключей.
+        indexes = [
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='posts_author_feed_idx',
+            ),
+            models.Index(
+                fields=('group', '-pub_date', '-id'),
+                name='posts_group_feed_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -89,6 +127,7 @@ class Comment(models.Model):
     post = models.ForeignKey(
         Post,
         on_delete=models.CASCADE,
+        db_index=False,
         verbose_name='Публикация',
     )
     author = models.ForeignKey(
@@ -102,6 +141,12 @@ class Comment(models.Model):
         verbose_name = 'Комментарий'
         ordering = ['-created']
         default_related_name = 'comments'
+        indexes = [
+            models.Index(
+                fields=('post', '-created', '-id'),
+                name='posts_comment_thread_idx',
+            )
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -118,12 +163,14 @@ class Follow(models.Model):
         User,
         on_delete=models.CASCADE,
         related_name='follower',
+        db_index=False,
         verbose_name='Подписчик',
     )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         related_name='following',
+        db_index=False,
         verbose_name='Автор',
     )
 
@@ -134,7 +181,200 @@ class Follow(models.Model):
                 name='posts_follow_user_author_constraint',
             )
         ]
+        # Подписки пользователя обслуживает уникальный индекс
+        # (user, author), подписчиков автора — обратный ему.
+        indexes = [
+            models.Index(
+                fields=('author', 'user'),
+                name='posts_follow_author_user_idx',
+            )
+        ]
 
     # noinspection PyUnresolvedReferences
     def __str__(self):
         return f'{self.user.username} - {self.author.username}'
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь',
+    )
+    posts_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Записей',
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        db_index=True,
+        verbose_name='Подписчиков',
+    )
+    following_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Подписок',
+    )
+    # Ложно, пока в лентах подписчиков могут не хватать записей автора:
+    # они вышли, когда у него было больше TIMELINE_FANOUT_LIMIT
+    # подписчиков, и лента подписок добирает их при чтении.
+    timelines_materialized = models.BooleanField(
+        default=True,
+        verbose_name='Записи разосланы по лентам',
+    )
+
+    class Meta:
+        verbose_name_plural = 'Статистика пользователей'
+        verbose_name = 'Статистика пользователя'
+
+    # noinspection PyUnresolvedReferences
+    def __str__(self):
+        return self.user.username
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Читатель',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Публикация',
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата',
+    )
+
+    class Meta:
+        verbose_name_plural = 'Ленты подписок'
+        verbose_name = 'Запись ленты подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'post'),
+                name='posts_timelineentry_user_post_constraint',
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=('user', '-pub_date', '-post'),
+                name='posts_timeline_feed_idx',
+            )
+        ]
+
+    # noinspection PyUnresolvedReferences
+    def __str__(self):
+        return f'{self.user.username} - {self.post_id}'
+
+
+class SearchTerm(models.Model):
+    term = models.CharField(
+        max_length=64,
+        verbose_name='Основа слова',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='search_terms',
+        verbose_name='Публикация',
+    )
+    comment = models.ForeignKey(
+        Comment,
+        on_delete=models.CASCADE,
+        blank=True, null=True,
+        related_name='search_terms',
+        verbose_name='Комментарий',
+    )
+    weight = models.PositiveIntegerField(
+        default=1,
+        verbose_name='Вес',
+    )
+
+    class Meta:
+        verbose_name_plural = 'Поисковый индекс'
+        verbose_name = 'Запись поискового индекса'
+        indexes = [
+            models.Index(
+                fields=('term', 'post'),
+                name='posts_search_term_idx',
+            )
+        ]
+
+    def __str__(self):
+        return self.term
+
+
+class StoredImage(models.Model):
+    """Число записей, ссылающихся на сохранённое изображение."""
+
+    name = models.CharField(
+        max_length=100,
+        primary_key=True,
+        verbose_name='Файл',
+    )
+    references = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Ссылок',
+    )
+
+    class Meta:
+        verbose_name_plural = 'Сохранённые изображения'
+        verbose_name = 'Сохранённое изображение'
+
+    def __str__(self):
+        return self.name
+
+
+class Task(models.Model):
+    """Отложенная задача очереди posts.queue. Выполненные задачи
+    удаляются; задача, исчерпавшая попытки, остаётся с ошибкой."""
+
+    name = models.CharField(
+        max_length=100,
+        verbose_name='Задача',
+    )
+    payload = models.TextField(
+        verbose_name='Данные',
+    )
+    run_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Выполнить после',
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name='Попыток',
+    )
+    locked_by = models.CharField(
+        max_length=32,
+        blank=True,
+        verbose_name='Обработчик',
+    )
+    failed = models.BooleanField(
+        default=False,
+        verbose_name='Не выполнена',
+    )
+    error = models.TextField(
+        blank=True,
+        verbose_name='Ошибка',
+    )
+
+    class Meta:
+        verbose_name_plural = 'Задачи'
+        verbose_name = 'Задача'
+        indexes = [
+            models.Index(
+                fields=('failed', 'run_at'),
+                name='posts_task_due_idx',
+            ),
+            models.Index(
+                fields=('locked_by',),
+                name='posts_task_locked_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.name}: {self.payload}'
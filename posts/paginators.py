@@ -0,0 +1,215 @@
+import base64
+import binascii
+import heapq
+import json
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorPage:
+    """Страница ленты, отобранная по ключу без COUNT(*) и OFFSET."""
+
+    def __init__(self, object_list, paginator, next_cursor=None,
+                 previous_cursor=None, number=None, cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.number = number
+        self.cursor = cursor
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """Постраничный вывод по ключу сортировки (по умолчанию (pub_date, id)).
+
+    Объекты отдаются по убыванию ключа. Курсор — непрозрачный токен
+    со значениями ключа крайнего объекта страницы и направлением перехода.
+    Номера страниц (?page=) поддерживаются для первых ``legacy_pages``
+    страниц, чтобы не ломать старые ссылки.
+    """
+
+    def __init__(self, object_list, per_page, keys=('pub_date', 'id'),
+                 legacy_pages=None, transform=None):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.keys = tuple(keys)
+        self.legacy_pages = (settings.PAGINATOR_LEGACY_PAGES
+                             if legacy_pages is None else legacy_pages)
+        self.transform = transform
+
+    def get_page(self, cursor=None, page=None):
+        if cursor:
+            try:
+                position, backwards = self.decode_cursor(cursor)
+            except InvalidCursor:
+                pass
+            else:
+                page_obj = self._page_at(position, backwards, cursor)
+                if page_obj.object_list or not backwards:
+                    return page_obj
+        return self._page_number(self._validate_number(page))
+
+    def encode_cursor(self, position, backwards=False):
+        values = [self._to_json(value) for value in position]
+        payload = json.dumps({'v': values, 'b': int(backwards)},
+                             separators=(',', ':'))
+        token = base64.urlsafe_b64encode(payload.encode())
+        return token.decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padding = '=' * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(cursor + padding))
+            values, backwards = payload['v'], bool(payload['b'])
+        except (binascii.Error, UnicodeDecodeError, ValueError,
+                KeyError, TypeError):
+            raise InvalidCursor(cursor)
+        if not isinstance(values, list) or len(values) != len(self.keys):
+            raise InvalidCursor(cursor)
+        try:
+            position = tuple(self._to_python(key, value)
+                             for key, value in zip(self.keys, values))
+        except ValidationError:
+            raise InvalidCursor(cursor)
+        return position, backwards
+
+    def _validate_number(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            return 1
+        if number < 1 or number > self.legacy_pages:
+            return 1
+        return number
+
+    def _ordered(self, backwards=False):
+        prefix = '' if backwards else '-'
+        return self.object_list.order_by(
+            *(f'{prefix}{key}' for key in self.keys))
+
+    def _seek(self, position, backwards=False):
+        lookup = 'gt' if backwards else 'lt'
+        condition = Q()
+        for index, key in enumerate(self.keys):
+            term = Q(**{f'{key}__{lookup}': position[index]})
+            for equal_key, equal_value in zip(self.keys[:index],
+                                              position[:index]):
+                term &= Q(**{equal_key: equal_value})
+            condition |= term
+        return condition
+
+    def _fetch(self, position=None, backwards=False, offset=0, limit=None):
+        """Возвращает пары (значения ключа, объект) после ``position``."""
+
+        if limit is None:
+            limit = self.per_page + 1
+        queryset = self._ordered(backwards)
+        if position is not None:
+            queryset = queryset.filter(self._seek(position, backwards))
+        return [
+            (tuple(getattr(row, key) for key in self.keys),
+             self.transform(row) if self.transform else row)
+            for row in queryset[offset:offset + limit]
+        ]
+
+    def _page_number(self, number):
+        rows = self._fetch(offset=(number - 1) * self.per_page)
+        if not rows and number > 1:
+            return self._page_number(1)
+        positions, object_list = self._split(rows[:self.per_page])
+        next_cursor = previous_cursor = None
+        if len(rows) > self.per_page:
+            next_cursor = self.encode_cursor(positions[-1])
+        if number > 1:
+            previous_cursor = self.encode_cursor(positions[0],
+                                                 backwards=True)
+        return CursorPage(object_list, self, next_cursor, previous_cursor,
+                          number=number)
+
+    def _page_at(self, position, backwards, cursor):
+        rows = self._fetch(position, backwards)
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+        positions, object_list = self._split(rows)
+        if not object_list:
+            return CursorPage(object_list, self, cursor=cursor)
+        next_cursor = previous_cursor = None
+        if has_more or backwards:
+            next_cursor = self.encode_cursor(positions[-1])
+        if has_more or not backwards:
+            previous_cursor = self.encode_cursor(positions[0],
+                                                 backwards=True)
+        return CursorPage(object_list, self, next_cursor, previous_cursor,
+                          cursor=cursor)
+
+    @staticmethod
+    def _split(rows):
+        return [row[0] for row in rows], [row[1] for row in rows]
+
+    @staticmethod
+    def _to_json(value):
+        if hasattr(value, 'isoformat'):
+            return value.isoformat()
+        return value
+
+    def _to_python(self, key, value):
+        try:
+            field = self.object_list.model._meta.get_field(key)
+        except FieldDoesNotExist:
+            return value
+        return field.to_python(value)
+
+
+class MergedCursorPaginator(CursorPaginator):
+    """Сливает несколько лент с ключами одного типа в одну.
+
+    Каждый источник выбирает не больше страницы объектов, после чего
+    они сливаются по значениям ключа; повторы отбрасываются.
+    """
+
+    def __init__(self, paginators, per_page, legacy_pages=None):
+        first = paginators[0]
+        super().__init__(first.object_list, per_page, first.keys,
+                         legacy_pages)
+        self.paginators = paginators
+
+    def _fetch(self, position=None, backwards=False, offset=0, limit=None):
+        if limit is None:
+            limit = self.per_page + 1
+        sources = (
+            paginator._fetch(position, backwards, limit=offset + limit)
+            for paginator in self.paginators
+        )
+        rows, seen = [], set()
+        for row in heapq.merge(*sources, key=lambda row: row[0],
+                               reverse=not backwards):
+            if row[0] not in seen:
+                seen.add(row[0])
+                rows.append(row)
+        return rows[offset:offset + limit]
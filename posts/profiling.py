@@ -0,0 +1,110 @@
+import heapq
+import logging
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.template.base import Template
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_render = None
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class RequestProfile:
+    """Запросы к базе, время SQL и шаблонов одного HTTP-запроса."""
+
+    def __init__(self, slowest=None):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.total_time = 0.0
+        self.slowest = []
+        self.slowest_limit = (settings.QUERY_PROFILING_SLOWEST
+                              if slowest is None else slowest)
+        self._rendering = False
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.queries += 1
+            self.sql_time += duration
+            if len(self.slowest) < self.slowest_limit:
+                heapq.heappush(self.slowest, (duration, sql))
+            elif self.slowest_limit:
+                heapq.heappushpop(self.slowest, (duration, sql))
+
+    @contextmanager
+    def capture(self):
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(self))
+            _local.profile = self
+            try:
+                yield self
+            finally:
+                _local.profile = None
+                self.total_time = time.perf_counter() - started
+
+
+def _timed_render(template, context):
+    profile = getattr(_local, 'profile', None)
+    # Вложенные шаблоны (include, extends) уже учтены во внешнем.
+    if profile is None or profile._rendering:
+        return _render(template, context)
+    profile._rendering = True
+    started = time.perf_counter()
+    try:
+        return _render(template, context)
+    finally:
+        profile._rendering = False
+        profile.template_time += time.perf_counter() - started
+
+
+def install():
+    """Подменяет Template.render, чтобы замерять время шаблонов.
+    Вне профилируемых запросов подмена ничего не делает."""
+
+    global _render
+    if _render is None:
+        _render = Template.render
+        Template.render = _timed_render
+
+
+def report(view_name, profile):
+    slowest = sorted(profile.slowest, reverse=True)
+    logger.info(
+        '%s: %d queries, SQL %.1f ms, templates %.1f ms, total %.1f ms%s',
+        view_name, profile.queries, profile.sql_time * 1000,
+        profile.template_time * 1000, profile.total_time * 1000,
+        ''.join(f'\n  {duration * 1000:.1f} ms: {sql}'
+                for duration, sql in slowest),
+        extra={'view_name': view_name, 'queries': profile.queries,
+               'sql_time': profile.sql_time,
+               'template_time': profile.template_time,
+               'total_time': profile.total_time})
+
+
+def check_budget(view_name, profile):
+    """Сообщает о превышении QUERY_BUDGETS для представления; при
+    QUERY_BUDGETS_RAISE выбрасывает QueryBudgetExceeded."""
+
+    budget = settings.QUERY_BUDGETS.get(view_name)
+    if budget is None or profile.queries <= budget:
+        return
+    message = (f'{view_name} made {profile.queries} queries, '
+               f'budget is {budget}')
+    if settings.QUERY_BUDGETS_RAISE:
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
@@ -0,0 +1,177 @@
+"""Очередь фоновых задач в базе данных.
+
+Задачи, поставленные внутри транзакции, копятся и вставляются одним
+запросом после её фиксации: откаченная запись не оставляет задач,
+а представление не ждёт их выполнения. Обработчики запускает команда
+run_tasks. Обработчик получает сразу пачку задач одного вида без
+повторов; задача, завершившаяся ошибкой, повторяется с растущей
+задержкой, пока не исчерпает TASK_MAX_ATTEMPTS попыток. Задачи
+обработчика, который завис или упал, снова становятся доступны через
+TASK_LEASE секунд.
+
+С TASK_WORKERS = 0 задачи выполняются сразу при постановке.
+"""
+
+import json
+import logging
+import time
+import traceback
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Subquery
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+handlers = {}
+
+
+class _Pending(list):
+    """Задачи транзакции; вставляются одним запросом после фиксации."""
+
+    def __init__(self, using):
+        super().__init__()
+        self.using = using
+
+    def __call__(self):
+        Task.objects.using(self.using).bulk_create(self)
+
+
+def task(name):
+    """Регистрирует обработчик задач ``name``. Обработчик принимает
+    список данных задач; ``handler.enqueue(payload)`` ставит задачу."""
+
+    def decorator(handler):
+        handlers[name] = handler
+        handler.enqueue = lambda payload, using=None: enqueue(
+            name, payload, using)
+        return handler
+
+    return decorator
+
+
+def enqueue(name, payload, using=None):
+    """Ставит задачу ``name`` с данными ``payload`` (JSON) в очередь."""
+
+    payload = json.dumps(payload, sort_keys=True)
+    if not settings.TASK_WORKERS:
+        handlers[name]([json.loads(payload)])
+        return
+    item = Task(name=name, payload=payload)
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        item.save(using=connection.alias)
+        return
+    # Задачи одной транзакции (и одной точки сохранения: её откат
+    # отменяет только свои задачи) собираются в общий список.
+    savepoints = set(connection.savepoint_ids)
+    for entry in connection.run_on_commit:
+        if isinstance(entry[1], _Pending) and entry[0] == savepoints:
+            entry[1].append(item)
+            return
+    pending = _Pending(connection.alias)
+    pending.append(item)
+    transaction.on_commit(pending, connection.alias)
+
+
+def claim(batch_size):
+    """Забирает до ``batch_size`` готовых задач того же вида, что
+    и самая старая; задачи не видны другим обработчикам TASK_LEASE
+    секунд."""
+
+    now = timezone.now()
+    due = Task.objects.filter(failed=False, run_at__lte=now).order_by(
+        'run_at', 'pk')
+    ids = due.filter(name=Subquery(due.values('name')[:1])).values(
+        'pk')[:batch_size]
+    token = uuid.uuid4().hex
+    # Условие повторяется во внешнем запросе: задачи, которые успел
+    # забрать другой обработчик, пропускаются.
+    claimed = Task.objects.filter(
+        pk__in=ids, failed=False, run_at__lte=now).update(
+        locked_by=token, attempts=F('attempts') + 1,
+        run_at=now + timedelta(seconds=settings.TASK_LEASE))
+    if not claimed:
+        return []
+    return list(Task.objects.filter(locked_by=token))
+
+
+def _retry_delay(attempts):
+    return timedelta(seconds=settings.TASK_RETRY_DELAY * 2 ** (attempts - 1))
+
+
+def _failed(items, error):
+    now = timezone.now()
+    for item in items:
+        failed = item.attempts >= settings.TASK_MAX_ATTEMPTS
+        Task.objects.filter(pk=item.pk, locked_by=item.locked_by).update(
+            locked_by='', failed=failed, error=error,
+            run_at=now + _retry_delay(item.attempts))
+        if failed:
+            logger.error('Задача %s не выполнена за %s попыток', item,
+                         item.attempts)
+
+
+def _call(name, groups):
+    handler = handlers.get(name)
+    if handler is None:
+        return f'Нет обработчика задач {name}'
+    payloads = [json.loads(payload) for payload in groups]
+    try:
+        with transaction.atomic():
+            handler(payloads)
+    except Exception:
+        logger.exception('Ошибка в задачах %s (%s шт.)', name,
+                         len(payloads))
+        return traceback.format_exc()
+    return None
+
+
+def run(items):
+    """Выполняет забранные задачи одного вида. Если пачка не
+    выполнилась, задачи выполняются по одной, чтобы ошибка в одной
+    не задерживала остальные."""
+
+    if not items:
+        return
+    name = items[0].name
+    groups = defaultdict(list)
+    for item in items:
+        groups[item.payload].append(item)
+
+    error = _call(name, groups)
+    if error is None:
+        Task.objects.filter(pk__in=[item.pk for item in items]).delete()
+        return
+    for payload, same in groups.items():
+        if len(groups) > 1:
+            error = _call(name, [payload])
+        if error is None:
+            Task.objects.filter(pk__in=[item.pk for item in same]).delete()
+        else:
+            _failed(same, error)
+
+
+def work(batch_size=None, once=False, stopped=lambda: False):
+    """Выполняет задачи, пока ``stopped()`` ложно; с ``once`` —
+    пока очередь не опустеет. Возвращает число выполненных задач."""
+
+    batch_size = batch_size or settings.TASK_BATCH_SIZE
+    done = 0
+    while not stopped():
+        close_old_connections()
+        items = claim(batch_size)
+        if items:
+            run(items)
+            done += len(items)
+        elif once:
+            break
+        else:
+            time.sleep(settings.TASK_POLL_INTERVAL)
+    return done
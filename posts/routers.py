@@ -0,0 +1,67 @@
+"""Чтение с реплик для лент и запись в основную базу."""
+
+import random
+import threading
+
+from django.conf import settings
+
+_state = threading.local()
+
+
+def choose_replica():
+    return random.choice(settings.REPLICA_DATABASES)
+
+
+def begin_request():
+    _state.replica = None
+    _state.wrote = False
+
+
+def use_replica():
+    """Направляет чтение до конца запроса на одну из реплик, одну
+    и ту же для всех запросов, чтобы страница собиралась из одного
+    состояния данных."""
+
+    if settings.REPLICA_DATABASES:
+        _state.replica = choose_replica()
+
+
+def use_primary():
+    """Отменяет выбор реплики: дальнейшее чтение запроса идёт
+    в основную базу."""
+
+    _state.replica = None
+
+
+def end_request():
+    """Заканчивает запрос и возвращает, была ли в нём запись."""
+
+    wrote = getattr(_state, 'wrote', False)
+    begin_request()
+    return wrote
+
+
+class ReplicaRouter:
+    """Читает с реплики, выбранной для текущего запроса, пока в нём
+    не было записи; всё остальное идёт в основную базу ``default``."""
+
+    # noinspection PyUnusedLocal
+    def db_for_read(self, model, **hints):
+        replica = getattr(_state, 'replica', None)
+        if replica and not getattr(_state, 'wrote', False):
+            return replica
+        return 'default'
+
+    # noinspection PyUnusedLocal
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        return 'default'
+
+    # noinspection PyUnusedLocal
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    # noinspection PyUnusedLocal
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплики получают схему вместе с данными от основной базы.
+        return db == 'default'
@@ -0,0 +1,127 @@
+import re
+from collections import Counter
+from functools import reduce
+from itertools import islice
+
+from django.db.models import Count, Sum
+
+from .models import Comment, Post, SearchTerm
+from .paginators import CursorPaginator
+from .stemmer import stem
+
+# Слово из текста записи весит больше, чем из комментария к ней.
+POST_WEIGHT = 3
+COMMENT_WEIGHT = 1
+
+WORD = re.compile(r'\w+')
+CYRILLIC = re.compile(r'[а-яё]')
+STOP_WORDS = frozenset((
+    'а', 'без', 'бы', 'в', 'во', 'вот', 'все', 'вы', 'да', 'для', 'до',
+    'его', 'ее', 'её', 'если', 'же', 'за', 'и', 'из', 'или', 'к', 'как',
+    'ко', 'ли', 'мне', 'мы', 'на', 'над', 'не', 'нет', 'ни', 'но', 'о',
+    'об', 'он', 'она', 'они', 'от', 'по', 'при', 'с', 'со', 'так', 'то',
+    'ты', 'у', 'уже', 'что', 'это', 'я',
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'in', 'is',
+    'it', 'of', 'on', 'or', 'that', 'the', 'to', 'with',
+))
+MAX_TERM_LENGTH = 64
+
+
+def terms(text):
+    """Основы слов текста с числом вхождений."""
+
+    found = Counter()
+    for word in WORD.findall(text.lower()):
+        if word in STOP_WORDS:
+            continue
+        if CYRILLIC.search(word):
+            word = stem(word)
+        found[word[:MAX_TERM_LENGTH]] += 1
+    return found
+
+
+def _rows(text, weight, **fields):
+    return (SearchTerm(term=term, weight=count * weight, **fields)
+            for term, count in terms(text).items())
+
+
+def _insert(rows, batch_size=1000):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        SearchTerm.objects.bulk_create(batch)
+
+
+def index_posts(post_ids):
+    """Заново индексирует текст записей; удалённые записи пропускаются."""
+
+    SearchTerm.objects.filter(post_id__in=post_ids,
+                              comment__isnull=True).delete()
+    posts = Post.objects.filter(pk__in=post_ids).values_list('pk', 'text')
+    _insert(row for post_id, text in posts
+            for row in _rows(text, POST_WEIGHT, post_id=post_id))
+
+
+def index_comments(comment_ids):
+    SearchTerm.objects.filter(comment_id__in=comment_ids).delete()
+    comments = Comment.objects.filter(pk__in=comment_ids).values_list(
+        'pk', 'post_id', 'text')
+    _insert(row for comment_id, post_id, text in comments
+            for row in _rows(text, COMMENT_WEIGHT, post_id=post_id,
+                             comment_id=comment_id))
+
+
+def rebuild(batch_size=1000):
+    """Заново строит поисковый индекс по всем записям и комментариям."""
+
+    SearchTerm.objects.all().delete()
+    posts = Post.objects.order_by().values_list('pk', 'text')
+    _insert((
+        row for post_id, text in posts.iterator()
+        for row in _rows(text, POST_WEIGHT, post_id=post_id)
+    ), batch_size)
+    comments = Comment.objects.order_by().values_list('pk', 'post_id', 'text')
+    _insert((
+        row for comment_id, post_id, text in comments.iterator()
+        for row in _rows(text, COMMENT_WEIGHT, post_id=post_id,
+                         comment_id=comment_id)
+    ), batch_size)
+
+
+def search_posts(query):
+    """Записи, в тексте или комментариях которых есть слова запроса.
+
+    matched — число найденных разных слов запроса, score — сумма весов
+    их вхождений; по ним результаты и ранжируются.
+    """
+
+    query_terms = list(terms(query))
+    if not query_terms:
+        return Post.objects.none()
+    return Post.objects.filter(search_terms__term__in=query_terms).annotate(
+        matched=Count('search_terms__term', distinct=True),
+        score=Sum('search_terms__weight'),
+    ).select_related('author', 'group')
+
+
+def search_paginator(query, per_page=10):
+    return CursorPaginator(search_posts(query), per_page,
+                           keys=('matched', 'score', 'id'))
+
+
+def filter_indexed(queryset, query, field):
+    """Оставляет в queryset объекты, в которых есть все слова запроса;
+    ``field`` — поле SearchTerm, ссылающееся на модель queryset."""
+
+    query_terms = list(terms(query))
+    if not query_terms:
+        return queryset
+    indexed = SearchTerm.objects.filter(**{f'{field}__isnull': False})
+    if field == 'post':
+        indexed = indexed.filter(comment__isnull=True)
+    return reduce(
+        lambda result, term: result.filter(pk__in=indexed.filter(
+            term=term).values(field)),
+        query_terms, queryset)
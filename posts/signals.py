@@ -0,0 +1,151 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from . import authors, caching, counters, follows, tasks
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+
+class _DeletingPosts(set):
+    """Публикации, удаляемые в транзакции: их каскадно удаляемым
+    комментариям не нужно по одному обновлять счётчик и сбрасывать кэш.
+
+    Множество хранится среди обработчиков on_commit транзакции, поэтому
+    при её откате (или откате точки сохранения) Django забывает его
+    вместе с остальными обработчиками.
+    """
+
+    def __call__(self):
+        pass
+
+
+def _deleting(post_id, using):
+    connection = transaction.get_connection(using)
+    return any(isinstance(entry[1], _DeletingPosts) and post_id in entry[1]
+               for entry in connection.run_on_commit)
+
+
+def _mark_deleting(post_id, using):
+    # Удаление всегда идёт в транзакции: Collector.delete открывает её.
+    connection = transaction.get_connection(using)
+    savepoints = set(connection.savepoint_ids)
+    for entry in connection.run_on_commit:
+        if isinstance(entry[1], _DeletingPosts) and entry[0] == savepoints:
+            entry[1].add(post_id)
+            return
+    transaction.on_commit(_DeletingPosts([post_id]), using)
+
+
+# noinspection PyUnusedLocal
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+# noinspection PyUnusedLocal
+@receiver(pre_save, sender=Post)
+def post_changing(sender, instance, raw, **kwargs):
+    instance._previous_group_id = instance._previous_image = None
+    if instance.pk and not raw:
+        instance._previous_group_id, instance._previous_image = (
+            Post.objects.filter(pk=instance.pk).values_list(
+                'group_id', 'image').first() or (None, None))
+
+
+# noinspection PyUnusedLocal
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    if created:
+        counters.change_user_stats(instance.author_id, posts_count=1)
+        authors.invalidate(instance.author_id)
+        tasks.push_posts.enqueue(instance.pk)
+    previous_image = getattr(instance, '_previous_image', None)
+    if instance.image.name != previous_image:
+        counters.change_image_references(previous_image, -1)
+        counters.change_image_references(instance.image.name, 1)
+    tasks.index_posts.enqueue(instance.pk)
+    caching.bump(*caching.post_scopes(
+        instance.author_id, instance.group_id,
+        getattr(instance, '_previous_group_id', None)))
+
+
+# noinspection PyUnusedLocal
+@receiver(pre_delete, sender=Post)
+def post_deleting(sender, instance, using, **kwargs):
+    _mark_deleting(instance.pk, using)
+
+
+# noinspection PyUnusedLocal
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.change_user_stats(instance.author_id, posts_count=-1)
+    counters.change_image_references(instance.image.name, -1)
+    authors.invalidate(instance.author_id)
+    caching.bump(*caching.post_scopes(instance.author_id, instance.group_id))
+
+
+def _comment_changed(comment, delta, using):
+    if _deleting(comment.post_id, using):
+        return
+    counters.change_comments_count(comment.post_id, delta)
+    post = Post.objects.filter(pk=comment.post_id).values(
+        'author_id', 'group_id').first()
+    if post:
+        caching.bump(*caching.post_scopes(post['author_id'],
+                                          post['group_id']))
+
+
+# noinspection PyUnusedLocal
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw, using, **kwargs):
+    if raw:
+        return
+    if created:
+        _comment_changed(instance, 1, using)
+        tasks.mail_comments.enqueue(instance.pk)
+    tasks.index_comments.enqueue(instance.pk)
+
+
+# noinspection PyUnusedLocal
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, using, **kwargs):
+    _comment_changed(instance, -1, using)
+
+
+# noinspection PyUnusedLocal
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    caching.bump('posts', 'groups', f'group:{instance.pk}')
+
+
+# noinspection PyUnusedLocal
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        follows.apply(instance.user_id, [instance.author_id], 1)
+        follows.invalidate(instance.user_id, [instance.author_id])
+
+
+# noinspection PyUnusedLocal
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    follows.apply(instance.user_id, [instance.author_id], -1)
+    follows.invalidate(instance.user_id, [instance.author_id])
+
+
+# noinspection PyUnusedLocal
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    # PRAGMA выполняются через соединение DB-API в обход обёрток курсора,
+    # чтобы не попадать в счёт запросов представления.
+    if connection.vendor != 'sqlite':
+        return
+    for name, value in settings.SQLITE_PRAGMAS.items():
+        connection.connection.execute(f'PRAGMA {name} = {value}')
@@ -0,0 +1,74 @@
+"""Стеммер русского языка по алгоритму Snowball (М. Портер)."""
+
+import re
+
+VOWELS = 'аеиоуыэюя'
+
+PERFECTIVE_GERUND = re.compile(
+    r'(ив|ивши|ившись|ыв|ывши|ывшись|(?<=[ая])(в|вши|вшись))$')
+REFLEXIVE = re.compile(r'(ся|сь)$')
+ADJECTIVE = re.compile(
+    r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых'
+    r'|ую|юю|ая|яя|ою|ею)$')
+PARTICIPLE = re.compile(r'(ивш|ывш|ующ|(?<=[ая])(ем|нн|вш|ющ|щ))$')
+VERB = re.compile(
+    r'(ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено'
+    r'|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю'
+    r'|(?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно))$')
+NOUN = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем'
+    r'|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$')
+DERIVATIONAL = re.compile(r'(ост|ость)$')
+SUPERLATIVE = re.compile(r'(ейш|ейше)$')
+
+
+def _region(word, start=0):
+    """Начало области после первого сочетания «гласная, согласная»."""
+
+    for index in range(start + 1, len(word)):
+        if word[index] not in VOWELS and word[index - 1] in VOWELS:
+            return index + 1
+    return len(word)
+
+
+def _strip(pattern, word):
+    return pattern.sub('', word, count=1)
+
+
+def stem(word):
+    word = word.lower().replace('ё', 'е')
+    rv = next((index + 1 for index, letter in enumerate(word)
+               if letter in VOWELS), len(word))
+    r2 = _region(word, _region(word))
+    prefix, ending = word[:rv], word[rv:]
+
+    # Шаг 1: деепричастие, либо возвратная частица и окончание
+    # прилагательного (с причастием), глагола или существительного.
+    stripped = _strip(PERFECTIVE_GERUND, ending)
+    if stripped == ending:
+        ending = _strip(REFLEXIVE, ending)
+        stripped = _strip(ADJECTIVE, ending)
+        if stripped != ending:
+            stripped = _strip(PARTICIPLE, stripped)
+        else:
+            stripped = _strip(VERB, ending)
+            if stripped == ending:
+                stripped = _strip(NOUN, ending)
+    ending = stripped
+
+    # Шаг 2.
+    if ending.endswith('и'):
+        ending = ending[:-1]
+
+    # Шаг 3: словообразовательный суффикс только в R2.
+    match = DERIVATIONAL.search(ending)
+    if match and rv + match.start() >= r2:
+        ending = ending[:match.start()]
+
+    # Шаг 4.
+    stripped = _strip(SUPERLATIVE, ending)
+    if stripped != ending or ending.endswith('нн'):
+        ending = stripped[:-1] if stripped.endswith('нн') else stripped
+    elif ending.endswith('ь'):
+        ending = ending[:-1]
+    return prefix + ending
@@ -0,0 +1,121 @@
+"""Хранилища файлов: изображения записей с адресацией по содержимому
+и статика с хэшами в именах и заранее сжатыми копиями."""
+
+import gzip
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Статика, которую стоит сжимать; изображения и шрифты WOFF уже сжаты.
+COMPRESSIBLE = ('.css', '.js', '.map', '.svg', '.txt', '.html', '.json',
+                '.xml', '.ico', '.ttf', '.eot')
+COMPRESS_MIN_SIZE = 1024
+
+
+def content_name(content, name):
+    """Имя файла по SHA-256 содержимого с расширением ``name``.
+    Готовый хэш берётся из атрибута ``sha256`` загрузки, если он есть."""
+
+    digest = getattr(content, 'sha256', None)
+    if digest is None:
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+    _, extension = os.path.splitext(name)
+    return f'{digest}{extension.lower()}'
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Сохраняет файл под именем из SHA-256 содержимого в каталоге
+    исходного имени. Файл с тем же содержимым сохраняется один раз:
+    повторное сохранение возвращает имя уже записанного файла.
+
+    Одинаковое имя означает одинаковое содержимое, поэтому файл
+    записывается заменой, без подбора свободного имени. Время изменения
+    уже сохранённого файла обновляется, чтобы collect_media не удалил
+    его, пока запись со ссылкой на него ещё не сохранена.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        name = posixpath.join(posixpath.dirname(name),
+                              content_name(content, name))
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            os.utime(full_path)
+            return name
+
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        if hasattr(content, 'temporary_file_path'):
+            file_move_safe(content.temporary_file_path(), full_path,
+                           allow_overwrite=True)
+        else:
+            with tempfile.NamedTemporaryFile(dir=directory,
+                                             delete=False) as file:
+                for chunk in content.chunks():
+                    file.write(chunk)
+            os.replace(file.name, full_path)
+        # Временные файлы создаются с правами 0600, веб-сервер должен
+        # читать сохранённый.
+        os.chmod(full_path, self.file_permissions_mode or 0o644)
+        return name
+
+
+content_storage = ContentAddressedStorage()
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Во время collectstatic кроме копий с хэшем в имени сохраняет
+    рядом сжатые gzip (.gz) и, если установлен brotli, Brotli (.br)
+    копии, когда они заметно меньше; их отдаёт FileServingMiddleware."""
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in sorted(set(paths) | set(self.hashed_files.values())):
+            if name.endswith(COMPRESSIBLE):
+                self.compress(name)
+
+    def compress(self, name):
+        path = self.path(name)
+        with open(path, 'rb') as file:
+            data = file.read()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return
+        variants = [('.gz', gzip.compress(data, 9, mtime=0))]
+        if brotli is not None:
+            variants.append(('.br', brotli.compress(data)))
+        for suffix, compressed in variants:
+            if len(compressed) < len(data) * 0.95:
+                with open(path + suffix, 'wb') as file:
+                    file.write(compressed)
+
+    def read_manifest(self):
+        content = super().read_manifest()
+        self.manifest_found = content is not None
+        return content
+
+    def stored_name(self, name):
+        if not self.manifest_found:
+            # collectstatic ещё не выполнялся (разработка, тесты):
+            # ссылаемся на файл без хэша. Файл, которого нет в собранном
+            # манифесте, по-прежнему ошибка.
+            return name
+        return super().stored_name(name)
@@ -0,0 +1,93 @@
+"""Фоновые задачи, которые ставят изменения записей, комментариев
+и подписок; выполняет их команда run_tasks."""
+
+from django.core.mail import EmailMessage, get_connection
+
+from . import caching, search, thumbnails, timelines
+from .models import Comment, User
+from .queue import task
+
+
+@task('timelines.push')
+def push_posts(post_ids):
+    users = timelines.push_posts(post_ids)
+    if users:
+        caching.bump(*(f'follow:{user_id}' for user_id in users))
+
+
+@task('timelines.backfill')
+def backfill(follows):
+    users = {user_id for user_id, author_id in follows
+             if timelines.backfill(user_id, author_id)}
+    if users:
+        caching.bump(*(f'follow:{user_id}' for user_id in users))
+
+
+@task('timelines.materialize')
+def materialize(author_ids):
+    users = set()
+    for author_id in author_ids:
+        users.update(timelines.materialize(author_id))
+    if users:
+        caching.bump(*(f'follow:{user_id}' for user_id in users))
+
+
+@task('search.index_posts')
+def index_posts(post_ids):
+    search.index_posts(post_ids)
+
+
+@task('search.index_comments')
+def index_comments(comment_ids):
+    search.index_comments(comment_ids)
+
+
+@task('thumbnails.generate')
+def generate_thumbnails(post_ids):
+    for post_id in post_ids:
+        post = thumbnails.generate(post_id)
+        if post:
+            # Ленты с заглушкой вместо изображения нужно отрисовать заново.
+            caching.bump(*caching.post_scopes(post['author_id'],
+                                              post['group_id']))
+
+
+def _send(messages):
+    if messages:
+        with get_connection() as connection:
+            connection.send_messages(messages)
+
+
+@task('mail.comment')
+def mail_comments(comment_ids):
+    """Письма авторам записей о новых комментариях, одним соединением
+    с почтовым сервером на пачку."""
+
+    comments = Comment.objects.filter(pk__in=comment_ids).exclude(
+        post__author__email='').select_related('author', 'post__author')
+    _send([
+        EmailMessage(
+            subject=f'Новый комментарий от {comment.author.username}',
+            body=f'{comment.author.username} прокомментировал вашу '
+                 f'запись:\n\n{comment.text}\n\n'
+                 f'{comment.post.get_absolute_url()}',
+            to=[comment.post.author.email])
+        for comment in comments if comment.author_id != comment.post.author_id
+    ])
+
+
+@task('mail.follow')
+def mail_follows(follows):
+    """Письма авторам о новых подписчиках."""
+
+    users = User.objects.in_bulk({user_id for pair in follows
+                                  for user_id in pair})
+    _send([
+        EmailMessage(
+            subject=f'Новый подписчик: {users[user_id].username}',
+            body=f'{users[user_id].username} подписался на ваши записи.',
+            to=[users[author_id].email])
+        for user_id, author_id in follows
+        if user_id in users and author_id in users
+        and users[author_id].email
+    ])
@@ -0,0 +1,64 @@
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.safestring import mark_safe
+
+from posts.caching import generation
+from posts.images import variants
+from posts.thumbnails import ensure_variants
+
+register = template.Library()
+
+CONTROLS_MARKER = '<!-- post-controls -->'
+
+
+def card_key(post, version):
+    return (f'post_card:{post.pk}:{post.updated.timestamp()}:'
+            f'{post.comments_count}:{version}')
+
+
+def render_cards(context, posts):
+    """Собирает карточки записей из кэша, отрисовывая недостающие,
+    и подставляет в них кнопки для текущего пользователя."""
+
+    engine = context.template.engine
+    version = generation('groups')
+    keys = [card_key(post, version) for post in posts]
+    cards = cache.get_many(keys)
+
+    missing = {}
+    card_template = engine.get_template('includes/post_card.html')
+    ensure_variants(
+        post for key, post in zip(keys, posts) if key not in cards)
+    for key, post in zip(keys, posts):
+        if key in cards:
+            continue
+        picture = variants(post)
+        cards[key] = card_template.render(template.Context({
+            'post': post,
+            'picture': picture,
+            'controls': mark_safe(CONTROLS_MARKER),
+        }))
+        # Карточку с заглушкой вместо изображения не кэшируем.
+        if picture or not post.image:
+            missing[key] = cards[key]
+    if missing:
+        cache.set_many(missing, settings.POST_CARD_CACHE_TIMEOUT)
+
+    html = []
+    controls_template = engine.get_template('includes/post_controls.html')
+    for key, post in zip(keys, posts):
+        with context.push(post=post):
+            controls = controls_template.render(context)
+        html.append(cards[key].replace(CONTROLS_MARKER, controls, 1))
+    return mark_safe('\n'.join(html))
+
+
+@register.simple_tag(takes_context=True)
+def post_card(context, post):
+    return render_cards(context, [post])
+
+
+@register.simple_tag(takes_context=True)
+def post_cards(context, posts):
+    return render_cards(context, list(posts))
@@ -0,0 +1,38 @@
+"""Базовые классы тестов.
+
+Тесты работают с тем же двухуровневым кэшем, что и сайт, но общий
+уровень хранится в памяти процесса: запуск тестов не читает и не
+очищает кэш запущенного рядом сервера.
+"""
+
+from django import test
+
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'posts.cache_backends.TieredCache',
+        'LOCATION': 'tests',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'LOCAL_KEY_PREFIXES': ('template.cache.', 'post_card:'),
+        },
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests_shared',
+    },
+}
+
+
+@test.override_settings(CACHES=TEST_CACHES)
+class SimpleTestCase(test.SimpleTestCase):
+    pass
+
+
+@test.override_settings(CACHES=TEST_CACHES)
+class TransactionTestCase(test.TransactionTestCase):
+    pass
+
+
+@test.override_settings(CACHES=TEST_CACHES)
+class TestCase(test.TestCase):
+    pass
@@ -0,0 +1,123 @@
+import asyncio
+from concurrent.futures import Executor, Future
+from http import HTTPStatus
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpRequest
+from django.middleware.csrf import get_token
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from posts.asgi import ASGIHandler
+from posts.models import Comment, Post, User
+from posts.tests.cases import TestCase
+
+
+class InlineExecutor(Executor):
+    """Выполняет задачи в текущем потоке, чтобы представления видели
+    транзакцию теста."""
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as error:
+            future.set_exception(error)
+        return future
+
+
+# noinspection PyUnresolvedReferences
+@override_settings(THUMBNAIL_WORKERS=0)
+class ASGIHandlerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='test_user')
+        cls.post = Post.objects.create(text='Test text', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.handler = ASGIHandler(executor=InlineExecutor())
+
+    def request(self, method, path, chunks=(b'',), headers=()):
+        messages = list(chunks)
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': messages.pop(0),
+                    'more_body': bool(messages)}
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(self.handler({
+            'type': 'http', 'method': method, 'path': path,
+            'query_string': b'', 'server': ('testserver', 80),
+            'headers': [(name.encode(), value.encode())
+                        for name, value in headers],
+        }, receive, send))
+        self.unread = len(messages)
+        start, *body = sent
+        self.assertFalse(body[-1].get('more_body', False))
+        return start, b''.join(message.get('body', b'') for message in body)
+
+    def test_get_matches_wsgi(self):
+        """Страница через ASGI совпадает со страницей через WSGI."""
+
+        url = reverse('posts:post', args=[self.user.username, self.post.pk])
+        expected = Client().get(url)
+        cache.clear()
+
+        start, body = self.request('GET', url)
+
+        self.assertEqual(start['status'], HTTPStatus.OK)
+        self.assertIn((b'content-type', b'text/html; charset=utf-8'),
+                      start['headers'])
+        self.assertEqual(body, expected.content)
+
+    def test_post_body_received_in_chunks(self):
+        """Тело формы, пришедшее частями без Content-Length, собирается
+        целиком до вызова представления."""
+
+        client = Client()
+        client.force_login(self.user)
+        request = HttpRequest()
+        token = get_token(request)
+        body = urlencode({'csrfmiddlewaretoken': token,
+                          'text': 'Комментарий через ASGI'}).encode()
+        cookies = '; '.join(f'{name}={value}' for name, value in (
+            (settings.SESSION_COOKIE_NAME,
+             client.cookies[settings.SESSION_COOKIE_NAME].value),
+            (settings.CSRF_COOKIE_NAME, request.META['CSRF_COOKIE'])))
+
+        start, _ = self.request(
+            'POST', reverse('posts:add_comment',
+                            args=[self.user.username, self.post.pk]),
+            chunks=[body[:10], body[10:20], body[20:]],
+            headers=[('content-type', 'application/x-www-form-urlencoded'),
+                     ('cookie', cookies)])
+
+        self.assertEqual(start['status'], HTTPStatus.FOUND)
+        self.assertTrue(Comment.objects.filter(
+            post=self.post, text='Комментарий через ASGI').exists())
+
+    @override_settings(IMAGE_UPLOAD_MAX_BYTES=10,
+                       DATA_UPLOAD_MAX_MEMORY_SIZE=10)
+    def test_large_body_rejected_early(self):
+        """Тело длиннее предела отклоняется ответом 413 по заявленной
+        длине или как только принято больше предела."""
+
+        url = reverse('posts:new_post')
+        chunks = [b'x' * 15, b'x' * 15, b'x' * 15]
+
+        start, _ = self.request('POST', url, chunks=chunks,
+                                headers=[('content-length', '45')])
+        self.assertEqual(start['status'],
+                         HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+        self.assertEqual(self.unread, 3)
+
+        start, _ = self.request('POST', url, chunks=chunks)
+        self.assertEqual(start['status'],
+                         HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+        self.assertEqual(self.unread, 1)
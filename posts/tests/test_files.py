@@ -0,0 +1,140 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from http import HTTPStatus
+
+from django.test import override_settings
+
+from posts.storage import CompressedManifestStaticFilesStorage
+from posts.tests.cases import SimpleTestCase
+
+STYLE = b'body { color: black; }\n' * 100
+HASHED_NAME = 'css/style.0123456789ab.css'
+
+
+# noinspection PyUnresolvedReferences
+class FileServingTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(cls.root, 'css'))
+        for name in ('css/style.css', HASHED_NAME):
+            with open(os.path.join(cls.root, name), 'wb') as file:
+                file.write(STYLE)
+        with open(os.path.join(cls.root, 'css/style.css.gz'), 'wb') as file:
+            file.write(gzip.compress(STYLE))
+        cls.settings = override_settings(STATIC_ROOT=cls.root,
+                                         STATIC_MAX_AGE=60)
+        cls.settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings.disable()
+        shutil.rmtree(cls.root, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_cache_control(self):
+        """Файл с хэшем в имени кэшируется навсегда, остальные —
+        на STATIC_MAX_AGE секунд."""
+
+        hashed = self.client.get(f'/static/{HASHED_NAME}')
+        plain = self.client.get('/static/css/style.css')
+
+        self.assertEqual(hashed['Cache-Control'],
+                         'public, max-age=31536000, immutable')
+        self.assertEqual(plain['Cache-Control'], 'public, max-age=60')
+        self.assertEqual(b''.join(hashed.streaming_content), STYLE)
+
+    def test_compressed_variant(self):
+        """Клиенту, принимающему gzip, отдаётся сжатая копия."""
+
+        response = self.client.get('/static/css/style.css',
+                                   HTTP_ACCEPT_ENCODING='gzip, deflate')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(
+            gzip.decompress(b''.join(response.streaming_content)), STYLE)
+
+    def test_not_modified(self):
+        """Повторный запрос с тем же ETag получает 304 без тела."""
+
+        etag = self.client.get('/static/css/style.css')['ETag']
+
+        response = self.client.get('/static/css/style.css',
+                                   HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_range(self):
+        """Диапазон отдаётся ответом 206, недостижимый — 416."""
+
+        response = self.client.get('/static/css/style.css',
+                                   HTTP_RANGE='bytes=5-9',
+                                   HTTP_ACCEPT_ENCODING='gzip')
+        unsatisfiable = self.client.get('/static/css/style.css',
+                                        HTTP_RANGE=f'bytes={len(STYLE)}-')
+
+        self.assertEqual(response.status_code, HTTPStatus.PARTIAL_CONTENT)
+        self.assertEqual(response['Content-Range'],
+                         f'bytes 5-9/{len(STYLE)}')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response.streaming_content), STYLE[5:10])
+        self.assertEqual(unsatisfiable.status_code,
+                         HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+
+    def test_head(self):
+        """HEAD возвращает заголовки файла без тела."""
+
+        response = self.client.head('/static/css/style.css')
+
+        self.assertEqual(response['Content-Length'], str(len(STYLE)))
+        self.assertEqual(response.content, b'')
+
+    def test_outside_root(self):
+        """Пути за пределами STATIC_ROOT не отдаются."""
+
+        response = self.client.get('/static/../../etc/passwd')
+
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_compress(self):
+        """Хранилище статики сохраняет сжатую копию только там, где она
+        заметно меньше исходного файла."""
+
+        storage = CompressedManifestStaticFilesStorage(location=self.root)
+        with open(os.path.join(self.root, 'random.js'), 'wb') as file:
+            file.write(os.urandom(4096))
+
+        storage.compress('css/style.css')
+        storage.compress('random.js')
+
+        with open(os.path.join(self.root, 'css/style.css.gz'), 'rb') as file:
+            self.assertEqual(gzip.decompress(file.read()), STYLE)
+        self.assertFalse(os.path.exists(
+            os.path.join(self.root, 'random.js.gz')))
+
+    def test_stored_name(self):
+        """Без манифеста ссылки ведут на файлы без хэша, а файл, которого
+        нет в собранном манифесте, — ошибка."""
+
+        storage = CompressedManifestStaticFilesStorage(location=self.root)
+        self.assertEqual(storage.stored_name('css/style.css'),
+                         'css/style.css')
+
+        manifest = os.path.join(self.root, storage.manifest_name)
+        with open(manifest, 'w') as file:
+            json.dump({'version': '1.0',
+                       'paths': {'css/style.css': HASHED_NAME}}, file)
+        try:
+            storage = CompressedManifestStaticFilesStorage(
+                location=self.root)
+            self.assertEqual(storage.stored_name('css/style.css'),
+                             HASHED_NAME)
+            with self.assertRaises(ValueError):
+                storage.stored_name('css/missing.css')
+        finally:
+            os.remove(manifest)
@@ -1,16 +1,26 @@
+import hashlib
+import io
+import os
 import shutil
 import tempfile
 
+from unittest import mock
+
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from PIL import Image
 
 from posts.models import Comment, Group, Post, User
+from posts.tests.cases import TestCase
 
 
 # noinspection PyUnresolvedReferences
-@override_settings(MEDIA_ROOT=tempfile.mkdtemp(dir=settings.BASE_DIR))
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(dir=settings.BASE_DIR),
+                   THUMBNAIL_WORKERS=0)
 class PostFormTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -24,6 +34,7 @@ class PostFormTests(TestCase):
             b'\x02\x00\x01\x00\x00\x02\x02\x0C'
             b'\x0A\x00\x3B'
         )
+        cls.small_gif_sha256 = hashlib.sha256(cls.small_gif).hexdigest()
 
         cls.user = User.objects.create_user(
             username='test_user',
@@ -81,7 +92,7 @@ class PostFormTests(TestCase):
         self.assertEqual(post.text, form_data['text'])
         self.assertEqual(post.group.id, form_data['group'])
         self.assertEqual(post.author, self.user)
-        self.assertEqual(post.image, 'posts/small_1.gif')
+        self.assertEqual(post.image, f'posts/{self.small_gif_sha256}.gif')
         self.assertEqual(response.status_code, 200)
 
     def test_edit_post(self):
@@ -121,9 +132,97 @@ class PostFormTests(TestCase):
         self.assertEqual(edited_post.text, form_data['text'])
         self.assertEqual(edited_post.group_id, form_data['group'])
         self.assertEqual(edited_post.image,
-                         f"posts/{form_data['image'].name}")
+                         f'posts/{self.small_gif_sha256}.gif')
         self.assertNotIn(edited_post, group_posts_context)
 
+    @override_settings(IMAGE_MAX_SIZE=100)
+    def test_create_post_strips_exif_and_downscales_image(self):
+        """Загруженное изображение уменьшается и теряет EXIF."""
+
+        exif = Image.Exif()
+        exif[0x010F] = 'Test camera'
+        buffer = io.BytesIO()
+        Image.new('RGB', (400, 200), 'red').save(buffer, 'JPEG',
+                                                 exif=exif.tobytes())
+        uploaded = SimpleUploadedFile(
+            name='photo.jpg',
+            content=buffer.getvalue(),
+            content_type='image/jpeg'
+        )
+
+        self.authorized_client.post(
+            reverse('posts:new_post'),
+            data={'text': 'Photo post', 'image': uploaded})
+
+        post = Post.objects.get(text='Photo post')
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (100, 50))
+            self.assertNotIn('exif', image.info)
+            self.assertFalse(image.getexif())
+
+    @override_settings(IMAGE_MAX_PIXELS=1)
+    def test_create_post_rejects_huge_image(self):
+        """Изображение больше IMAGE_MAX_PIXELS не принимается."""
+
+        uploaded = SimpleUploadedFile(
+            name='huge.gif',
+            content=PostFormTests.small_gif,
+            content_type='image/gif'
+        )
+
+        response = self.authorized_client.post(
+            reverse('posts:new_post'),
+            data={'text': 'Huge post', 'image': uploaded})
+
+        self.assertFormError(response, 'form', 'image',
+                             'Изображение слишком большое: '
+                             'не больше 1 пикселей.')
+        self.assertFalse(Post.objects.filter(text='Huge post').exists())
+
+    def test_repeated_upload_stored_once(self):
+        """Одинаковые изображения сохраняются одним файлом, названным
+        по содержимому; временных файлов не остаётся."""
+
+        for index in range(2):
+            self.authorized_client.post(reverse('posts:new_post'), data={
+                'text': f'Same image {index}',
+                'image': SimpleUploadedFile(f'copy_{index}.GIF',
+                                            self.small_gif, 'image/gif'),
+            })
+
+        posts = Post.objects.filter(text__startswith='Same image')
+        self.assertEqual({post.image.name for post in posts},
+                         {f'posts/{self.small_gif_sha256}.gif'})
+        names = os.listdir(os.path.join(settings.MEDIA_ROOT, 'posts'))
+        self.assertEqual([name for name in names if name.endswith('.upload')],
+                         [])
+        self.assertEqual(
+            [name for name in names if name.endswith('.gif')
+             and name.startswith(self.small_gif_sha256)],
+            [f'{self.small_gif_sha256}.gif'])
+
+    @override_settings(IMAGE_UPLOAD_MAX_BYTES=1024)
+    def test_create_post_rejects_large_file_while_streaming(self):
+        """Файл больше IMAGE_UPLOAD_MAX_BYTES отклоняется до того,
+        как запрос прочитан целиком."""
+
+        buffer = io.BytesIO()
+        Image.effect_noise((128, 128), 64).save(buffer, 'PNG')
+        self.assertGreater(len(buffer.getvalue()), 1024)
+        uploaded = SimpleUploadedFile('noise.png', buffer.getvalue(),
+                                      'image/png')
+
+        with mock.patch('posts.uploads.ImageUploadHandler.file_complete'
+                        ) as file_complete:
+            response = self.authorized_client.post(
+                reverse('posts:new_post'),
+                data={'text': 'Large post', 'image': uploaded})
+
+        self.assertFalse(file_complete.called)
+        self.assertFormError(response, 'form', 'image',
+                             'Файл слишком большой: не больше 1024 байт.')
+        self.assertFalse(Post.objects.filter(text='Large post').exists())
+
     def test_comment_post_for_authorized(self):
         """Авторизированный пользователь может комментировать посты."""
 
@@ -147,6 +246,29 @@ class PostFormTests(TestCase):
         self.assertTrue(
             Comment.objects.filter(text=form_data['text']).exists())
 
+    def test_comment_post_doesnt_load_comments(self):
+        """При добавлении комментария существующие комментарии
+        не читаются из базы."""
+
+        user = PostFormTests.user
+        post = PostFormTests.post
+        Comment.objects.bulk_create(
+            Comment(post=post, author=user, text=f'Comment {index}')
+            for index in range(5))
+        url = reverse('posts:add_comment',
+                      kwargs={'username': user.username, 'post_id': post.id})
+
+        with CaptureQueriesContext(connection) as queries:
+            self.authorized_client.post(url, data={'text': 'New comment'})
+
+        comment_table = Comment._meta.db_table
+        self.assertFalse([
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('SELECT')
+            and f'FROM "{comment_table}"' in query['sql']
+        ])
+        self.assertTrue(Comment.objects.filter(text='New comment').exists())
+
     def test_comment_post_redirects_unauthorized(self):
         """Неавторизированный пользователь перенаправляется
         на страницу авторизации."""
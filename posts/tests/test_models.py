@@ -1,6 +1,35 @@
-from django.test import TestCase
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import skipUnless
 
-from posts.models import Group, Post, User
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, transaction
+from django.db.models.signals import post_delete
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.test import Client, override_settings
+
+from posts import counters, images, thumbnails
+from posts.models import (Comment, Follow, Group, Post, SearchTerm,
+                          StoredImage, TimelineEntry, User, UserStats)
+from posts.tests.cases import TestCase
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
 
 
 # noinspection PyUnresolvedReferences
@@ -68,3 +97,459 @@ class PostModelTests(TestCase):
         for model, model_str in model_as_str.items():
             with self.subTest(model=model):
                 self.assertEqual(str(model), model_str)
+
+
+# noinspection PyUnresolvedReferences
+class CountersTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(
+            username='test_author',
+        )
+        cls.reader = User.objects.create_user(
+            username='test_reader',
+        )
+
+    def assertStats(self, user, **expected):
+        stats = UserStats.objects.get(user=user)
+        for field, value in expected.items():
+            with self.subTest(user=user.username, field=field):
+                self.assertEqual(getattr(stats, field), value)
+
+    def test_comments_count(self):
+        """comments_count меняется при создании и удалении комментария."""
+
+        post = Post.objects.create(text='Post', author=self.author)
+        comments = [
+            Comment.objects.create(text=f'Comment {i}', post=post,
+                                   author=self.reader)
+            for i in range(3)
+        ]
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 3)
+
+        comments[0].delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 2)
+
+    def test_comments_count_after_failed_delete(self):
+        """Прерванное удаление записи не отключает обновление счётчика
+        её комментариев."""
+
+        post = Post.objects.create(text='Post', author=self.author)
+        Comment.objects.create(text='Comment', post=post, author=self.reader)
+
+        def fail(**kwargs):
+            raise DatabaseError
+
+        post_delete.connect(fail, sender=Comment)
+        try:
+            with self.assertRaises(DatabaseError), transaction.atomic():
+                post.delete()
+        finally:
+            post_delete.disconnect(fail, sender=Comment)
+        Comment.objects.create(text='Comment', post=post, author=self.reader)
+
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 2)
+
+    def test_user_stats(self):
+        """Счётчики пользователя меняются при создании и удалении
+        записей и подписок, в том числе каскадном."""
+
+        post = Post.objects.create(text='Post', author=self.author)
+        Comment.objects.create(text='Comment', post=post, author=self.author)
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+
+        self.assertStats(self.author, posts_count=1, followers_count=1,
+                         following_count=0)
+        self.assertStats(self.reader, posts_count=0, followers_count=0,
+                         following_count=1)
+
+        post.delete()
+        follow.delete()
+        self.assertStats(self.author, posts_count=0, followers_count=0)
+        self.assertStats(self.reader, following_count=0)
+
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.reader.delete()
+        self.assertStats(self.author, followers_count=0)
+
+    def test_recount_counters_command(self):
+        """Команда recount_counters исправляет расхождения счётчиков."""
+
+        post = Post.objects.create(text='Post', author=self.author)
+        Comment.objects.create(text='Comment', post=post, author=self.reader)
+        Follow.objects.create(user=self.reader, author=self.author)
+        Post.objects.update(comments_count=10)
+        UserStats.objects.update(posts_count=7, followers_count=0)
+        UserStats.objects.filter(user=self.reader).delete()
+
+        call_command('recount_counters', stdout=StringIO())
+
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertStats(self.author, posts_count=1, followers_count=1)
+        self.assertStats(self.reader, posts_count=0, following_count=1)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(dir=settings.BASE_DIR))
+class GenerateDataTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_generate_data_command(self):
+        """Команда generate_data создаёт согласованные данные."""
+
+        call_command('generate_data', users=20, groups=2, posts=100,
+                     comments=200, follows=5, image_pool=1,
+                     stdout=StringIO())
+
+        self.assertEqual(User.objects.count(), 20)
+        self.assertEqual(Post.objects.count(), 100)
+        self.assertEqual(Comment.objects.count(), 200)
+        self.assertTrue(Follow.objects.exists())
+        self.assertTrue(TimelineEntry.objects.exists())
+        self.assertTrue(SearchTerm.objects.exists())
+        self.assertFalse(Post.objects.filter(
+            image__gt='', image_widths='').exists())
+        self.assertEqual(counters.recount_comments(), 0)
+        self.assertEqual(counters.recount_user_stats(), 0)
+        self.assertEqual(counters.recount_image_references(), 0)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(dir=settings.BASE_DIR),
+                   THUMBNAIL_WORKERS=0)
+class MediaStorageTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+
+    def create_post(self, name):
+        return Post.objects.create(
+            text='Post', author=self.author,
+            image=SimpleUploadedFile(name, SMALL_GIF, 'image/gif'))
+
+    def references(self, name):
+        return StoredImage.objects.filter(name=name).values_list(
+            'references', flat=True).first()
+
+    def test_images_stored_by_content_with_references(self):
+        """Одинаковые изображения хранятся одним файлом, названным по
+        содержимому, со счётчиком ссылающихся записей."""
+
+        post = self.create_post('first.gif')
+        other = self.create_post('second.GIF')
+        name = f'posts/{hashlib.sha256(SMALL_GIF).hexdigest()}.gif'
+
+        self.assertEqual(post.image.name, name)
+        self.assertEqual(other.image.name, name)
+        self.assertEqual(self.references(name), 2)
+
+        other.image = ''
+        other.save()
+        self.assertEqual(self.references(name), 1)
+        post.delete()
+        self.assertEqual(self.references(name), 0)
+        self.assertTrue(default_storage.exists(name))
+
+    def test_collect_media_deletes_unreferenced_files(self):
+        """collect_media удаляет файлы без ссылок с их вариантами
+        и оставляет используемые и свежие."""
+
+        kept = self.create_post('kept.gif')
+        thumbnails.generate(kept.pk)
+        kept.refresh_from_db()
+        storage = default_storage
+        storage.save('posts/orphan.gif', ContentFile(SMALL_GIF))
+        storage.save('posts/orphan_320w.jpg', ContentFile(b'variant'))
+        storage.save('posts/abandoned.upload', ContentFile(b'upload'))
+        # Ссылки на изображение записи потеряны массовым обновлением.
+        StoredImage.objects.update(references=0)
+
+        output = StringIO()
+        call_command('collect_media', grace=3600, stdout=output)
+        self.assertTrue(storage.exists('posts/orphan.gif'))
+
+        output = StringIO()
+        call_command('collect_media', grace=0, stdout=output)
+
+        self.assertEqual(self.references(kept.image.name), 1)
+        self.assertTrue(storage.exists(kept.image.name))
+        self.assertTrue(storage.exists(
+            images.variant_name(kept.image.name, 320, 'jpg')))
+        for name in ('posts/orphan.gif', 'posts/orphan_320w.jpg',
+                     'posts/abandoned.upload'):
+            self.assertFalse(storage.exists(name))
+        reclaimed = len(SMALL_GIF) + len(b'variant') + len(b'upload')
+        self.assertIn(f'Освобождено: {reclaimed} байт', output.getvalue())
+
+
+class TransferTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(title='Group', slug='group',
+                                          description='Description')
+        self.post = Post.objects.create(text='Первая запись',
+                                        author=self.author, group=self.group)
+        Comment.objects.create(text='Комментарий', post=self.post,
+                               author=self.reader)
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def snapshot(self):
+        return (
+            list(Group.objects.values_list('pk', 'slug', 'title')),
+            list(Post.objects.values_list(
+                'pk', 'author__username', 'group__slug', 'text', 'pub_date',
+                'comments_count')),
+            list(Comment.objects.values_list(
+                'pk', 'post_id', 'author__username', 'text', 'created')),
+            list(Follow.objects.values_list('user__username',
+                                            'author__username')),
+            list(UserStats.objects.values_list(
+                'user__username', 'posts_count', 'followers_count')),
+        )
+
+    def test_export_import_round_trip(self):
+        """После выгрузки и загрузки в пустую базу данные совпадают."""
+
+        expected = self.snapshot()
+        for name in ('dump.ndjson', 'dump.csv'):
+            with self.subTest(format=name):
+                path = os.path.join(self.directory, name)
+                call_command('export_posts', output=path, stderr=StringIO())
+                Group.objects.all().delete()
+                User.objects.all().delete()
+
+                call_command('import_posts', path, stdout=StringIO(),
+                             stderr=StringIO())
+
+                self.assertEqual(self.snapshot(), expected)
+                self.assertFalse(os.path.exists(f'{path}.progress'))
+
+    def test_import_resumes_from_saved_progress(self):
+        """Импорт пропускает строки, загруженные до прерывания,
+        а повтор уже загруженных строк ничего не дублирует."""
+
+        path = os.path.join(self.directory, 'dump.ndjson')
+        call_command('export_posts', output=path, stderr=StringIO())
+        Post.objects.all().delete()
+        # Первые две строки (сообщество и запись) уже загружены.
+        with open(f'{path}.progress', 'w') as file:
+            json.dump({'rows': 2}, file)
+
+        call_command('import_posts', path, batch_size=1, stdout=StringIO(),
+                     stderr=StringIO())
+
+        self.assertFalse(Post.objects.exists())
+        self.assertEqual(Follow.objects.count(), 1)
+
+        call_command('import_posts', path, restart=True, stdout=StringIO(),
+                     stderr=StringIO())
+        call_command('import_posts', path, restart=True, stdout=StringIO(),
+                     stderr=StringIO())
+
+        self.assertEqual(Post.objects.count(), 1)
+        self.assertEqual(Comment.objects.count(), 1)
+
+    def test_import_into_instance_with_other_data(self):
+        """Записи с занятыми идентификаторами не теряются молча
+        и комментарии не попадают к чужим записям: загрузка
+        прерывается, а пачка откатывается."""
+
+        path = os.path.join(self.directory, 'dump.ndjson')
+        call_command('export_posts', output=path, stderr=StringIO())
+        Comment.objects.all().delete()
+        Post.objects.filter(pk=self.post.pk).update(text='Другая запись')
+        out = StringIO()
+
+        with self.assertRaisesMessage(CommandError, 'уже есть в базе'):
+            call_command('import_posts', path, stdout=out,
+                         stderr=StringIO())
+
+        self.assertFalse(Comment.objects.exists())
+
+        Post.objects.filter(pk=self.post.pk).update(text='Первая запись')
+        call_command('import_posts', path, restart=True, stdout=out,
+                     stderr=StringIO())
+
+        self.assertIn('group: 0, post: 0, comment: 1, follow: 0, '
+                      'уже в базе: 3', out.getvalue())
+
+    def test_import_updates_only_imported_data(self):
+        """Загрузка дописывает ленты, индекс и счётчики только для
+        загруженного, не трогая остального; полная перестройка —
+        по флагу --rebuild."""
+
+        other = User.objects.create_user(username='other')
+        TimelineEntry.objects.create(user=other, post=self.post,
+                                     pub_date=self.post.pub_date)
+        path = os.path.join(self.directory, 'dump.ndjson')
+        with open(path, 'w') as file:
+            for row in (
+                {'type': 'post', 'id': 100, 'author': 'author',
+                 'text': 'Загруженная',
+                 'pub_date': '2020-01-01T00:00:00+00:00'},
+                {'type': 'comment', 'post': self.post.pk, 'author': 'new',
+                 'text': 'Загруженный',
+                 'created': '2020-01-02T00:00:00+00:00'},
+                {'type': 'follow', 'user': 'new', 'author': 'author'},
+            ):
+                file.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+        call_command('import_posts', path, stdout=StringIO(),
+                     stderr=StringIO())
+
+        post = Post.objects.get(pk=100)
+        new = User.objects.get(username='new')
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=other, post=self.post).exists())
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(post=post).values_list(
+                'user__username', flat=True)), {'reader', 'new'})
+        self.assertTrue(SearchTerm.objects.filter(post=post).exists())
+        self.assertTrue(SearchTerm.objects.filter(
+            post=self.post, comment__author=new).exists())
+        self.assertEqual(Post.objects.get(pk=self.post.pk).comments_count, 2)
+        self.assertEqual(UserStats.objects.get(user=self.author).posts_count,
+                         2)
+        self.assertEqual(UserStats.objects.get(user=new).following_count, 1)
+
+        call_command('import_posts', path, restart=True, rebuild=True,
+                     stdout=StringIO(), stderr=StringIO())
+
+        self.assertFalse(TimelineEntry.objects.filter(user=other).exists())
+        self.assertEqual(TimelineEntry.objects.filter(post=post).count(), 2)
+
+    def test_import_rejects_unknown_rows(self):
+        """Строка неизвестного типа прерывает импорт с номером строки."""
+
+        path = os.path.join(self.directory, 'dump.ndjson')
+        with open(path, 'w') as file:
+            file.write('{"type": "group", "slug": "new", "title": "New"}\n')
+            file.write('{"type": "user", "username": "someone"}\n')
+
+        with self.assertRaisesMessage(CommandError, 'Строка 2'):
+            call_command('import_posts', path, batch_size=1,
+                         stdout=StringIO(), stderr=StringIO())
+
+        self.assertTrue(Group.objects.filter(slug='new').exists())
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Проверяются настройки SQLite.')
+@override_settings(SQLITE_PRAGMAS={'journal_mode': 'WAL',
+                                   'synchronous': 'NORMAL',
+                                   'busy_timeout': 5000,
+                                   'mmap_size': 1024 * 1024})
+class SQLiteSettingsTests(TestCase):
+    def test_new_connection_gets_pragmas(self):
+        """Новое соединение с SQLite получает WAL, synchronous=NORMAL,
+        ожидание блокировки и mmap из SQLITE_PRAGMAS."""
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        wrapper = DatabaseWrapper({
+            **connection.settings_dict,
+            'NAME': os.path.join(directory, 'db.sqlite3'),
+        })
+        wrapper.ensure_connection()
+        self.addCleanup(wrapper.close)
+
+        pragmas = {
+            name: wrapper.connection.execute(
+                f'PRAGMA {name}').fetchone()[0]
+            for name in settings.SQLITE_PRAGMAS
+        }
+
+        self.assertEqual(pragmas, {
+            'journal_mode': 'wal',
+            'synchronous': 1,
+            'busy_timeout': 5000,
+            'mmap_size': 1024 * 1024,
+        })
+
+
+SHARED_CACHE_LOCATION = tempfile.mkdtemp()
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'posts.cache_backends.TieredCache',
+        'LOCATION': 'tiered_tests',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'LOCAL_KEY_PREFIXES': ('template.cache.', 'post_card:'),
+        },
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': SHARED_CACHE_LOCATION,
+    },
+})
+class TieredCacheTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(SHARED_CACHE_LOCATION, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        cache.reset_stats()
+
+    def test_versioned_keys_served_from_process_memory(self):
+        """Карточки и фрагменты читаются из памяти процесса, а генерации
+        всегда из общего кэша, где их меняют другие процессы."""
+
+        cache.set('post_card:1:1', 'card')
+        cache.set('generation:posts', 1)
+        caches['shared'].delete('post_card:1:1')
+        caches['shared'].set('generation:posts', 2)
+
+        self.assertEqual(cache.get('post_card:1:1'), 'card')
+        self.assertEqual(cache.get('generation:posts'), 2)
+        self.assertIsNone(cache.get('post_card:2:1'))
+        self.assertEqual(cache.get_many(['post_card:1:1', 'author_stats:1']),
+                         {'post_card:1:1': 'card'})
+        self.assertEqual(cache.stats(), {
+            'author_stats': {'local_hits': 0, 'shared_hits': 0, 'misses': 1},
+            'generation': {'local_hits': 0, 'shared_hits': 1, 'misses': 0},
+            'post_card': {'local_hits': 2, 'shared_hits': 0, 'misses': 1},
+        })
+
+    def test_deleted_keys_dropped_from_both_tiers(self):
+        """Удалённый ключ не остаётся в памяти процесса."""
+
+        cache.set('post_card:1:1', 'card')
+        cache.delete('post_card:1:1')
+
+        self.assertIsNone(cache.get('post_card:1:1'))
+        self.assertIsNone(caches['shared'].get('post_card:1:1'))
+
+    def test_stats_available_to_staff_only(self):
+        """Счётчики кэша отдаются только сотрудникам."""
+
+        cache.get('post_card:1:1')
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        user = User.objects.create_user(username='user')
+        staff_client, user_client = Client(), Client()
+        staff_client.force_login(staff)
+        user_client.force_login(user)
+
+        response = staff_client.get('/admin/cache-stats/')
+
+        self.assertEqual(response.json()['prefixes']['post_card']['misses'],
+                         1)
+        self.assertEqual(user_client.get('/admin/cache-stats/').status_code,
+                         302)
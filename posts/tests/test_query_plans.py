@@ -0,0 +1,125 @@
+from unittest import skipUnless
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from posts import search
+from posts.models import Comment, Follow, Group, Post, User
+from posts.tests.cases import TestCase
+from posts.urls import urlpatterns
+
+# Выпадающий список сообществ в форме записи читает таблицу целиком.
+FULL_SCANS_ALLOWED = ('posts_group',)
+# Поиск ранжирует найденные записи по агрегатам, сортировка неизбежна.
+SORTS_ALLOWED = ('posts:search',)
+
+
+class PlanRecorder:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.startswith('SELECT'):
+            self.queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+def explain(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def plan_problems(plan):
+    """Строки плана SQLite с полным просмотром таблицы или сортировкой
+    во временном B-дереве."""
+
+    problems = []
+    for line in plan:
+        words = line.split()
+        if words[0] == 'SCAN' and 'USING' not in words:
+            # Старые версии SQLite пишут «SCAN TABLE имя».
+            table = words[2] if words[1] == 'TABLE' else words[1]
+            if table not in FULL_SCANS_ALLOWED:
+                problems.append(line)
+        elif 'TEMP B-TREE' in line:
+            problems.append(line)
+    return problems
+
+
+# noinspection PyUnresolvedReferences
+@skipUnless(connection.vendor == 'sqlite',
+            'Планы запросов разбираются в формате SQLite.')
+@override_settings(THUMBNAIL_WORKERS=0, COMMENTS_PER_PAGE=5)
+class QueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='test_user')
+        cls.user_2 = User.objects.create_user(username='test_user_2')
+        cls.group = Group.objects.create(title='Test group title',
+                                         slug='test_group',
+                                         description='Test description')
+        Follow.objects.create(user=cls.user, author=cls.user_2)
+        Post.objects.bulk_create(
+            Post(text=f'Post {index}', author=author, group=cls.group)
+            for index in range(30) for author in (cls.user, cls.user_2))
+        cls.post = cls.user.posts.first()
+        Comment.objects.bulk_create(
+            Comment(text=f'Comment {index}', post=cls.post, author=cls.user_2)
+            for index in range(20))
+        search.rebuild()
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def urls(self):
+        kwargs = {
+            'username': self.user.username,
+            'post_id': self.post.pk,
+            'slug': self.group.slug,
+        }
+        query = {'posts:search': '?q=post'}
+        # Удаление записи выполняется последним.
+        patterns = sorted(urlpatterns,
+                          key=lambda pattern: pattern.name == 'post_delete')
+        for pattern in patterns:
+            name = f'posts:{pattern.name}'
+            if name == 'posts:profile_follow':
+                pattern_kwargs = {'username': self.user_2.username}
+            else:
+                pattern_kwargs = {key: kwargs[key]
+                                  for key in pattern.pattern.converters}
+            yield name, reverse(name, kwargs=pattern_kwargs) + query.get(
+                name, '')
+
+    def assertPlansUseIndexes(self, name, url):
+        recorder = PlanRecorder()
+        with connection.execute_wrapper(recorder):
+            response = self.client.get(url)
+        pages = [response.context.get(key) for key in ('page', 'comments')
+                 ] if response.context else []
+        # Следующая страница выбирается по курсору другим запросом.
+        for page in pages:
+            if page is not None and page.has_next():
+                with connection.execute_wrapper(recorder):
+                    self.client.get(url, {'cursor': page.next_cursor})
+
+        for sql, params in recorder.queries:
+            problems = plan_problems(explain(sql, params))
+            if name in SORTS_ALLOWED:
+                problems = [line for line in problems
+                            if 'TEMP B-TREE' not in line]
+            with self.subTest(url=url, sql=sql):
+                self.assertEqual(problems, [])
+
+    def test_views_queries_use_indexes(self):
+        """Запросы всех страниц posts.urls читают данные по индексам,
+        без полного просмотра таблиц и сортировки во временном
+        B-дереве."""
+
+        for name, url in self.urls():
+            self.assertPlansUseIndexes(name, url)
@@ -0,0 +1,131 @@
+from django.core import mail
+from django.core.cache import cache
+from django.db import transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from posts import queue
+from posts.models import Post, SearchTerm, Task, TimelineEntry, User
+from posts.tests.cases import TransactionTestCase
+
+calls = []
+
+
+@queue.task('tests.record')
+def record(payloads):
+    calls.append(sorted(payloads))
+    if 'broken' in payloads:
+        raise ValueError('broken')
+
+
+# noinspection PyUnresolvedReferences
+@override_settings(TASK_WORKERS=2, THUMBNAIL_WORKERS=0)
+class TaskQueueTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        calls.clear()
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com')
+        self.reader = User.objects.create_user(username='reader')
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def test_enqueued_on_commit(self):
+        """Задачи транзакции вставляются одним запросом после её
+        фиксации, откаченная транзакция задач не оставляет."""
+
+        with transaction.atomic():
+            record.enqueue('a')
+            record.enqueue('b')
+            self.assertFalse(Task.objects.exists())
+        with self.assertRaises(ValueError), transaction.atomic():
+            record.enqueue('c')
+            raise ValueError
+
+        self.assertEqual(
+            sorted(Task.objects.values_list('payload', flat=True)),
+            ['"a"', '"b"'])
+
+    def test_rolled_back_savepoint(self):
+        """Откат вложенного блока отменяет только его задачи."""
+
+        with transaction.atomic():
+            record.enqueue('a')
+            try:
+                with transaction.atomic():
+                    record.enqueue('b')
+                    raise ValueError
+            except ValueError:
+                pass
+
+        self.assertEqual(list(Task.objects.values_list('payload', flat=True)),
+                         ['"a"'])
+
+    def test_similar_tasks_batched(self):
+        """Задачи одного вида выполняются одной пачкой без повторов."""
+
+        for payload in ('a', 'b', 'a'):
+            record.enqueue(payload)
+
+        self.assertEqual(queue.work(once=True), 3)
+        self.assertEqual(calls, [['a', 'b']])
+        self.assertFalse(Task.objects.exists())
+
+    @override_settings(TASK_MAX_ATTEMPTS=2)
+    def test_failed_task_retried(self):
+        """Упавшая задача не мешает остальным из пачки и повторяется,
+        пока не исчерпает попытки."""
+
+        record.enqueue('ok')
+        record.enqueue('broken')
+
+        queue.work(once=True)
+        broken = Task.objects.get()
+        self.assertEqual((broken.attempts, broken.failed), (1, False))
+        self.assertIn('ValueError', broken.error)
+        self.assertEqual(queue.work(once=True), 0)
+
+        Task.objects.update(run_at=timezone.now())
+        queue.work(once=True)
+        broken.refresh_from_db()
+        self.assertEqual((broken.attempts, broken.failed), (2, True))
+        queue.work(once=True)
+        self.assertEqual(calls, [['broken', 'ok'], ['ok'], ['broken'],
+                                 ['broken']])
+
+    def test_claimed_tasks_leased(self):
+        """Забранные задачи не достаются другому обработчику."""
+
+        record.enqueue('a')
+
+        self.assertEqual(len(queue.claim(10)), 1)
+        self.assertEqual(queue.claim(10), [])
+
+    def test_side_effects_deferred(self):
+        """Представления только ставят задачи: ленты подписок, поиск
+        и письма обновляет обработчик очереди."""
+
+        self.client.get(reverse('posts:profile_follow',
+                                args=[self.author.username]))
+        post = Post.objects.create(text='Фоновая задача', author=self.author)
+        self.client.post(
+            reverse('posts:add_comment', args=[self.author.username, post.pk]),
+            {'text': 'Комментарий'})
+
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertFalse(SearchTerm.objects.exists())
+        self.assertEqual(mail.outbox, [])
+
+        queue.work(once=True)
+
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post=post).exists())
+        self.assertTrue(SearchTerm.objects.filter(
+            post=post, comment__isnull=False).exists())
+        self.assertTrue(SearchTerm.objects.filter(
+            post=post, comment__isnull=True).exists())
+        self.assertEqual(sorted(message.subject for message in mail.outbox),
+                         ['Новый комментарий от reader',
+                          'Новый подписчик: reader'])
+        self.assertFalse(Task.objects.exists())
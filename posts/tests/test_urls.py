@@ -1,9 +1,13 @@
 from http import HTTPStatus
 
-from django.test import Client, TestCase
+from django.conf import settings
+from django.core.cache import cache
+from django.test import Client, override_settings
 from django.urls import reverse
 
 from posts.models import Group, Post, User
+from posts.tests.cases import TestCase
+from posts.urls import urlpatterns
 
 
 # noinspection PyUnresolvedReferences
@@ -53,6 +57,7 @@ class PostURLTests(TestCase):
             f'/group/{group_slug}/',
             f'/{username}/',
             f'/{username}/{post_id}/',
+            '/search/?q=post',
         )
 
         for url in guests_allowed_urls:
@@ -137,3 +142,37 @@ class PostURLTests(TestCase):
             with self.subTest(url=url):
                 response = self.authorized_client.get(url)
                 self.assertTemplateUsed(response, template)
+
+    @override_settings(QUERY_PROFILING_SAMPLE_RATE=1,
+                       QUERY_BUDGETS_RAISE=True)
+    def assertWithinQueryBudget(self, client, url):
+        """Выполняет GET-запрос с пустым кэшем; при превышении
+        QUERY_BUDGETS QueryProfilingMiddleware выбрасывает
+        QueryBudgetExceeded."""
+
+        cache.clear()
+        return client.get(url)
+
+    def test_urls_within_query_budgets(self):
+        """Все страницы posts.urls укладываются в бюджет запросов."""
+
+        kwargs = {
+            'username': PostURLTests.user.username,
+            'post_id': PostURLTests.post.pk,
+            'slug': PostURLTests.group.slug,
+        }
+        query = {'posts:search': '?q=post'}
+        # Удаление записи выполняется последним.
+        patterns = sorted(urlpatterns,
+                          key=lambda pattern: pattern.name == 'post_delete')
+
+        for pattern in patterns:
+            name = f'posts:{pattern.name}'
+            url = reverse(name, kwargs={
+                key: kwargs[key] for key in pattern.pattern.converters})
+            url += query.get(name, '')
+            for client in (self.guest_client, self.authorized_client_2,
+                           self.authorized_client):
+                with self.subTest(url=url, client=client):
+                    self.assertIn(name, settings.QUERY_BUDGETS)
+                    self.assertWithinQueryBudget(client, url)
@@ -2,20 +2,30 @@ import shutil
 import tempfile
 
 from http import HTTPStatus
+from unittest import mock
 
 from django import forms
 from django.conf import settings
 from django.core.cache import cache
 from django.core.cache.utils import make_template_fragment_key
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 
-from posts.models import Follow, Group, Post, User
+from posts import follows, images, search
+from posts.caching import generation
+from posts.models import (Comment, Follow, Group, Post, TimelineEntry, User,
+                          UserStats)
+from posts.templatetags.post_cards import card_key
+from posts.tests.cases import TestCase
 
 
 # noinspection PyUnresolvedReferences
-@override_settings(MEDIA_ROOT=tempfile.mkdtemp(dir=settings.BASE_DIR))
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(dir=settings.BASE_DIR),
+                   THUMBNAIL_WORKERS=0, TASK_WORKERS=0)
 class PostViewTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -63,6 +73,7 @@ class PostViewTests(TestCase):
         super().tearDownClass()
 
     def setUp(self):
+        cache.clear()
         self.guest_client = Client()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
@@ -99,6 +110,7 @@ class PostViewTests(TestCase):
             ('posts:profile', [username], 'profile.html'),
             ('posts:post', [username, post_id], 'post.html'),
             ('posts:post_edit', [username, post_id], 'post_new.html'),
+            ('posts:search', [], 'search.html'),
         )
 
         for reverse_name, args, template in name_and_template:
@@ -148,6 +160,73 @@ class PostViewTests(TestCase):
                     posts_count = len(response.context['page'].object_list)
                     self.assertEqual(posts_count, posts_expected)
 
+    def test_pages_cursor_paginator(self):
+        """Курсоры ведут на следующую и предыдущую страницы без пропусков
+        и повторов, даже при совпадающих датах публикации."""
+
+        user = PostViewTests.user
+        group = PostViewTests.group
+
+        Post.objects.bulk_create(
+            Post(text=f'Post {i}', author=user, group=group)
+            for i in range(1, 25)
+        )
+        Post.objects.update(pub_date=timezone.now())
+
+        name_and_posts = (
+            ('posts:index', [], Post.objects.all()),
+            ('posts:group_posts', [group.slug], group.posts.all()),
+            ('posts:profile', [user.username], user.posts.all()),
+        )
+
+        for reverse_name, args, queryset in name_and_posts:
+            url = reverse(reverse_name, args=args)
+            expected = list(queryset.order_by('-pub_date', '-id'))
+            with self.subTest(url=url):
+                pages = []
+                page = self.guest_client.get(url).context['page']
+                pages.append(page.object_list)
+                while page.has_next():
+                    page = self.guest_client.get(
+                        url, {'cursor': page.next_cursor}).context['page']
+                    pages.append(page.object_list)
+                self.assertEqual(sum(pages, []), expected)
+
+                previous = self.guest_client.get(
+                    url, {'cursor': page.previous_cursor}).context['page']
+                self.assertEqual(previous.object_list, pages[-2])
+
+    def test_pages_paginator_skips_count_and_offset(self):
+        """Переход по курсору не выполняет COUNT(*) и OFFSET."""
+
+        Post.objects.bulk_create(
+            Post(text=f'Post {i}', author=PostViewTests.user)
+            for i in range(1, 25)
+        )
+
+        url = reverse('posts:index')
+        page = self.guest_client.get(url).context['page']
+
+        with CaptureQueriesContext(connection) as queries:
+            self.guest_client.get(url, {'cursor': page.next_cursor})
+
+        for query in queries.captured_queries:
+            with self.subTest(sql=query['sql']):
+                self.assertNotIn('COUNT(*)', query['sql'])
+                self.assertNotIn('OFFSET', query['sql'])
+
+    def test_pages_paginator_invalid_cursor(self):
+        """Некорректный курсор и слишком далёкий номер страницы
+        возвращают первую страницу."""
+
+        url = reverse('posts:index')
+        first_page = self.guest_client.get(url).context['page']
+
+        for params in ({'cursor': 'broken'}, {'page': 10 ** 6}):
+            with self.subTest(params=params):
+                page = self.guest_client.get(url, params).context['page']
+                self.assertEqual(page.object_list, first_page.object_list)
+
     def test_page_cache_exists(self):
         """Шаблоны кэшируют объект page."""
 
@@ -164,10 +243,270 @@ class PostViewTests(TestCase):
         for reverse_name, args, cache_name in name_and_cache:
             with self.subTest(reverse_name=reverse_name,
                               cache_name=cache_name):
-                self.authorized_client.get(reverse_name, args=args)
-                key = make_template_fragment_key(cache_name)
+                response = self.authorized_client.get(
+                    reverse(reverse_name, args=args))
+                feed_cache = response.context['feed_cache']
+                key = make_template_fragment_key(
+                    cache_name, [feed_cache['version'], feed_cache['page'],
+                                 feed_cache['viewer']])
                 self.assertIn(key, cache)
 
+    def test_page_cache_varies_by_page_and_feed(self):
+        """Кэш ленты не отдаёт чужую страницу, чужое сообщество
+        или чужие кнопки управления записью."""
+
+        user = PostViewTests.user
+        group = PostViewTests.group
+        group_2 = Group.objects.create(title='Test group 2 title',
+                                       slug='test_group_2')
+        Post.objects.bulk_create(
+            Post(text=f'Post {i} for group', author=user, group=group)
+            for i in range(15)
+        )
+        group_2_post = Post.objects.create(text='Post for group 2',
+                                           author=user, group=group_2)
+
+        url = reverse('posts:index')
+        page_1 = self.guest_client.get(url).content.decode()
+        page_2 = self.guest_client.get(url, {'page': 2}).content.decode()
+        self.assertNotEqual(page_1, page_2)
+        self.assertIn('Post 4 for group', page_2)
+
+        group_2_page = self.guest_client.get(reverse(
+            'posts:group_posts', args=[group_2.slug])).content.decode()
+        self.assertIn(group_2_post.text, group_2_page)
+        self.assertNotIn('Post 14 for group', group_2_page)
+
+        edit_url = reverse('posts:post_edit', args=[user.username,
+                                                    group_2_post.pk])
+        self.assertIn(edit_url, self.authorized_client.get(url).content
+                      .decode())
+        self.assertNotIn(edit_url, self.guest_client.get(url).content
+                         .decode())
+
+    def test_page_cache_invalidated_on_changes(self):
+        """Изменение записей, комментариев и сообществ сбрасывает кэш
+        затронутых лент."""
+
+        user = PostViewTests.user
+        post = Post.objects.get(pk=PostViewTests.post.pk)
+        group = Group.objects.get(pk=PostViewTests.group.pk)
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_posts', args=[group.slug]),
+            reverse('posts:profile', args=[user.username]),
+        )
+        for url in urls:
+            self.guest_client.get(url)
+
+        post.text = 'Edited post text'
+        post.save()
+        Comment.objects.create(post=post, author=user, text='Comment')
+        group.title = 'Renamed group'
+        group.save()
+
+        for url in urls:
+            with self.subTest(url=url):
+                content = self.guest_client.get(url).content.decode()
+                self.assertIn('Edited post text', content)
+                self.assertIn('Комментариев: 1', content)
+                self.assertIn('Renamed group', content)
+
+    def test_anonymous_pages_cached_with_conditional_get(self):
+        """Анонимные страницы отдаются из кэша целиком, с ETag
+        и Last-Modified, а повторный условный запрос получает 304."""
+
+        user = PostViewTests.user
+        post = PostViewTests.post
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_posts', args=[PostViewTests.group.slug]),
+            reverse('posts:profile', args=[user.username]),
+            reverse('posts:post', args=[user.username, post.pk]),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                first = self.guest_client.get(url)
+                with CaptureQueriesContext(connection) as queries:
+                    second = self.guest_client.get(url)
+                self.assertLessEqual(len(queries), 1)
+                self.assertEqual(second.content, first.content)
+                self.assertEqual(second['ETag'], first['ETag'])
+                self.assertIn('Last-Modified', second)
+
+                not_modified = self.guest_client.get(
+                    url, HTTP_IF_NONE_MATCH=first['ETag'])
+                self.assertEqual(not_modified.status_code,
+                                 HTTPStatus.NOT_MODIFIED)
+                self.assertTemplateNotUsed(not_modified, 'base.html')
+                self.assertNotIn('ETag',
+                                 self.authorized_client.get(url))
+
+    @override_settings(REPLICA_DATABASES=['replica'])
+    def test_anonymous_pages_cached_with_replica(self):
+        """С репликой промах кэша отрисовывается по основной базе,
+        поэтому страница кэшируется и проверяется по ETag."""
+
+        url = reverse('posts:index')
+        # Реплики нет среди подключений: чтение с неё было бы ошибкой.
+        with mock.patch('posts.routers.choose_replica',
+                        return_value='replica') as choose_replica:
+            etag = self.guest_client.get(url)['ETag']
+            response = self.guest_client.get(url)
+            not_modified = self.guest_client.get(url,
+                                                 HTTP_IF_NONE_MATCH=etag)
+        self.assertTrue(choose_replica.called)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response['ETag'], etag)
+        self.assertTemplateNotUsed(response, 'base.html')
+        self.assertEqual(not_modified.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_anonymous_pages_invalidated_on_changes(self):
+        """Новый комментарий и переименование сообщества меняют ETag
+        и содержимое затронутых страниц."""
+
+        user = PostViewTests.user
+        post = PostViewTests.post
+        group = Group.objects.get(pk=PostViewTests.group.pk)
+        post_url = reverse('posts:post', args=[user.username, post.pk])
+        index_url = reverse('posts:index')
+        before = {url: self.guest_client.get(url)['ETag']
+                  for url in (post_url, index_url)}
+
+        Comment.objects.create(post=post, author=user, text='New comment')
+        group.title = 'Renamed group'
+        group.save()
+
+        response = self.guest_client.get(
+            post_url, HTTP_IF_NONE_MATCH=before[post_url])
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertContains(response, 'New comment')
+        response = self.guest_client.get(index_url)
+        self.assertNotEqual(response['ETag'], before[index_url])
+        self.assertContains(response, 'Renamed group')
+
+    def test_post_card_cache_shared_between_viewers(self):
+        """Карточка записи кэшируется одна на всех, а кнопки
+        управления подставляются для каждого пользователя."""
+
+        user = PostViewTests.user
+        post = PostViewTests.post
+        url = reverse('posts:group_posts', args=[PostViewTests.group.slug])
+        edit_url = reverse('posts:post_edit', args=[user.username, post.pk])
+
+        cache.clear()
+        guest_content = self.guest_client.get(url).content.decode()
+        key = card_key(Post.objects.get(pk=post.pk), generation('groups'))
+        card = cache.get(key)
+        author_content = self.authorized_client.get(url).content.decode()
+
+        self.assertIn(post.text, card)
+        self.assertEqual(cache.get(key), card)
+        self.assertNotIn(edit_url, guest_content)
+        self.assertIn(edit_url, author_content)
+
+    @override_settings(THUMBNAIL_WORKERS=2)
+    def test_post_card_thumbnail_placeholder(self):
+        """Пока миниатюра не создана, лента выводит заглушку; после
+        создания миниатюры кэш ленты сбрасывается."""
+
+        url = reverse('posts:group_posts', args=[PostViewTests.group.slug])
+        jobs = []
+        executor = mock.Mock(
+            submit=lambda function, *args: jobs.append((function, args)))
+
+        cache.clear()
+        with mock.patch('posts.thumbnails._get_executor',
+                        return_value=executor):
+            content = self.guest_client.get(url).content.decode()
+        self.assertEqual(len(jobs), 1)
+        self.assertIn('bg-light', content)
+        self.assertNotIn('<img class="card-img"', content)
+
+        for function, args in jobs:
+            function(*args)
+        content = self.guest_client.get(url).content.decode()
+        self.assertIn('<img class="card-img"', content)
+        self.assertNotIn('bg-light', content)
+
+    def test_post_card_image_variants(self):
+        """Карточка выводит srcset из вариантов изображения,
+        сохранённых рядом с оригиналом."""
+
+        url = reverse('posts:group_posts', args=[PostViewTests.group.slug])
+
+        cache.clear()
+        content = self.guest_client.get(url).content.decode()
+        post = Post.objects.get(pk=PostViewTests.post.pk)
+        variant = images.variant_name(post.image.name, 320, 'jpg')
+
+        self.assertEqual(post.image_widths, '320')
+        self.assertTrue(post.image.storage.exists(variant))
+        self.assertIn(f'srcset="{settings.MEDIA_URL}{variant} 320w"',
+                      content)
+
+    def test_search_ranks_posts_and_comments(self):
+        """Поиск учитывает словоформы и комментарии, а записи с большим
+        числом слов запроса идут первыми."""
+
+        user = PostViewTests.user
+        both = Post.objects.create(text='Красивые публикации о котах',
+                                   author=user)
+        one = Post.objects.create(text='Красивая картина', author=user)
+        commented = Post.objects.create(text='Без подходящих слов',
+                                        author=user)
+        Comment.objects.create(text='Какая публикация!', post=commented,
+                               author=user)
+        Post.objects.create(text='Совсем другая запись', author=user)
+
+        response = self.guest_client.get(reverse('posts:search'),
+                                         {'q': 'красивую публикацию'})
+
+        self.assertEqual(response.context['page'].object_list,
+                         [both, one, commented])
+
+    def test_search_index_updated_on_changes(self):
+        """Индекс обновляется при изменении и удалении записи."""
+
+        url = reverse('posts:search')
+        post = Post.objects.create(text='Старый текст',
+                                   author=PostViewTests.user)
+
+        post.text = 'Новый текст'
+        post.save()
+        found_old = self.guest_client.get(url, {'q': 'старый'})
+        found_new = self.guest_client.get(url, {'q': 'новые'})
+        post_id = post.pk
+        post.delete()
+        found_deleted = self.guest_client.get(url, {'q': 'новые'})
+
+        self.assertFalse(found_old.context['page'].object_list)
+        self.assertEqual(
+            [found.pk for found in found_new.context['page'].object_list],
+            [post_id])
+        self.assertFalse(found_deleted.context['page'].object_list)
+
+    def test_search_cursor_paginator(self):
+        """Результаты поиска листаются курсором с сохранением запроса."""
+
+        url = reverse('posts:search')
+        Post.objects.bulk_create(
+            Post(text=f'Кот номер {i}', author=PostViewTests.user)
+            for i in range(1, 16)
+        )
+        search.rebuild()
+
+        first = self.guest_client.get(url, {'q': 'коты'})
+        page = first.context['page']
+        second = self.guest_client.get(
+            url, {'q': 'коты', 'cursor': page.next_cursor}).context['page']
+
+        self.assertContains(
+            first, f'q=%D0%BA%D0%BE%D1%82%D1%8B&amp;cursor={page.next_cursor}')
+        self.assertEqual(len(page.object_list), 10)
+        self.assertEqual(len(second.object_list), 5)
+        self.assertFalse(set(page.object_list) & set(second.object_list))
+
     def test_index_list_page_shows_correct_context(self):
         """Шаблон index сформирован с правильным контекстом."""
 
@@ -196,6 +535,34 @@ class PostViewTests(TestCase):
 
         PostViewTests.check_object(self, response, expected_page_obj)
 
+    def test_group_detail_page_queries_dont_depend_on_group_size(self):
+        """Страница сообщества выполняет одинаковое число запросов
+        и выбирает не больше одной страницы постов при любом размере
+        сообщества."""
+
+        user = PostViewTests.user
+        group = PostViewTests.group
+        url = reverse('posts:group_posts', kwargs={'slug': group.slug})
+
+        captured = []
+        for group_size in (20, 200):
+            Post.objects.bulk_create(
+                Post(text=f'Post {i}', author=user, group=group)
+                for i in range(group_size - group.posts.count())
+            )
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.guest_client.get(url)
+            captured.append(queries.captured_queries)
+            with self.subTest(group_size=group_size):
+                self.assertEqual(len(response.context['page']), 10)
+
+        self.assertEqual(len(captured[0]), len(captured[1]))
+        for query in captured[1]:
+            if '"posts_post"' in query['sql']:
+                with self.subTest(sql=query['sql']):
+                    self.assertIn('LIMIT 11', query['sql'])
+
     def test_group_detail_page_doesnt_return_wrong_context(self):
         """Шаблон group не возвращает посты не своей группы."""
 
@@ -287,6 +654,46 @@ class PostViewTests(TestCase):
 
         PostViewTests.check_object(self, response, expected_post)
 
+    @override_settings(COMMENTS_PER_PAGE=2)
+    def test_post_page_comments_paginated(self):
+        """Комментарии выводятся порциями от новых к старым, следующая
+        порция отдаётся фрагментом по курсору."""
+
+        user = PostViewTests.user
+        post = PostViewTests.post
+        start = timezone.now()
+        comments = [
+            Comment.objects.create(post=post, author=user,
+                                   text=f'Comment {index}')
+            for index in range(5)
+        ]
+        for index, comment in enumerate(comments):
+            Comment.objects.filter(pk=comment.pk).update(
+                created=start + timezone.timedelta(minutes=index))
+        kwargs = {'username': user.username, 'post_id': post.pk}
+
+        response = self.guest_client.get(reverse('posts:post', kwargs=kwargs))
+        page = response.context['comments']
+        texts = [comment.text for comment in page]
+        self.assertEqual(texts, ['Comment 4', 'Comment 3'])
+        self.assertTrue(page.has_next())
+
+        fragment_url = reverse('posts:comments', kwargs=kwargs)
+        seen = texts
+        cursor = page.next_cursor
+        while cursor:
+            response = self.guest_client.get(fragment_url,
+                                             {'cursor': cursor})
+            self.assertTemplateUsed(response, 'includes/comment_list.html')
+            self.assertTemplateNotUsed(response, 'base.html')
+            page = response.context['comments']
+            seen += [comment.text for comment in page]
+            cursor = page.next_cursor
+
+        self.assertEqual(seen, [f'Comment {index}'
+                                for index in reversed(range(5))])
+        self.assertNotContains(response, 'comments-more')
+
     def test_profile_follow_view(self):
         """Авторизованный пользователь может подписываться на других
         пользователей."""
@@ -304,6 +711,144 @@ class PostViewTests(TestCase):
         self.assertTrue(
             Follow.objects.filter(user=user, author=user_2).exists())
 
+    def test_follow_and_unfollow_idempotent(self):
+        """Повторные подписка и отписка не меняют счётчики; подписка
+        и отписка выполняются одним запросом на изменение."""
+
+        user = PostViewTests.user
+        user_2 = PostViewTests.user_2
+        follow_url = reverse('posts:profile_follow', args=[user_2.username])
+        unfollow_url = reverse('posts:profile_unfollow',
+                               args=[user_2.username])
+
+        for url, exists, count in ((follow_url, True, 1),
+                                   (follow_url, True, 1),
+                                   (unfollow_url, False, 0),
+                                   (unfollow_url, False, 0)):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.authorized_client.get(url)
+            self.assertEqual(response.status_code, HTTPStatus.FOUND)
+            self.assertEqual(Follow.objects.filter(
+                user=user, author=user_2).exists(), exists)
+            user.stats.refresh_from_db()
+            user_2.stats.refresh_from_db()
+            self.assertEqual(user.stats.following_count, count)
+            self.assertEqual(user_2.stats.followers_count, count)
+            self.assertEqual(
+                sum(not query['sql'].startswith('SELECT')
+                    and '"posts_follow"' in query['sql']
+                    for query in queries.captured_queries), 1)
+
+        response = self.authorized_client.get(
+            reverse('posts:profile_follow', args=['nobody']))
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_follow_bulk(self):
+        """Подписка и отписка на многих авторов одним запросом JSON."""
+
+        user = PostViewTests.user
+        authors = [User.objects.create_user(username=f'author_{index}')
+                   for index in range(3)]
+        Post.objects.create(text='Post of author_0', author=authors[0])
+        url = reverse('posts:follow_bulk')
+
+        def post(data):
+            return self.authorized_client.post(
+                url, data, content_type='application/json')
+
+        response = post({'follow': [author.username for author in authors]
+                         + [user.username, 'nobody']})
+        self.assertEqual(response.json(), {'followed': 3, 'unfollowed': 0})
+        user.stats.refresh_from_db()
+        self.assertEqual(user.stats.following_count, 3)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=user, post__author=authors[0]).exists())
+
+        with mock.patch('posts.follows._returning_supported',
+                        return_value=False):
+            response = post({'follow': [authors[0].username],
+                             'unfollow': [authors[1].username,
+                                          authors[1].username]})
+        self.assertEqual(response.json(), {'followed': 0, 'unfollowed': 1})
+        self.assertEqual(
+            sorted(Follow.objects.filter(user=user).values_list(
+                'author__username', flat=True)),
+            ['author_0', 'author_2'])
+        user.stats.refresh_from_db()
+        authors[1].stats.refresh_from_db()
+        self.assertEqual(user.stats.following_count, 2)
+        self.assertEqual(authors[1].stats.followers_count, 0)
+
+        for data in ([], {'follow': 'author_0'}, {'unfollow': [1]},
+                     {'follow': [f'user_{index}' for index in range(
+                         settings.FOLLOW_BULK_LIMIT + 1)]}):
+            with self.subTest(data=data):
+                self.assertEqual(post(data).status_code,
+                                 HTTPStatus.BAD_REQUEST)
+        self.assertEqual(self.authorized_client.get(url).status_code,
+                         HTTPStatus.METHOD_NOT_ALLOWED)
+
+    def test_author_card_cached_and_invalidated(self):
+        """Счётчики автора берутся из кэша и обновляются после
+        подписки; на странице записи автор ищется один раз."""
+
+        user_2 = PostViewTests.user_2
+        post = PostViewTests.post
+        profile_url = reverse('posts:profile', args=[user_2.username])
+        post_url = reverse('posts:post', args=[post.author.username, post.pk])
+
+        cache.clear()
+        self.guest_client.get(profile_url)
+        with CaptureQueriesContext(connection) as queries:
+            self.guest_client.get(profile_url)
+        self.assertFalse(any('posts_userstats' in query['sql']
+                             for query in queries.captured_queries))
+
+        self.authorized_client.get(
+            reverse('posts:profile_follow', args=[user_2.username]))
+        response = self.authorized_client.get(profile_url)
+        self.assertEqual(response.context['author_card']['stats'][
+            'followers_count'], 1)
+        self.assertTrue(response.context['author_card']['subscribed'])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.guest_client.get(post_url)
+        self.assertFalse(any('FROM "auth_user"' in query['sql']
+                             for query in queries.captured_queries))
+
+    @override_settings(REPLICA_DATABASES=['default'])
+    def test_feed_reads_routed_to_replica_until_write(self):
+        """Ленты читаются с реплики; после записи пользователь
+        читает из основной базы, пока жива cookie привязки."""
+
+        user = PostViewTests.user
+        post = PostViewTests.post
+        index_url = reverse('posts:index')
+        # Первая отрисовка создаёт варианты изображения, то есть пишет.
+        self.authorized_client.get(index_url)
+        self.authorized_client.cookies.pop(settings.REPLICA_PIN_COOKIE)
+
+        with mock.patch('posts.routers.choose_replica',
+                        return_value='default') as choose_replica:
+            self.authorized_client.get(reverse('posts:new_post'))
+            self.assertFalse(choose_replica.called)
+
+            response = self.authorized_client.get(index_url)
+            self.assertTrue(choose_replica.called)
+            self.assertNotIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+
+            response = self.authorized_client.post(
+                reverse('posts:add_comment',
+                        args=[user.username, post.pk]),
+                data={'text': 'Comment'})
+            cookie = response.cookies[settings.REPLICA_PIN_COOKIE]
+            self.assertEqual(cookie['max-age'],
+                             settings.REPLICA_PIN_SECONDS)
+
+            choose_replica.reset_mock()
+            self.authorized_client.get(index_url)
+            self.assertFalse(choose_replica.called)
+
     def test_profile_follow_view_cant_follow_itself(self):
         """Авторизованный пользователь не может подписываться на себя."""
 
@@ -381,3 +926,99 @@ class PostViewTests(TestCase):
         self.assertFalse(
             Follow.objects.filter(user=user_3, author=user_2).exists())
         self.assertFalse(response_page_obj_3)
+
+    def test_follow_view_unfollowed_author_posts_removed(self):
+        """После отписки записи автора пропадают из ленты подписок."""
+
+        user = PostViewTests.user
+        user_2 = PostViewTests.user_2
+
+        Follow.objects.create(user=user, author=user_2)
+        Post.objects.create(text='Post for follow_view', author=user_2)
+        self.assertTrue(TimelineEntry.objects.filter(user=user).exists())
+
+        self.authorized_client.get(
+            reverse('posts:profile_unfollow',
+                    kwargs={'username': user_2.username}))
+
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+
+        self.assertFalse(response.context['page'].object_list)
+        self.assertFalse(TimelineEntry.objects.filter(user=user).exists())
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_follow_view_merges_popular_authors(self):
+        """Записи популярных авторов не рассылаются по лентам, но
+        попадают в ленту подписок в общем порядке."""
+
+        user = PostViewTests.user
+        popular = PostViewTests.user_2
+        regular = User.objects.create_user(username='test_user_3')
+
+        Follow.objects.create(user=user, author=popular)
+        Follow.objects.create(user=regular, author=popular)
+        Follow.objects.create(user=user, author=regular)
+
+        for i in range(8):
+            Post.objects.create(text=f'Popular post {i}', author=popular)
+            Post.objects.create(text=f'Regular post {i}', author=regular)
+
+        self.assertFalse(TimelineEntry.objects.filter(
+            post__text__startswith='Popular post').exists())
+
+        url = reverse('posts:follow_index')
+        page = self.authorized_client.get(url).context['page']
+        pages = [page.object_list]
+        while page.has_next():
+            page = self.authorized_client.get(
+                url, {'cursor': page.next_cursor}).context['page']
+            pages.append(page.object_list)
+
+        expected = list(Post.objects.filter(
+            author__in=(popular, regular)).order_by('-pub_date', '-id'))
+        self.assertEqual(sum(pages, []), expected)
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_follow_view_author_drops_below_fanout_limit(self):
+        """Записи, вышедшие, пока автор был популярен, остаются в ленте
+        подписок, когда подписчиков снова становится не больше порога."""
+
+        user = PostViewTests.user
+        author = PostViewTests.user_2
+        other = User.objects.create_user(username='test_user_3')
+        Follow.objects.create(user=user, author=author)
+        Follow.objects.create(user=other, author=author)
+        post = Post.objects.create(text='Popular post', author=author)
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertIn(post, response.context['page'].object_list)
+
+        follows.unfollow(other, [author.username])
+
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=user, post=post).exists())
+        self.assertTrue(
+            UserStats.objects.get(user=author).timelines_materialized)
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertIn(post, response.context['page'].object_list)
+
+    def test_follow_view_queries_dont_depend_on_following(self):
+        """Число запросов ленты подписок не зависит от числа авторов,
+        на которых подписан пользователь."""
+
+        user = PostViewTests.user
+        url = reverse('posts:follow_index')
+
+        captured = []
+        for authors_amount in (1, 30):
+            for i in range(authors_amount - user.follower.count()):
+                author = User.objects.create_user(
+                    username=f'author_{authors_amount}_{i}')
+                Follow.objects.create(user=user, author=author)
+                Post.objects.create(text=f'Post {i}', author=author)
+            with CaptureQueriesContext(connection) as queries:
+                self.authorized_client.get(url)
+            captured.append(len(queries))
+
+        self.assertEqual(captured[0], captured[1])
@@ -0,0 +1,91 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from . import caching, images, tasks
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+
+def generate(post_id):
+    """Создаёт варианты изображения записи и сохраняет их ширины.
+    Возвращает обновлённые поля записи или None, если изображения нет."""
+
+    post = Post.objects.filter(pk=post_id).values(
+        'image', 'author_id', 'group_id').first()
+    if not post or not post['image']:
+        return None
+    widths, webp = images.make_variants(post['image'])
+    post.update(image_widths=images.join_widths(widths), image_webp=webp)
+    # Изображение могли заменить, пока создавались варианты.
+    Post.objects.filter(pk=post_id, image=post['image']).update(
+        image_widths=post['image_widths'], image_webp=webp)
+    return post
+
+
+def _run(post_id):
+    try:
+        post = generate(post_id)
+        if post:
+            # Ленты с заглушкой вместо изображения нужно отрисовать заново.
+            caching.bump(*caching.post_scopes(post['author_id'],
+                                              post['group_id']))
+    except Exception:
+        logger.exception('Не удалось создать варианты изображения записи %s',
+                         post_id)
+    finally:
+        with _lock:
+            _pending.discard(post_id)
+        close_old_connections()
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails')
+        return _executor
+
+
+def submit(post_id):
+    """Ставит создание вариантов изображения в очередь пула. Без пула
+    (THUMBNAIL_WORKERS = 0) создаёт их сразу и возвращает поля записи."""
+
+    if not settings.THUMBNAIL_WORKERS:
+        return generate(post_id)
+    with _lock:
+        if post_id in _pending:
+            return None
+        _pending.add(post_id)
+    _get_executor().submit(_run, post_id)
+    return None
+
+
+def schedule(post):
+    """Ставит создание вариантов изображения сохранённой записи
+    в очередь задач."""
+
+    if post.image and not post.image_widths:
+        tasks.generate_thumbnails.enqueue(post.pk)
+
+
+def ensure_variants(posts):
+    """Ставит задачи для записей, у изображений которых ещё нет
+    вариантов; созданные сразу варианты записываются в объекты."""
+
+    for post in posts:
+        if post.image and not post.image_widths:
+            generated = submit(post.pk)
+            if generated:
+                post.image_widths = generated['image_widths']
+                post.image_webp = generated['image_webp']
@@ -0,0 +1,152 @@
+from itertools import islice
+from operator import attrgetter
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Follow, Post, TimelineEntry, UserStats
+from .paginators import CursorPaginator, MergedCursorPaginator
+
+
+def fans_out(author_id):
+    return UserStats.objects.filter(
+        user_id=author_id,
+        followers_count__lte=settings.TIMELINE_FANOUT_LIMIT).exists()
+
+
+def _insert(entries, batch_size=1000):
+    entries = iter(entries)
+    while True:
+        batch = list(islice(entries, batch_size))
+        if not batch:
+            break
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def push_posts(post_ids):
+    """Добавляет записи в ленты подписчиков их авторов. Авторы, чьи
+    записи не рассылаются, помечаются как недостающие в лентах.
+    Возвращает пользователей, в ленты которых что-то добавлено."""
+
+    limit = settings.TIMELINE_FANOUT_LIMIT
+    UserStats.objects.filter(
+        user__posts__in=post_ids, followers_count__gt=limit,
+        timelines_materialized=True,
+    ).update(timelines_materialized=False)
+    posts = Post.objects.filter(
+        pk__in=post_ids, author__stats__followers_count__lte=limit,
+    ).values_list('pk', 'author_id', 'pub_date')
+    users = set()
+    for post_id, author_id, pub_date in posts:
+        followers = list(Follow.objects.filter(
+            author_id=author_id).values_list('user_id', flat=True))
+        _insert(TimelineEntry(user_id=user_id, post_id=post_id,
+                              pub_date=pub_date) for user_id in followers)
+        users.update(followers)
+    return users
+
+
+def backfill(user_id, author_id):
+    """Копирует последние записи автора в ленту подписчика, если
+    подписка ещё есть."""
+
+    if not fans_out(author_id) or not Follow.objects.filter(
+            user_id=user_id, author_id=author_id).exists():
+        return False
+    posts = Post.objects.filter(author_id=author_id).order_by(
+        '-pub_date', '-id').values_list('id', 'pub_date')
+    _insert(
+        TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+        for post_id, pub_date in posts[:settings.TIMELINE_BACKFILL])
+    return True
+
+
+def returning(author_ids):
+    """Авторы из ``author_ids``, которые снова не больше чем
+    с TIMELINE_FANOUT_LIMIT подписчиками, но в лентах которых ещё
+    нет записей, вышедших до этого."""
+
+    return list(UserStats.objects.filter(
+        user_id__in=author_ids,
+        followers_count__lte=settings.TIMELINE_FANOUT_LIMIT,
+        timelines_materialized=False,
+    ).values_list('user_id', flat=True))
+
+
+def materialize(author_id):
+    """Копирует последние записи автора в ленты всех его подписчиков
+    и снимает пометку о недостающих записях. Возвращает подписчиков
+    или пустой список, если автор снова стал популярным."""
+
+    if not fans_out(author_id):
+        return []
+    followers = list(Follow.objects.filter(author_id=author_id).values_list(
+        'user_id', flat=True))
+    posts = list(Post.objects.filter(author_id=author_id).order_by(
+        '-pub_date', '-id').values_list(
+        'id', 'pub_date')[:settings.TIMELINE_BACKFILL])
+    _insert(
+        TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+        for user_id in followers for post_id, pub_date in posts)
+    # Записи, вышедшие после выборки, разошлёт push_posts: автор уже
+    # не популярен.
+    UserStats.objects.filter(
+        user_id=author_id,
+        followers_count__lte=settings.TIMELINE_FANOUT_LIMIT,
+    ).update(timelines_materialized=True)
+    return followers
+
+
+def prune(user_id, author_id):
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id).delete()
+
+
+def rebuild(batch_size=1000):
+    """Заново наполняет ленты всех пользователей по текущим подпискам."""
+
+    TimelineEntry.objects.all().delete()
+    limit = settings.TIMELINE_FANOUT_LIMIT
+    UserStats.objects.filter(followers_count__lte=limit).update(
+        timelines_materialized=True)
+    UserStats.objects.filter(followers_count__gt=limit).update(
+        timelines_materialized=False)
+    authors = UserStats.objects.filter(
+        followers_count__gt=0,
+        followers_count__lte=settings.TIMELINE_FANOUT_LIMIT,
+    ).values_list('user_id', flat=True)
+    for author_id in authors.iterator():
+        posts = list(Post.objects.filter(author_id=author_id).order_by(
+            '-pub_date', '-id').values_list(
+            'id', 'pub_date')[:settings.TIMELINE_BACKFILL])
+        followers = Follow.objects.filter(author_id=author_id).values_list(
+            'user_id', flat=True)
+        _insert((
+            TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+            for user_id in followers.iterator()
+            for post_id, pub_date in posts
+        ), batch_size)
+
+
+def follow_feed(user, per_page=10):
+    """Лента подписок: материализованная лента пользователя, слитая
+    с записями популярных авторов, которые не рассылаются по лентам,
+    и авторов, чьи записи ещё не разосланы заново."""
+
+    timeline = CursorPaginator(
+        TimelineEntry.objects.filter(user=user).select_related(
+            'post__author', 'post__group'),
+        per_page, keys=('pub_date', 'post_id'), transform=attrgetter('post'))
+    # Запрос идёт от подписок пользователя: статистика авторов читается
+    # по первичному ключу.
+    authors = list(Follow.objects.filter(
+        Q(author__stats__followers_count__gt=settings.TIMELINE_FANOUT_LIMIT)
+        | Q(author__stats__timelines_materialized=False),
+        user=user).values_list('author_id', flat=True))
+    if not authors:
+        return timeline
+    posts = CursorPaginator(
+        Post.objects.filter(author_id__in=authors).select_related(
+            'author', 'group'),
+        per_page)
+    return MergedCursorPaginator([timeline, posts], per_page)
@@ -0,0 +1,386 @@
+"""Потоковый перенос сообществ, записей, комментариев и подписок
+в NDJSON и CSV."""
+
+import csv
+import json
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils.dateparse import parse_datetime
+
+from . import authors, caching, counters, search, timelines
+from .bulk import batches
+from .models import Comment, Follow, Group, Post, User
+
+TYPES = ('group', 'post', 'comment', 'follow')
+FIELDS = ('type', 'id', 'slug', 'title', 'description', 'author', 'group',
+          'text', 'pub_date', 'updated', 'image', 'post', 'created', 'user')
+
+
+class InvalidRow(ValueError):
+    pass
+
+
+class IdConflict(ValueError):
+    """Идентификатор из выгрузки занят в базе другим объектом."""
+
+
+def _date(value):
+    return value.isoformat() if value else None
+
+
+def _datetime(value):
+    try:
+        return parse_datetime(value or '')
+    except ValueError:
+        return None
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def export_rows(types=TYPES, chunk_size=2000):
+    """Строки для выгрузки по возрастанию первичного ключа. Записи
+    читаются из базы порциями, а не целиком."""
+
+    if 'group' in types:
+        for group in Group.objects.order_by('pk').values(
+                'id', 'slug', 'title', 'description').iterator(chunk_size):
+            yield {'type': 'group', **group}
+    if 'post' in types:
+        posts = Post.objects.order_by('pk').values_list(
+            'id', 'author__username', 'group__slug', 'text', 'pub_date',
+            'updated', 'image')
+        for (post_id, author, group, text, pub_date, updated,
+             image) in posts.iterator(chunk_size):
+            yield {'type': 'post', 'id': post_id, 'author': author,
+                   'group': group, 'text': text, 'pub_date': _date(pub_date),
+                   'updated': _date(updated), 'image': image or None}
+    if 'comment' in types:
+        comments = Comment.objects.order_by('pk').values_list(
+            'id', 'post_id', 'author__username', 'text', 'created')
+        for (comment_id, post_id, author, text,
+             created) in comments.iterator(chunk_size):
+            yield {'type': 'comment', 'id': comment_id, 'post': post_id,
+                   'author': author, 'text': text, 'created': _date(created)}
+    if 'follow' in types:
+        follows = Follow.objects.order_by('pk').values_list(
+            'user__username', 'author__username')
+        for user, author in follows.iterator(chunk_size):
+            yield {'type': 'follow', 'user': user, 'author': author}
+
+
+def write_ndjson(rows, file):
+    for row in rows:
+        file.write(json.dumps(row, ensure_ascii=False) + '\n')
+        yield row
+
+
+def write_csv(rows, file):
+    writer = csv.DictWriter(file, FIELDS, extrasaction='ignore')
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        yield row
+
+
+def read_ndjson(file):
+    for line in file:
+        line = line.strip()
+        if not line:
+            yield None
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as error:
+            raise InvalidRow(f'не удалось разобрать JSON: {error}')
+
+
+def read_csv(file):
+    # Пустые ячейки CSV означают отсутствие значения.
+    for row in csv.DictReader(file, FIELDS):
+        if row['type'] == 'type':
+            yield None
+            continue
+        yield {key: value or None for key, value in row.items()}
+
+
+WRITERS = {'ndjson': write_ndjson, 'csv': write_csv}
+READERS = {'ndjson': read_ndjson, 'csv': read_csv}
+
+
+def detect_format(path, value=None):
+    if value:
+        return value
+    return 'csv' if path and path.endswith('.csv') else 'ndjson'
+
+
+class Importer:
+    """Копит строки и вставляет их bulk_create пачками.
+
+    Идентификаторы записей и комментариев сохраняются. Если объект
+    с тем же идентификатором уже есть в базе и совпадает с загружаемым
+    (например, повтор пачки после прерывания), строка пропускается;
+    если это другой объект, загрузка прерывается IdConflict: иначе
+    комментарии выгрузки попали бы к чужим записям. Сообщества
+    сливаются по адресу, авторы ищутся по именам через словари
+    в памяти; недостающие пользователи создаются без пароля.
+
+    Сигналы при массовой вставке не срабатывают, поэтому с ``update``
+    в той же транзакции, что и пачка, пересчитываются счётчики
+    затронутых записей и пользователей, загруженные записи
+    рассылаются по лентам подписчиков, новые подписки дописывают
+    ленты, а с ``index`` пачка попадает в поисковый индекс. После
+    фиксации сбрасывается кэш затронутых страниц. Без ``update``
+    всё это остаётся вызывающему, например полная перестройка.
+    """
+
+    def __init__(self, batch_size=1000, update=True, index=True):
+        self.batch_size = batch_size
+        self.update = update
+        self.index = index
+        self.users = {}
+        self.groups = {}
+        self.skipped_posts = set()
+        self.pending = {kind: [] for kind in TYPES}
+        self.imported = dict.fromkeys(TYPES, 0)
+        self.skipped = 0
+        self.present = 0
+
+    def __len__(self):
+        return sum(len(rows) for rows in self.pending.values())
+
+    def add(self, row):
+        kind = row.get('type') if isinstance(row, dict) else None
+        if kind not in self.pending:
+            raise InvalidRow(f'неизвестный тип строки: {kind!r}')
+        self.pending[kind].append(row)
+
+    def flush(self):
+        self.added = {kind: [] for kind in TYPES}
+        self.created_users = []
+        with transaction.atomic():
+            self._groups(self.pending['group'])
+            self._resolve_users()
+            self._posts(self.pending['post'])
+            self._comments(self.pending['comment'])
+            self._follows(self.pending['follow'])
+            changed = self._update() if self.update else None
+        if changed:
+            users, scopes = changed
+            if users:
+                authors.invalidate(*users)
+            if scopes:
+                caching.bump(*scopes)
+        self.pending = {kind: [] for kind in TYPES}
+
+    def _update(self):
+        """Обновляет производные данные загруженной пачки. Возвращает
+        пользователей, чьи счётчики изменились, и области кэша."""
+
+        post_ids = self.added['post']
+        comment_ids = self.added['comment']
+        follows = self.added['follow']
+        posts = set(Post.objects.filter(pk__in=post_ids).values_list(
+            'author_id', 'group_id'))
+        commented = set(Comment.objects.filter(
+            pk__in=comment_ids).values_list('post_id', flat=True))
+        users = {author_id for author_id, _ in posts}
+        users.update(self.created_users)
+        for user_id, author_id in follows:
+            users.update((user_id, author_id))
+
+        counters.recount_comments(self.batch_size, commented)
+        counters.recount_user_stats(self.batch_size, users)
+        readers = timelines.push_posts(post_ids)
+        for user_id, author_id in follows:
+            if timelines.backfill(user_id, author_id):
+                readers.add(user_id)
+        if self.index:
+            search.index_posts(post_ids)
+            search.index_comments(comment_ids)
+
+        scopes = {f'follow:{user_id}' for user_id in readers}
+        for author_id, group_id in posts:
+            scopes.update(caching.post_scopes(author_id, group_id))
+        for author_id, group_id in Post.objects.filter(
+                pk__in=commented).values_list('author_id', 'group_id'):
+            scopes.update(caching.post_scopes(author_id, group_id))
+        if self.added['group']:
+            scopes.add('groups')
+        return users, scopes
+
+    def finish(self):
+        """Сдвигает последовательности первичных ключей за импортированные
+        идентификаторы (нужно для PostgreSQL и Oracle)."""
+
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), [Group, Post, Comment])
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+
+    def _insert(self, model, objects, ignore_conflicts=False):
+        for batch in batches(objects, self.batch_size):
+            model.objects.bulk_create(batch,
+                                      ignore_conflicts=ignore_conflicts)
+
+    def _create(self, model, objects):
+        """Вставляет объекты и возвращает их идентификаторы. Не все базы
+        возвращают из bulk_create идентификаторы объектов, у которых их
+        не было; такие ищутся среди строк после прежней последней.
+        Попавшие туда одновременно вставленные строки только лишний
+        раз обновятся."""
+
+        last = model.objects.order_by('-pk').values_list(
+            'pk', flat=True).first() or 0
+        self._insert(model, objects)
+        pks = [obj.pk for obj in objects if obj.pk is not None]
+        if len(pks) < len(objects):
+            pks.extend(model.objects.filter(pk__gt=last).exclude(
+                pk__in=pks).values_list('pk', flat=True))
+        return pks
+
+    def _new(self, model, objects, fields):
+        """Объекты, которых ещё нет в базе. Объект с занятым
+        идентификатором, отличающийся полями ``fields``, — конфликт."""
+
+        by_pk, new = {}, []
+        for obj in objects:
+            if obj.pk is None:
+                new.append(obj)
+                continue
+            if obj.pk in by_pk:
+                raise IdConflict(
+                    f'{model._meta.verbose_name} {obj.pk} встречается '
+                    f'в выгрузке дважды')
+            by_pk[obj.pk] = obj
+        existing = model.objects.filter(pk__in=by_pk).values_list(
+            'pk', *fields)
+        for pk, *values in existing:
+            if values != [getattr(by_pk[pk], field) for field in fields]:
+                raise IdConflict(
+                    f'{model._meta.verbose_name} {pk} уже есть в базе '
+                    f'с другим содержимым; выгрузку можно загрузить только '
+                    f'в базу без таких идентификаторов')
+            del by_pk[pk]
+            self.present += 1
+        return new + list(by_pk.values())
+
+    def _resolve_users(self):
+        names = {
+            row[key] for kind, keys in (('post', ('author',)),
+                                        ('comment', ('author',)),
+                                        ('follow', ('user', 'author')))
+            for row in self.pending[kind] for key in keys if row.get(key)
+        } - self.users.keys()
+        if not names:
+            return
+        self.users.update(User.objects.filter(
+            username__in=names).values_list('username', 'pk'))
+        missing = names - self.users.keys()
+        if missing:
+            self._insert(User, (User(username=name, password='!')
+                                for name in missing), ignore_conflicts=True)
+            created = dict(User.objects.filter(
+                username__in=missing).values_list('username', 'pk'))
+            self.users.update(created)
+            self.created_users.extend(created.values())
+
+    def _groups(self, rows):
+        groups = {}
+        for row in rows:
+            if not row.get('slug') or not row.get('title'):
+                self.skipped += 1
+                continue
+            groups[row['slug']] = Group(
+                pk=_int(row.get('id')), slug=row['slug'], title=row['title'],
+                description=row.get('description') or '')
+        # Сообщество с тем же адресом уже есть: записи попадут в него.
+        existing = set(Group.objects.filter(slug__in=groups).values_list(
+            'slug', flat=True))
+        self.present += len(existing)
+        groups = [group for slug, group in groups.items()
+                  if slug not in existing]
+        # На сообщества ссылаются по адресу, поэтому занятый
+        # идентификатор просто не сохраняется.
+        taken = set(Group.objects.filter(pk__in={
+            group.pk for group in groups}).values_list('pk', flat=True))
+        for group in groups:
+            if group.pk in taken:
+                group.pk = None
+        self._insert(Group, groups)
+        self.added['group'] = groups
+        self.imported['group'] += len(groups)
+        slugs = {row['group'] for row in self.pending['post']
+                 if row.get('group')} - self.groups.keys()
+        if slugs:
+            self.groups.update(Group.objects.filter(
+                slug__in=slugs).values_list('slug', 'pk'))
+
+    def _posts(self, rows):
+        posts = []
+        for row in rows:
+            author_id = self.users.get(row.get('author'))
+            pub_date = _datetime(row.get('pub_date'))
+            post_id = _int(row.get('id'))
+            if not author_id or not row.get('text') or not pub_date:
+                self.skipped += 1
+                if post_id is not None:
+                    self.skipped_posts.add(post_id)
+                continue
+            posts.append(Post(
+                pk=post_id, text=row['text'], author_id=author_id,
+                group_id=self.groups.get(row.get('group')),
+                image=row.get('image') or '', pub_date=pub_date,
+                updated=_datetime(row.get('updated')) or pub_date,
+            ))
+        posts = self._new(Post, posts, ('author_id', 'pub_date', 'text'))
+        self.added['post'] = self._create(Post, posts)
+        self.imported['post'] += len(posts)
+
+    def _comments(self, rows):
+        post_ids = set(Post.objects.filter(pk__in={
+            _int(row.get('post')) for row in rows
+        } - {None} - self.skipped_posts).values_list('pk', flat=True))
+        comments = []
+        for row in rows:
+            author_id = self.users.get(row.get('author'))
+            created = _datetime(row.get('created'))
+            post_id = _int(row.get('post'))
+            comment_id = _int(row.get('id'))
+            if (not author_id or post_id not in post_ids
+                    or not row.get('text') or not created):
+                self.skipped += 1
+                continue
+            comments.append(Comment(
+                pk=comment_id, text=row['text'], post_id=post_id,
+                author_id=author_id, created=created))
+        comments = self._new(Comment, comments,
+                             ('post_id', 'author_id', 'created', 'text'))
+        self.added['comment'] = self._create(Comment, comments)
+        self.imported['comment'] += len(comments)
+
+    def _follows(self, rows):
+        pairs = set()
+        for row in rows:
+            user_id = self.users.get(row.get('user'))
+            author_id = self.users.get(row.get('author'))
+            if not user_id or not author_id or user_id == author_id:
+                self.skipped += 1
+                continue
+            pairs.add((user_id, author_id))
+        existing = set(Follow.objects.filter(
+            user_id__in={user_id for user_id, _ in pairs},
+            author_id__in={author_id for _, author_id in pairs},
+        ).values_list('user_id', 'author_id')) & pairs
+        self.present += len(existing)
+        self.added['follow'] = list(pairs - existing)
+        follows = [Follow(user_id=user_id, author_id=author_id)
+                   for user_id, author_id in self.added['follow']]
+        self._insert(Follow, follows)
+        self.imported['follow'] += len(follows)
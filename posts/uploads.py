@@ -0,0 +1,151 @@
+"""Потоковый приём изображений записей.
+
+Файл пишется во временный файл в каталоге хранилища, куда он попадёт,
+и хэшируется по мере приёма, чтобы ContentAddressedStorage не читал его
+ещё раз; слишком большие файлы отклоняются, не дочитывая запрос.
+"""
+
+import hashlib
+import io
+import os
+import tempfile
+from functools import wraps
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from PIL import Image
+
+from . import images
+
+# Сколько байт начала файла читать в поисках размеров изображения.
+HEADER_LIMIT = 1024 * 1024
+
+
+class HashedUploadedFile(UploadedFile):
+    """Временный файл загрузки с SHA-256 содержимого. Хранилище на
+    диске сохраняет его переименованием, без копирования."""
+
+    def __init__(self, directory, name, content_type, charset,
+                 content_type_extra=None):
+        file = tempfile.NamedTemporaryFile(suffix='.upload', dir=directory)
+        super().__init__(file, name, content_type, 0, charset,
+                         content_type_extra)
+        self.sha256 = None
+
+    def temporary_file_path(self):
+        return self.file.name
+
+    def close(self):
+        try:
+            return self.file.close()
+        except FileNotFoundError:
+            # Файл уже перенесён в хранилище.
+            pass
+
+
+class ImageUploadHandler(FileUploadHandler):
+    """Принимает файлы запроса не больше IMAGE_UPLOAD_MAX_BYTES и не
+    больше IMAGE_MAX_PIXELS пикселей по заголовку изображения."""
+
+    def __init__(self, request, field):
+        super().__init__(request)
+        self.field = field
+        self.upload = None
+        self.request_length = 0
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        self.request_length = content_length
+
+    def reject(self, error):
+        self.request._upload_error = error
+        if self.upload is not None:
+            self.upload.close()
+            self.upload = None
+        raise StopUpload(connection_reset=True)
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        limit = settings.IMAGE_UPLOAD_MAX_BYTES
+        # Поля формы без файлов не длиннее DATA_UPLOAD_MAX_MEMORY_SIZE.
+        if self.request_length > limit + (
+                settings.DATA_UPLOAD_MAX_MEMORY_SIZE or 0):
+            self.reject(self.too_large())
+        try:
+            directory = os.path.dirname(self.field.storage.path(
+                self.field.generate_filename(None, 'upload')))
+            os.makedirs(directory, exist_ok=True)
+        except NotImplementedError:
+            # Хранилище не на диске: файл всё равно придётся копировать.
+            directory = settings.FILE_UPLOAD_TEMP_DIR
+        self.upload = HashedUploadedFile(
+            directory, self.file_name, self.content_type, self.charset,
+            self.content_type_extra)
+        self.hash = hashlib.sha256()
+        self.head = b''
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.IMAGE_UPLOAD_MAX_BYTES:
+            self.reject(self.too_large())
+        if self.head is not None:
+            self.check_header(raw_data)
+        self.hash.update(raw_data)
+        self.upload.write(raw_data)
+
+    def check_header(self, raw_data):
+        self.head += raw_data
+        try:
+            image = Image.open(io.BytesIO(self.head))
+        except Image.DecompressionBombError:
+            self.reject(images.too_many_pixels())
+        except (OSError, SyntaxError):
+            # Заголовок ещё не получен целиком или это не изображение:
+            # формат проверит форма.
+            if len(self.head) >= HEADER_LIMIT:
+                self.head = None
+            return
+        self.head = None
+        width, height = image.size
+        if width * height > settings.IMAGE_MAX_PIXELS:
+            self.reject(images.too_many_pixels())
+
+    def file_complete(self, file_size):
+        file, self.upload = self.upload, None
+        file.seek(0)
+        file.size = file_size
+        file.sha256 = self.hash.hexdigest()
+        return file
+
+    @staticmethod
+    def too_large():
+        return ValidationError(
+            'Файл слишком большой: не больше %(limit)s байт.',
+            code='file_too_large',
+            params={'limit': settings.IMAGE_UPLOAD_MAX_BYTES})
+
+
+def streaming_images(field):
+    """Подключает к представлению ImageUploadHandler для поля модели
+    ``field``. Обработчики нужно заменить до чтения тела запроса,
+    поэтому CSRF проверяется уже после замены."""
+
+    def decorator(view):
+        protected = csrf_protect(view)
+
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            request.upload_handlers = [ImageUploadHandler(request, field)]
+            return protected(request, *args, **kwargs)
+
+        return csrf_exempt(wrapped)
+
+    return decorator
+
+
+def upload_error(request):
+    """Ошибка, с которой ImageUploadHandler прервал приём файла."""
+
+    return getattr(request, '_upload_error', None)
@@ -10,6 +10,8 @@ urlpatterns = [
          views.GroupDetailView.as_view(), name='group_posts'),
     path('new/', views.new_post, name='new_post'),
     path('follow/', views.follow_index, name='follow_index'),
+    path('follow/bulk/', views.follow_bulk, name='follow_bulk'),
+    path('search/', views.search, name='search'),
     path('<str:username>/follow/', views.profile_follow,
          name='profile_follow'),
     path('<str:username>/unfollow/', views.profile_unfollow,
@@ -20,6 +22,8 @@ urlpatterns = [
          views.post_edit, name='post_edit'),
     path('<str:username>/<int:post_id>/delete/',
          views.post_delete, name='post_delete'),
+    path('<str:username>/<int:post_id>/comments/',
+         views.comments, name='comments'),
     path('<str:username>/<int:post_id>/comment/',
          views.add_comment, name='add_comment'),
 ]
@@ -1,14 +1,66 @@
+import json
+import os
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
-from django.db.models import Count, Prefetch, Q
+from django.core.cache import cache
+from django.db import transaction
+from django.http import Http404, JsonResponse
+from django.utils.decorators import method_decorator
 from django.shortcuts import get_object_or_404, redirect, render
+from django.views.decorators.http import require_POST
 from django.views.generic.detail import DetailView
 from django.views.generic.list import ListView
 
+from . import authors, follows, thumbnails, uploads
+from .caching import anonymous_page, feed_cache
 from .forms import CommentForm, PostForm
-from .models import Comment, Follow, Group, Post, User
+from .models import Group, Post, User
+from .paginators import CursorPaginator
+from .search import search_paginator
+from .timelines import follow_feed
+
+post_images = uploads.streaming_images(Post._meta.get_field('image'))
+
+
+def author_scopes(author_id):
+    return (author_id is not None
+            and (f'author:{author_id}', 'groups', f'author_card:{author_id}')
+            or None)
+
+
+def index_scopes():
+    return 'posts', 'groups'
+
+
+def group_scopes(slug):
+    group_id = Group.objects.filter(slug=slug).values_list(
+        'pk', flat=True).first()
+    return group_id is not None and (f'group:{group_id}', 'groups') or None
+
+
+def profile_scopes(username):
+    return author_scopes(User.objects.filter(username=username).values_list(
+        'pk', flat=True).first())
+
+
+def post_scopes(username, post_id):
+    return author_scopes(Post.objects.filter(
+        pk=post_id, author__username=username).values_list(
+        'author_id', flat=True).first())
 
 
+def paginate(request, queryset, per_page=10):
+    return paginate_with(request, CursorPaginator(queryset, per_page))
+
+
+def paginate_with(request, paginator):
+    return paginator.get_page(cursor=request.GET.get('cursor'),
+                              page=request.GET.get('page'))
+
+
+@method_decorator(anonymous_page(index_scopes), name='dispatch')
 class IndexListView(ListView):
     model = Post
     template_name = 'index.html'
@@ -17,90 +69,99 @@ class IndexListView(ListView):
 
     # noinspection PyUnresolvedReferences
     def get_queryset(self):
-        return super().get_queryset().select_related(
-            'author', 'group').annotate(comments_count=Count('comments'))
+        return super().get_queryset().select_related('author', 'group')
+
+    def paginate_queryset(self, queryset, page_size):
+        page = paginate(self.request, queryset, page_size)
+        return page.paginator, page, page.object_list, page.has_other_pages()
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context.pop('paginator', None)
         context['page'] = context['page_obj']
+        context['feed_cache'] = feed_cache(self.request, context['page'],
+                                           'posts')
         return context
 
 
+@method_decorator(anonymous_page(group_scopes), name='dispatch')
 class GroupDetailView(DetailView):
     model = Group
     template_name = 'group.html'
     context_object_name = 'group'
 
-    # noinspection PyUnresolvedReferences
-    def get_queryset(self):
-        posts_queryset = Post.objects.select_related(
-            'author').annotate(comments_count=Count('comments'))
-        return super().get_queryset().prefetch_related(
-            Prefetch('posts', queryset=posts_queryset))
-
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        paginator = Paginator(context['group'].posts.all(), 10)
-        page_number = self.request.GET.get('page', 1)
-        context['page'] = paginator.get_page(page_number)
+        posts = context['group'].posts.select_related('author')
+        context['page'] = paginate(self.request, posts)
+        context['feed_cache'] = feed_cache(
+            self.request, context['page'], f'group:{context["group"].pk}')
         return context
 
 
 @login_required
+@post_images
 def new_post(request):
-    form = PostForm(request.POST or None, files=request.FILES or None)
+    form = PostForm(request.POST or None, files=request.FILES or None,
+                    upload_error=uploads.upload_error(request))
     if form.is_valid():
         obj = form.save(commit=False)
         obj.author = request.user
-        obj.save()
+        with transaction.atomic():
+            obj.save()
+            thumbnails.schedule(obj)
         return redirect('posts:index')
     return render(request, 'post_new.html', {'form': form})
 
 
 # noinspection PyUnresolvedReferences
+@anonymous_page(profile_scopes)
 def profile(request, username):
-    posts = Post.objects.select_related(
-        'author', 'group').annotate(
-        comments_count=Count('comments')).filter(
-        author__username=username)
-    user_queryset = User.objects.annotate(
-        follower_count=Count('follower'),
-        following_count=Count('following'),
-        subscribed=Count('following', filter=Q(
-            following__user=request.user if request.user.is_authenticated
-            else None)))
-    user = get_object_or_404(user_queryset, username=username)
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page', 1)
-    page_obj = paginator.get_page(page_number)
-    context = {'profile': user, 'page': page_obj}
+    user = get_object_or_404(User, username=username)
+    posts = Post.objects.select_related('author', 'group').filter(author=user)
+    page = paginate(request, posts)
+    context = {'profile': user, 'author_card': authors.card(request, user),
+               'page': page,
+               'feed_cache': feed_cache(request, page, f'author:{user.pk}',
+                                        'groups')}
     return render(request, 'profile.html', context)
 
 
+def comments_page(request, post):
+    comments = post.comments.select_related('author')
+    paginator = CursorPaginator(comments, settings.COMMENTS_PER_PAGE,
+                                keys=('created', 'id'), legacy_pages=0)
+    return paginate_with(request, paginator)
+
+
 # noinspection PyUnresolvedReferences
-def post_view(request, username, post_id):
-    comments_queryset = Comment.objects.select_related(
-        'author')
-    posts_queryset = Post.objects.select_related(
-        'author', 'group').prefetch_related(
-        Prefetch('comments', queryset=comments_queryset))
+def render_post(request, username, post_id, form):
+    posts_queryset = Post.objects.select_related('author', 'group')
     post = get_object_or_404(posts_queryset, pk=post_id,
                              author__username=username)
-    user = User.objects.annotate(
-        follower_count=Count('follower'),
-        following_count=Count('following'),
-        subscribed=Count('following', filter=Q(
-            following__user=request.user if request.user.is_authenticated
-            else None))).get(username=username)
-    form = CommentForm()
-    context = {'profile': user, 'post': post,
-               'form': form, 'comments': post.comments.all()}
+    context = {'profile': post.author,
+               'author_card': authors.card(request, post.author), 'post': post,
+               'form': form, 'comments': comments_page(request, post)}
     return render(request, 'post.html', context=context)
 
 
+@anonymous_page(post_scopes)
+def post_view(request, username, post_id):
+    return render_post(request, username, post_id, CommentForm())
+
+
+def comments(request, username, post_id):
+    posts_queryset = Post.objects.select_related('author').only(
+        'pk', 'author__username')
+    post = get_object_or_404(posts_queryset, pk=post_id,
+                             author__username=username)
+    return render(request, 'includes/comment_list.html',
+                  {'post': post, 'comments': comments_page(request, post)})
+
+
 # noinspection PyUnresolvedReferences
 @login_required
+@post_images
 def post_edit(request, username, post_id):
     posts_queryset = Post.objects.select_related('group')
     post = get_object_or_404(posts_queryset, pk=post_id,
@@ -108,9 +169,11 @@ def post_edit(request, username, post_id):
     if post.author != request.user:
         return redirect('posts:post', username=username, post_id=post_id)
     form = PostForm(request.POST or None, files=request.FILES or None,
-                    instance=post)
+                    instance=post, upload_error=uploads.upload_error(request))
     if form.is_valid():
-        form.save()
+        with transaction.atomic():
+            post = form.save()
+            thumbnails.schedule(post)
         return redirect('posts:post', username=username, post_id=post_id)
     return render(request, 'post_new.html', {'form': form,
                                              'post': post})
@@ -130,53 +193,80 @@ def post_delete(request, username, post_id):
 # noinspection PyUnresolvedReferences
 @login_required
 def add_comment(request, username, post_id):
-    posts_queryset = Post.objects.select_related(
-        'author', 'group').prefetch_related('comments')
-    post = get_object_or_404(posts_queryset, pk=post_id,
-                             author__username=username)
     form = CommentForm(request.POST or None)
     if form.is_valid():
+        # Для сохранения комментария нужен только ключ записи.
+        post = get_object_or_404(Post.objects.only('pk'), pk=post_id,
+                                 author__username=username)
         obj = form.save(commit=False)
         obj.author = request.user
         obj.post = post
-        obj.save()
+        with transaction.atomic():
+            obj.save()
         return redirect('posts:post', username=username, post_id=post_id)
-    context = {'profile': post.author, 'post': post,
-               'form': form, 'comments': post.comments.all()}
-    return render(request, 'post.html', context=context)
+    return render_post(request, username, post_id, form)
 
 
 # noinspection PyUnresolvedReferences
 @login_required
 def follow_index(request):
-    posts = Post.objects.filter(
-        author__following__user=request.user).select_related(
-        'author', 'group').annotate(comments_count=Count('comments'))
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page', 1)
-    page_obj = paginator.get_page(page_number)
-    context = {'page': page_obj, 'paginator': paginator}
+    page = paginate_with(request, follow_feed(request.user))
+    context = {'page': page,
+               'feed_cache': feed_cache(request, page, 'posts',
+                                        f'follow:{request.user.pk}')}
     return render(request, 'follow.html', context)
 
 
 # noinspection PyUnresolvedReferences
 @login_required
 def profile_follow(request, username):
-    author = get_object_or_404(User, username=username)
-    if request.user != author and not Follow.objects.filter(
-            user=request.user, author=author).exists():
-        Follow.objects.create(user=request.user, author=author)
+    if not follows.follow(request.user, [username]) and not (
+            User.objects.filter(username=username).exists()):
+        raise Http404
     return redirect(request.GET.get('next', 'posts:follow_index'))
 
 
+# noinspection PyUnresolvedReferences
 @login_required
 def profile_unfollow(request, username):
-    follow = get_object_or_404(Follow, user=request.user,
-                               author__username=username)
-    follow.delete()
+    follows.unfollow(request.user, [username])
     return redirect(request.GET.get('next', 'posts:follow_index'))
 
 
+def _usernames(data, key):
+    usernames = data.get(key, [])
+    if not isinstance(usernames, list) or not all(
+            isinstance(username, str) for username in usernames):
+        raise ValueError(f'«{key}» должен быть списком имён пользователей.')
+    return list(dict.fromkeys(usernames))
+
+
+# noinspection PyUnresolvedReferences
+@login_required
+@require_POST
+def follow_bulk(request):
+    """Подписывает и отписывает от многих авторов одним запросом:
+    ``{"follow": [...], "unfollow": [...]}``. Повторы ничего не меняют,
+    в ответе — сколько подписок действительно добавлено и удалено."""
+
+    try:
+        data = json.loads(request.body)
+        if not isinstance(data, dict):
+            raise ValueError('Ожидается объект JSON.')
+        followed = _usernames(data, 'follow')
+        unfollowed = _usernames(data, 'unfollow')
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    if len(followed) + len(unfollowed) > settings.FOLLOW_BULK_LIMIT:
+        return JsonResponse(
+            {'error': f'Не больше {settings.FOLLOW_BULK_LIMIT} авторов '
+                      f'за запрос.'}, status=400)
+    return JsonResponse({
+        'followed': len(follows.follow(request.user, followed)),
+        'unfollowed': len(follows.unfollow(request.user, unfollowed)),
+    })
+
+
 # noinspection PyUnusedLocal
 def page_not_found(request, exception):
     return render(
@@ -185,3 +275,19 @@ def page_not_found(request, exception):
 
 def server_error(request):
     return render(request, 'misc/500.html', status=500)
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    page = paginate_with(request, search_paginator(query)) if query else None
+    return render(request, 'search.html', {'query': query, 'page': page})
+
+
+@staff_member_required
+def cache_stats(request):
+    """Счётчики попаданий двухуровневого кэша в процессе, который
+    обработал запрос."""
+
+    stats = getattr(cache, 'stats', None)
+    return JsonResponse({'pid': os.getpid(),
+                         'prefixes': stats() if stats else {}})
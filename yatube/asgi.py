@@ -0,0 +1,20 @@
+"""
+ASGI config for yatube project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+
+Django 2.2 has no ASGI handler of its own: posts.asgi.ASGIHandler receives
+request bodies and sends responses on the event loop and runs the WSGI
+handler in a pool of ASGI_THREADS threads. Serve it with any ASGI 3 server,
+for example ``uvicorn yatube.asgi:application``.
+"""
+
+import os
+
+from django.core.wsgi import get_wsgi_application
+
+from posts.asgi import ASGIHandler
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+application = ASGIHandler(get_wsgi_application())
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -50,11 +51,12 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'sorl.thumbnail',
-    'debug_toolbar',
 ]
 
 MIDDLEWARE = [
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
+    'posts.middlewares.FileServingMiddleware',
+    'posts.middlewares.QueryProfilingMiddleware',
+    'posts.middlewares.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -65,6 +67,10 @@ MIDDLEWARE = [
     'posts.middlewares.AddContextAttrMiddleware'
 ]
 
+if DEBUG:
+    INSTALLED_APPS += ['debug_toolbar']
+    MIDDLEWARE.insert(0, 'debug_toolbar.middleware.DebugToolbarMiddleware')
+
 ROOT_URLCONF = 'yatube.urls'
 
 TEMPLATES = [
@@ -89,12 +95,77 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+# The profile is chosen by DB_ENGINE: 'sqlite' (default) or 'postgres'.
+# Connections are kept open for DB_CONN_MAX_AGE seconds. For PostgreSQL, with
+# DB_POOLER=pgbouncer (transaction pooling) server-side cursors are off,
+# since a cursor can't outlive the transaction on a pooled connection.
+# SQLite connections get SQLITE_PRAGMAS (WAL, synchronous=NORMAL, busy
+# timeout, mmap) from posts.signals when they are opened; an empty
+# SQLITE_PRAGMAS environment variable leaves the SQLite defaults (WAL mode
+# is stored in the database file and stays on once enabled).
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'yatube'),
+            'USER': os.environ.get('DB_USER', 'yatube'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+            'DISABLE_SERVER_SIDE_CURSORS':
+                os.environ.get('DB_POOLER') == 'pgbouncer',
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get(
+                'DB_NAME', os.path.join(BASE_DIR, 'db.sqlite3')),
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        }
     }
-}
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+} if os.environ.get('SQLITE_PRAGMAS', '1') else {}
+
+# Read replicas
+# DB_REPLICAS is a comma-separated list of replicas of the default database:
+# hosts for PostgreSQL, file paths for SQLite (kept in sync locally with
+# sync_replicas). GET requests to REPLICA_VIEWS read from one of them; any
+# request that writes sets the REPLICA_PIN_COOKIE cookie, and for
+# REPLICA_PIN_SECONDS that user reads from the primary, so their own
+# changes are visible while replicas catch up. Anonymous pages that miss
+# the page cache are rendered from the primary so they can be cached.
+
+REPLICA_DATABASES = []
+for index, replica in enumerate(
+        filter(None, os.environ.get('DB_REPLICAS', '').split(',')), 1):
+    alias = f'replica_{index}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST' if DB_ENGINE == 'postgres' else 'NAME': replica.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ['posts.routers.ReplicaRouter']
+REPLICA_VIEWS = (
+    'posts:index',
+    'posts:group_posts',
+    'posts:profile',
+    'posts:follow_index',
+)
+REPLICA_PIN_COOKIE = 'primary_pin'
+REPLICA_PIN_SECONDS = 10
 
 
 # Password validation
@@ -123,6 +194,35 @@ LOGIN_REDIRECT_URL = 'posts:index'
 # LOGOUT_REDIRECT_URL = 'posts:index'
 
 
+# Pagination
+# Feeds are paginated by cursor; plain ?page=N links keep working
+# for the first PAGINATOR_LEGACY_PAGES pages.
+
+PAGINATOR_LEGACY_PAGES = 10
+
+# Comments under a post are shown COMMENTS_PER_PAGE at a time, newest first;
+# the next batch is loaded by cursor from posts:comments.
+
+COMMENTS_PER_PAGE = 20
+
+
+# Follow feed
+# New posts are pushed into followers' timelines unless the author has more
+# than TIMELINE_FANOUT_LIMIT followers; posts of such authors are merged
+# into the feed on read. Following an author copies up to TIMELINE_BACKFILL
+# of their latest posts into the follower's timeline; when an author drops
+# back to the limit, a background task copies them into all followers'
+# timelines, and until then the feed keeps merging the author's posts.
+
+TIMELINE_FANOUT_LIMIT = 1000
+TIMELINE_BACKFILL = 100
+
+# posts:follow_bulk follows and unfollows at most FOLLOW_BULK_LIMIT authors
+# per request.
+
+FOLLOW_BULK_LIMIT = 100
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/2.2/topics/i18n/
 
@@ -142,18 +242,158 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
+STATICFILES_STORAGE = 'posts.storage.CompressedManifestStaticFilesStorage'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# posts.middlewares.FileServingMiddleware serves both from the application.
+# Names with a content hash (collectstatic copies, post images and their
+# variants) are cached for a year; others for STATIC_MAX_AGE and
+# MEDIA_MAX_AGE seconds. collectstatic also writes .gz (and, with the
+# brotli package installed, .br) copies served to clients that accept them.
+
+STATIC_MAX_AGE = 60
+MEDIA_MAX_AGE = 60 * 60 * 24
+
 EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
+# Two-tier cache: posts.cache_backends.TieredCache keeps up to
+# LOCAL_MAX_ENTRIES versioned entries (template fragments and post cards,
+# whose keys change with the data) in process memory for LOCAL_TIMEOUT
+# seconds, in front of the 'shared' cache that all worker processes use.
+# Other keys, such as cache generations, are only stored in the shared
+# cache. The shared backend is file-based by default; CACHE_BACKEND and
+# CACHE_LOCATION switch it, e.g. to django_redis.cache.RedisCache and
+# redis://127.0.0.1:6379/1 (Redis also makes generation bumps atomic).
+# Per-prefix hit and miss counters of the current process are served at
+# /admin/cache-stats/.
+
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': 'posts.cache_backends.TieredCache',
+        'LOCATION': 'tiered',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'LOCAL_MAX_ENTRIES': 2000,
+            'LOCAL_TIMEOUT': 300,
+            'LOCAL_KEY_PREFIXES': ('template.cache.', 'post_card:'),
+        },
+    },
+    'shared': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.environ.get(
+            'CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'yatube_cache')),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
+}
+
+# Feed fragments are invalidated explicitly through generation keys
+# (see posts.caching), so they can live long.
+FEED_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Rendered post cards are keyed by post id, update time and comment count.
+POST_CARD_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+# Whole pages served to anonymous visitors (index, group, profile, post) are
+# keyed by path and the cache generations they depend on.
+PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Author sidebar counters are dropped on post and follow changes; the
+# timeout only bounds drift fixed by recount_counters.
+AUTHOR_CARD_CACHE_TIMEOUT = 60 * 60
+
+
+# ASGI
+# yatube.asgi runs views in a pool of ASGI_THREADS threads; request bodies
+# and responses are transferred on the event loop, so slow clients do not
+# hold a thread. Bodies longer than IMAGE_UPLOAD_MAX_BYTES plus
+# DATA_UPLOAD_MAX_MEMORY_SIZE get 413 as soon as the declared or received
+# length exceeds it.
+
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', 8))
+
+
+# Background tasks
+# Side effects of writes (follow feed fan-out, search indexing, image
+# variants, notification emails) are queued in the database by posts.queue
+# once the write commits and run by `manage.py run_tasks` in TASK_WORKERS
+# processes, up to TASK_BATCH_SIZE tasks of one kind at a time. A failed
+# task is retried after TASK_RETRY_DELAY seconds, doubling each time, up to
+# TASK_MAX_ATTEMPTS attempts; tasks of a worker that died are picked up
+# again after TASK_LEASE seconds. With TASK_WORKERS = 0 tasks run inline.
+
+TASK_WORKERS = int(os.environ.get('TASK_WORKERS', 2))
+TASK_BATCH_SIZE = 100
+TASK_MAX_ATTEMPTS = 5
+TASK_RETRY_DELAY = 10
+TASK_LEASE = 5 * 60
+TASK_POLL_INTERVAL = 1
+
+
+# Thumbnails
+# Variants missing when a post is rendered (e.g. for imported posts) are
+# generated by a pool of THUMBNAIL_WORKERS threads; with 0 they are
+# generated inline. Saved posts get theirs through the task queue.
+
+THUMBNAIL_WORKERS = 2
+
+# Uploads over IMAGE_MAX_PIXELS are rejected; the rest are stripped of EXIF
+# and downscaled to IMAGE_MAX_SIZE on the longest side. Cards are served
+# from IMAGE_VARIANT_WIDTHS wide JPEG (and WebP, when Pillow supports it)
+# crops stored next to the original.
+
+IMAGE_MAX_PIXELS = 40 * 1000 * 1000
+IMAGE_MAX_SIZE = 2560
+IMAGE_VARIANT_WIDTHS = (320, 640, 960)
+
+# Image uploads are streamed to a temporary file next to their final place
+# in MEDIA_ROOT and stored under the SHA-256 of their content, so a repeated
+# upload reuses the stored file. Files over IMAGE_UPLOAD_MAX_BYTES, or
+# whose header reports more than IMAGE_MAX_PIXELS, are rejected as soon as
+# this is known, without reading the rest of the request.
+
+IMAGE_UPLOAD_MAX_BYTES = 20 * 1024 * 1024
+
+# collect_media deletes images no post refers to, with their variants and
+# sorl thumbnails, once they are older than MEDIA_GC_GRACE_SECONDS: a fresh
+# file may belong to a post that is still being saved.
+
+MEDIA_GC_GRACE_SECONDS = 60 * 60
+
+
+# Query profiling
+# QueryProfilingMiddleware profiles a QUERY_PROFILING_SAMPLE_RATE share of
+# requests and logs the query count, SQL and template time and the
+# QUERY_PROFILING_SLOWEST slowest statements under the view name. Views
+# exceeding their QUERY_BUDGETS entry are logged as warnings, or raise
+# QueryBudgetExceeded when QUERY_BUDGETS_RAISE is set.
+
+QUERY_PROFILING_SAMPLE_RATE = 0.01
+QUERY_PROFILING_SLOWEST = 3
+QUERY_BUDGETS = {
+    'posts:index': 4,
+    'posts:group_posts': 5,
+    'posts:search': 4,
+    'posts:follow_index': 6,
+    'posts:profile': 6,
+    'posts:post': 6,
+    'posts:comments': 4,
+    'posts:new_post': 4,
+    'posts:post_edit': 6,
+    'posts:post_delete': 10,
+    'posts:add_comment': 6,
+    'posts:profile_follow': 12,
+    'posts:profile_unfollow': 9,
+    'posts:follow_bulk': 12,
 }
+QUERY_BUDGETS_RAISE = False
 
 # LOGGING = {
 #     'version': 1,
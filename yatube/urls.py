@@ -4,6 +4,8 @@ from django.conf.urls import handler404, handler500
 from django.contrib import admin
 from django.urls import include, path
 
+from posts.views import cache_stats
+
 
 # noinspection PyRedeclaration
 handler404 = 'posts.views.page_not_found'  # noqa
@@ -13,6 +15,7 @@ handler500 = 'posts.views.server_error'  # noqa
 urlpatterns = [
     path('auth/', include('users.urls')),
     path('auth/', include('django.contrib.auth.urls')),
+    path('admin/cache-stats/', cache_stats, name='cache_stats'),
     path('admin/', admin.site.urls),
     path('', include('posts.urls')),
     path('about/', include('about.urls', namespace='about')),